@@ -1,10 +1,12 @@
+import click
 from flask import Flask, render_template
 from flask_cors import CORS
 from pymongo import MongoClient
 from dotenv import load_dotenv
 import os
+import sys
+from datetime import datetime
 from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime, timedelta, timezone
 
 # --- Load environment variables ---
 load_dotenv()
@@ -38,36 +40,22 @@ app.register_blueprint(admin_bp)
 app.register_blueprint(performance_bp)
 app.register_blueprint(stats_bp)
 
-# --- Scheduler function ---
-def mark_timeout_attempts():
-    """
-    Mark all attempts as timed out if they started more than 1 hour ago
-    and are not completed, failed, aborted, or timed out yet.
-    """
-    one_hour_ago = datetime.now(timezone.utc) - timedelta(hours=1)
-
-    attempts = app.db.attempts.find({
-        "completed": 0,
-        "failed": 0,
-        "aborted": 0,
-        "timeout": 0,
-        "start_time": {"$lt": one_hour_ago}
-    })
-
-    for attempt in attempts:
-        app.db.attempts.update_one(
-            {"_id": attempt["_id"]},
-            {"$set": {
-                "timeout": 1,
-                "end_time": attempt["start_time"] + timedelta(hours=1),
-                "time_spent": 3600
-            }}
-        )
-
 # --- Start scheduler ---
+from controllers.attemptController import mark_timeout_attempts
+from services.stats_snapshots import refresh_stats_snapshots
+from services.leaderboard import prune_expired_windows
+import config
+
 scheduler = BackgroundScheduler()
 scheduler.add_job(func=mark_timeout_attempts, trigger="interval", minutes=5)
-scheduler.start()
+scheduler.add_job(func=refresh_stats_snapshots, trigger="interval",
+                  minutes=config.STATS_SNAPSHOT_INTERVAL, next_run_time=datetime.now())
+scheduler.add_job(func=prune_expired_windows, trigger="interval", hours=1)
+
+# Pas de scheduler pour les commandes `flask <commande>` (hors `flask run`) :
+# la commande importe app.py mais ne sert pas de requêtes
+if os.environ.get("FLASK_RUN_FROM_CLI") != "true" or "run" in sys.argv[1:]:
+    scheduler.start()
 
 # --- Flask CLI command to create admin ---
 @app.cli.command("create-admin")
@@ -85,6 +73,83 @@ def create_admin():
     app.db.admins.insert_one(admin_doc)
     print("✅ Admin créé avec succès")
 
+# --- Flask CLI command to seed attempt counters ---
+@app.cli.command("backfill-attempt-counters")
+def backfill_attempt_counters_command():
+    from controllers.attemptController import backfill_attempt_counters
+
+    seeded = backfill_attempt_counters()
+    print(f"✅ {seeded} compteurs de tentatives initialisés")
+
+# --- Flask CLI command to copy quiz grade/subject/chapter onto attempts ---
+@app.cli.command("backfill-attempt-quiz-fields")
+@click.option("--batch-size", default=500, show_default=True)
+def backfill_attempt_quiz_fields_command(batch_size):
+    from services.quiz_fields import backfill_attempt_quiz_fields
+
+    stamped = backfill_attempt_quiz_fields(batch_size=batch_size)
+    print(f"✅ {stamped} tentatives mises à jour (grade / subject / chapter)")
+
+# --- Flask CLI command to recompute scores in batches ---
+@app.cli.command("recalculate-scores")
+@click.option("--batch-size", default=500, show_default=True)
+@click.option("--resume", is_flag=True, help="Reprendre au dernier checkpoint")
+@click.option("--no-rebuild", is_flag=True,
+              help="Ne pas reconstruire kid_daily_stats et le classement à la fin ; "
+                   "lancer ensuite `flask rebuild-kid-daily-stats` et `flask rebuild-leaderboard`")
+def recalculate_scores_command(batch_size, resume, no_rebuild):
+    """Recalcule les scores ; les agrégats qui en dépendent sont reconstruits à la fin."""
+    from services.score_recalculation import recalculate_scores
+
+    report = recalculate_scores(batch_size=batch_size, resume=resume, rebuild=not no_rebuild)
+    print(f"✅ {report['processed']} tentatives recalculées "
+          f"({report['docs_per_second']} docs/s, {report['elapsed_seconds']} s)")
+    if report["rollups_rebuilt"]:
+        print("✅ kid_daily_stats et classement reconstruits")
+
+# --- Flask CLI command to create indexes and check query plans ---
+@app.cli.command("ensure-indexes")
+def ensure_indexes_command():
+    from services.indexes import ensure_indexes, verify_query_plans
+
+    for collection, names in ensure_indexes().items():
+        print(f"{collection}: {', '.join(names)}")
+
+    failures = 0
+    for name, stages, ok in verify_query_plans():
+        print(f"{'✅' if ok else '❌'} {name}: {' > '.join(stages)}")
+        failures += not ok
+
+    if failures:
+        raise SystemExit(f"{failures} forme(s) de requête sans index adapté")
+
+# --- Flask CLI command to rebuild kid daily rollups ---
+@app.cli.command("rebuild-kid-daily-stats")
+def rebuild_kid_daily_stats_command():
+    from services.kid_rollups import rebuild_kid_daily_stats
+
+    groups = rebuild_kid_daily_stats()
+    print(f"✅ kid_daily_stats reconstruit ({groups} groupes)")
+
+# --- Flask CLI command to refresh the admin stats snapshots ---
+@app.cli.command("refresh-stats-snapshots")
+@click.option("--full", is_flag=True, help="Recalculer tous les jours")
+def refresh_stats_snapshots_command(full):
+    report = refresh_stats_snapshots(full=full)
+    if report["skipped"]:
+        print("⚠️ stats_snapshots : un rafraîchissement est déjà en cours, réessayez plus tard")
+        return
+    print(f"✅ stats_snapshots : {report['days']} jour(s) recalculé(s) en {report['elapsed_ms']} ms")
+
+# --- Flask CLI command to rebuild the leaderboard ---
+@app.cli.command("rebuild-leaderboard")
+def rebuild_leaderboard_command():
+    from services.kid_rollups import TERMINAL_QUERY
+    from services.leaderboard import rebuild_leaderboard
+
+    entries = rebuild_leaderboard(TERMINAL_QUERY)
+    print(f"✅ Classement reconstruit ({entries} entrées)")
+
 # --- Routes ---
 @app.route("/")
 def home():
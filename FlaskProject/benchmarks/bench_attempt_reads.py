@@ -0,0 +1,155 @@
+# bench_attempt_reads.py
+"""
+Benchmark des lectures de tentatives des statistiques, pour des requêtes de
+100, 1000 et 5000 tentatives (20 réponses de 2 essais chacune) :
+
+- hydraté : AttemptData.objects(...) puis to_mongo().to_dict(), l'ancien
+  chemin (answers hydratées en Answer / QuestionAttempt) ;
+- projeté : find_attempts (services/attempt_repository.py), documents bruts
+  as_pymongo limités à ANALYTICS_FIELDS, answers jamais transférées.
+
+Mêmes valeurs sur ANALYTICS_FIELDS (vérifié à chaque taille). Pour chaque
+requête : latence médiane sur BENCH_REPEAT exécutions, temps CPU du
+processus, pic d'allocations (tracemalloc) et octets reçus de MongoDB
+(CommandListener pymongo).
+
+Nécessite un MongoDB (MONGO_URI) ; les tentatives sont écrites dans une base
+dédiée (BENCH_DB_NAME, "bench_attempt_reads" par défaut), vidée à chaque taille.
+
+    cd FlaskProject && python -m benchmarks.bench_attempt_reads
+"""
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DB_NAME"] = os.getenv("BENCH_DB_NAME", "bench_attempt_reads")
+
+import bson
+from pymongo import monitoring
+
+REQUEST_SIZES = (100, 1_000, 5_000)
+ANSWERS = 20
+TRIES = 2
+REPEAT = int(os.getenv("BENCH_REPEAT", 5))
+
+
+class WireCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.received = 0
+
+    def reset(self):
+        self.received = 0
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.received += len(bson.encode(event.reply))
+
+    def failed(self, event):
+        pass
+
+
+# Enregistré avant la connexion ouverte par l'import des modèles
+wire = WireCounter()
+monitoring.register(wire)
+
+from bson import ObjectId  # noqa: E402
+from models.attempt import AttemptData  # noqa: E402
+from services.attempt_repository import ANALYTICS_FIELDS, find_attempts  # noqa: E402
+
+
+def hydrated_read(**query):
+    """Ancien chemin : documents complets hydratés puis reconvertis en dict."""
+    return [a.to_mongo().to_dict() for a in AttemptData.objects(**query)]
+
+
+def projected_read(**query):
+    return find_attempts(**query)
+
+
+def synthetic_attempt(index, start):
+    started = start + timedelta(minutes=index)
+    answers = [
+        {
+            "attempts": [
+                {"is_correct": t == TRIES - 1, "is_wrong": t < TRIES - 1, "hint_used": 0,
+                 "start_time": started, "end_time": started + timedelta(seconds=5), "duration": 5}
+                for t in range(TRIES)
+            ],
+            "correct_answer": 1, "wrong_answer": TRIES - 1, "hint_used": 0, "attempts_count": TRIES,
+            "start_time": started, "end_time": started + timedelta(seconds=5 * TRIES), "duration": 5 * TRIES,
+        }
+        for _ in range(ANSWERS)
+    ]
+    return {
+        "userID": "bench", "kidIndex": "0", "quizID": ObjectId(),
+        "grade": "1", "subject": "math", "chapter": "bench",
+        "start_time": started, "end_time": started + timedelta(seconds=5 * TRIES * ANSWERS),
+        "duration": 5 * TRIES * ANSWERS, "answers": answers,
+        "attempts_count": 1, "answered_questions": ANSWERS, "success_rate": 1 / TRIES,
+        "score": (index % 101) / 100, "completed": 1, "failed": 0, "aborted": 0, "timeout": 0,
+        "__v": 1, "createdAt": started, "updatedAt": started,
+    }
+
+
+def seed(size):
+    AttemptData.drop_collection()
+    AttemptData.ensure_indexes()
+    start = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=3)
+    collection = AttemptData._get_collection()
+    for offset in range(0, size, 1000):
+        collection.insert_many(synthetic_attempt(i, start) for i in range(offset, min(offset + 1000, size)))
+    return {"userID": "bench", "kidIndex": "0", "start_time__gte": start}
+
+
+def analytics_view(attempts):
+    return sorted(
+        (str(a["_id"]), *(a.get(field) for field in ANALYTICS_FIELDS)) for a in attempts
+    )
+
+
+def measure(read, query):
+    latencies, cpu, received = [], [], []
+    for _ in range(REPEAT):
+        wire.reset()
+        started, started_cpu = time.perf_counter(), time.process_time()
+        read(**query)
+        latencies.append((time.perf_counter() - started) * 1000)
+        cpu.append((time.process_time() - started_cpu) * 1000)
+        received.append(wire.received)
+
+    tracemalloc.start()
+    try:
+        read(**query)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "p50_ms": statistics.median(latencies),
+        "cpu_ms": statistics.median(cpu),
+        "peak_kib": peak / 1024,
+        "received_kib": statistics.mean(received) / 1024,
+    }
+
+
+def main():
+    print(f"{'tentatives':>10} {'chemin':>9} {'p50 ms':>9} {'CPU ms':>9} {'pic Kio':>9} {'reçus Kio':>10}")
+    for size in REQUEST_SIZES:
+        query = seed(size)
+        if analytics_view(hydrated_read(**query)) != analytics_view(projected_read(**query)):
+            raise AssertionError(f"résultats différents pour {size} tentatives")
+
+        for name, read in (("hydraté", hydrated_read), ("projeté", projected_read)):
+            r = measure(read, query)
+            print(f"{size:>10} {name:>9} {r['p50_ms']:>9.1f} {r['cpu_ms']:>9.1f} {r['peak_kib']:>9.0f} "
+                  f"{r['received_kib']:>10.0f}")
+    AttemptData.drop_collection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# bench_attempt_updates.py
+"""
+Benchmark du chemin d'écriture des événements de question : latence et octets
+échangés avec MongoDB par événement, pour des quiz de 5, 20 et 50 questions.
+
+Compare l'ancien chemin (chargement du document complet, mutation, save())
+à update_attempt (lecture projetée + $set/$push ciblés sur answers.<i>).
+Les octets sont mesurés par un CommandListener pymongo : taille BSON des
+commandes envoyées et des réponses reçues.
+
+Nécessite un MongoDB (MONGO_URI) ; les tentatives sont écrites dans une base
+dédiée (BENCH_DB_NAME, "bench_attempt_updates" par défaut), vidée à chaque mesure.
+
+    cd FlaskProject && python -m benchmarks.bench_attempt_updates
+"""
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DB_NAME"] = os.getenv("BENCH_DB_NAME", "bench_attempt_updates")
+
+import bson
+from pymongo import monitoring
+
+QUIZ_SIZES = (5, 20, 50)
+REPEAT = int(os.getenv("BENCH_REPEAT", 20))
+
+
+class WireCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+
+    def reset(self):
+        self.sent = self.received = 0
+
+    def started(self, event):
+        self.sent += len(bson.encode(event.command))
+
+    def succeeded(self, event):
+        self.received += len(bson.encode(event.reply))
+
+    def failed(self, event):
+        pass
+
+
+# Enregistré avant la connexion ouverte par l'import des modèles
+wire = WireCounter()
+monitoring.register(wire)
+
+from bson import ObjectId  # noqa: E402
+from models.attempt import AttemptData, QuestionAttempt  # noqa: E402
+from controllers.attemptController import calculate_score, update_attempt  # noqa: E402
+
+
+def legacy_event(data):
+    """Ancien update_attempt : document complet chargé, modifié puis save()."""
+    attempt = AttemptData.objects(id=ObjectId(data["attempt_id"])).first()
+    now = datetime.now(timezone.utc)
+    answer = attempt.answers[data["question_index"]]
+
+    if data.get("is_starting"):
+        answer.start_time = now
+        answer.attempts.append(QuestionAttempt(start_time=now))
+    else:
+        qa = answer.attempts[-1]
+        qa.end_time = now
+        qa.is_correct = data.get("is_correct", 0)
+        qa.is_wrong = data.get("is_wrong", 0)
+        qa.hint_used = data.get("hint_used", 0)
+        qa.duration = data.get("duration", 0)
+
+        answer.end_time = now
+        answer.attempts_count = len(answer.attempts)
+        answer.correct_answer = sum(a.is_correct for a in answer.attempts)
+        answer.wrong_answer = sum(a.is_wrong for a in answer.attempts)
+        answer.hint_used = sum(a.hint_used for a in answer.attempts)
+        answer.duration = sum(a.duration for a in answer.attempts)
+
+    attempt.duration = sum(ans.duration for ans in attempt.answers)
+    attempt.score, attempt.success_rate = calculate_score(attempt.answers, attempt.attempts_count)
+    attempt.answered_questions = sum(ans.correct_answer for ans in attempt.answers)
+    attempt.save()
+
+
+def targeted_event(data):
+    response, status = update_attempt(data)
+    if status != 200:
+        raise RuntimeError(response)
+
+
+def quiz_events(attempt_id, num_questions):
+    """Début + bonne réponse par question, sans la dernière réponse (qui déclenche les agrégats)."""
+    for index in range(num_questions):
+        yield {"attempt_id": attempt_id, "question_index": index, "is_starting": True}
+        if index < num_questions - 1:
+            yield {"attempt_id": attempt_id, "question_index": index, "is_correct": 1, "duration": 5}
+
+
+def new_attempt(num_questions):
+    now = datetime.now(timezone.utc)
+    attempt = AttemptData(userID="bench", kidIndex="0", quizID=ObjectId(), attempts_count=1,
+                          start_time=now, createdAt=now, updatedAt=now)
+    attempt.init_answers(num_questions)
+    attempt.save()
+    return str(attempt.id)
+
+
+def measure(apply_event, num_questions):
+    AttemptData.drop_collection()
+    latencies, sent, received = [], [], []
+    for _ in range(REPEAT):
+        attempt_id = new_attempt(num_questions)
+        for event in quiz_events(attempt_id, num_questions):
+            wire.reset()
+            started = time.perf_counter()
+            apply_event(event)
+            latencies.append((time.perf_counter() - started) * 1000)
+            sent.append(wire.sent)
+            received.append(wire.received)
+    return {
+        "events": len(latencies),
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": statistics.quantiles(latencies, n=20)[-1],
+        "sent_bytes": statistics.mean(sent),
+        "received_bytes": statistics.mean(received),
+    }
+
+
+def main():
+    print(f"{'questions':>9} {'chemin':>10} {'événements':>10} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'envoyés/évt':>12} {'reçus/évt':>10}")
+    for num_questions in QUIZ_SIZES:
+        for name, apply_event in (("save()", legacy_event), ("ciblé", targeted_event)):
+            r = measure(apply_event, num_questions)
+            print(f"{num_questions:>9} {name:>10} {r['events']:>10} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+                  f"{r['sent_bytes']:>12.0f} {r['received_bytes']:>10.0f}")
+    AttemptData.drop_collection()
+
+
+if __name__ == "__main__":
+    main()
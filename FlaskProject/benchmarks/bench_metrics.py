@@ -0,0 +1,173 @@
+# bench_metrics.py
+"""
+Benchmark des métriques enfant sur des historiques synthétiques de 1k, 10k et
+100k tentatives :
+
+- listes : les fonctions d'avant MetricsAccumulator (legacy_metrics.py), une
+  passe par métrique et un tri pour la persévérance ;
+- accumulateur : MetricsAccumulator.metrics(), un seul parcours, mêmes
+  résultats (vérifié à chaque taille) ;
+- kid_daily_stats : metrics_from_aggregate sur les agrégats équivalents (un
+  document par jour et par matière), dont le coût dépend du nombre de
+  jours x matières et non du nombre de tentatives.
+
+Pour chaque calcul : meilleur temps sur BENCH_REPEAT exécutions et pic
+d'allocations mesuré par tracemalloc.
+
+Sans MongoDB (documents construits en mémoire).
+
+    cd FlaskProject && python -m benchmarks.bench_metrics
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+
+from benchmarks import legacy_metrics
+from controllers.performanceController import (
+    MetricsAccumulator, calculate_balance_score, metrics_from_aggregate, recommend_subject
+)
+from services.kid_rollups import rollups_to_aggregate
+
+HISTORY_SIZES = (1_000, 10_000, 100_000)
+QUIZ_COUNT = 200
+DAYS = 365
+REPEAT = int(os.getenv("BENCH_REPEAT", 5))
+
+
+def synthetic_quizzes(rng):
+    return {
+        str(ObjectId()): {
+            "grade": str(rng.randint(1, 6)),
+            "subject": rng.choice(("math", "arabic", "french", "science")),
+            "chapter": f"chapter-{rng.randint(1, 8)}",
+        }
+        for _ in range(QUIZ_COUNT)
+    }
+
+
+def synthetic_attempts(rng, quiz_ids, size):
+    """Tentatives brutes (mêmes champs que ANALYTICS_FIELDS), triées par start_time."""
+    start = datetime(2025, 1, 1)
+    attempts = []
+    for offset in sorted(rng.randrange(DAYS * 86400) for _ in range(size)):
+        outcome = rng.random()
+        attempts.append({
+            "userID": "bench",
+            "kidIndex": "0",
+            "quizID": ObjectId(rng.choice(quiz_ids)),
+            "start_time": start + timedelta(seconds=offset),
+            "duration": rng.randint(10, 600),
+            "score": round(rng.random(), 3),
+            "completed": 1 if outcome < 0.7 else 0,
+            "failed": 1 if 0.7 <= outcome < 0.85 else 0,
+            "aborted": 1 if 0.85 <= outcome < 0.95 else 0,
+            "timeout": 1 if outcome >= 0.95 else 0,
+            "abandoned": 1 if 0.85 <= outcome < 0.95 else 0,
+        })
+    return attempts
+
+
+def synthetic_rollups(attempts, quizzes_dict):
+    """Documents kid_daily_stats correspondant aux tentatives (jour x matière)."""
+    rollups = {}
+    for a in attempts:
+        quiz_id = str(a["quizID"])
+        day = datetime(a["start_time"].year, a["start_time"].month, a["start_time"].day)
+        subject = quizzes_dict[quiz_id]["subject"]
+        doc = rollups.setdefault((day, subject), {
+            "day": day, "subject": subject, "count": 0, "completed": 0, "failed": 0, "aborted": 0,
+            "timeout": 0, "score_sum": 0.0, "duration": 0, "retries": 0, "improved": 0, "quizzes": {},
+        })
+        for field in ("completed", "failed", "aborted", "timeout"):
+            doc[field] += a[field]
+        doc["count"] += 1
+        doc["score_sum"] += a["score"]
+        doc["duration"] += 0 if a["timeout"] else a["duration"]
+        quiz = doc["quizzes"].setdefault(quiz_id, {"count": 0, "completed": 0, "failed": 0, "score_sum": 0.0})
+        quiz["count"] += 1
+        quiz["completed"] += a["completed"]
+        quiz["failed"] += a["failed"]
+        quiz["score_sum"] += a["score"]
+    return list(rollups.values())
+
+
+def legacy_all_metrics(attempts, quizzes_dict, from_date, to_date):
+    """Mêmes clés que MetricsAccumulator.metrics(), une fonction (et une passe) par métrique."""
+    kid_subject_stats = legacy_metrics.subject_stats(attempts, quizzes_dict)
+    return {
+        "engagement": legacy_metrics.calculate_engagement(attempts, from_date, to_date),
+        "time_spent": legacy_metrics.total_time_spent(attempts),
+        "streak": legacy_metrics.calculate_streak(attempts),
+        "completion_rate": legacy_metrics.calculate_completion_rate(attempts),
+        "abandon_rate": legacy_metrics.abandonment_rate(attempts),
+        "mastery": legacy_metrics.calculate_mastery(attempts, quizzes_dict),
+        "perseverance": legacy_metrics.calculate_perseverance(attempts),
+        "persistent_failures": legacy_metrics.persistent_failures(attempts),
+        "subject_stats": kid_subject_stats,
+        "subject_balance": calculate_balance_score(kid_subject_stats),
+        "recommendation": recommend_subject(kid_subject_stats),
+        "grade_stats": legacy_metrics.grade_stats(attempts, quizzes_dict),
+    }
+
+
+def accumulated_metrics(attempts, quizzes_dict, from_date, to_date):
+    return MetricsAccumulator(quizzes_dict, from_date, to_date).consume(attempts).metrics()
+
+
+def best_of(func):
+    timings = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def peak_kib(func):
+    """Pic d'allocations pendant un appel (tracemalloc), hors données d'entrée."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    rng = random.Random(42)
+    quizzes_dict = synthetic_quizzes(rng)
+    quiz_ids = list(quizzes_dict)
+    from_date, to_date = datetime(2025, 1, 1), datetime(2025, 12, 31, 23, 59)
+
+    print(f"{'tentatives':>10} {'calcul':>26} {'documents':>10} {'ms':>9} {'µs/tentative':>13} {'pic Kio':>9}")
+    for size in HISTORY_SIZES:
+        attempts = synthetic_attempts(rng, quiz_ids, size)
+        rollups = synthetic_rollups(attempts, quizzes_dict)
+
+        legacy = legacy_all_metrics(attempts, quizzes_dict, from_date, to_date)
+        if accumulated_metrics(attempts, quizzes_dict, from_date, to_date) != legacy:
+            raise AssertionError(f"résultats différents pour {size} tentatives")
+
+        runs = (
+            ("listes (1 passe/métrique)", len(attempts),
+             lambda: legacy_all_metrics(attempts, quizzes_dict, from_date, to_date)),
+            ("accumulateur (1 passe)", len(attempts),
+             lambda: accumulated_metrics(attempts, quizzes_dict, from_date, to_date)),
+            ("kid_daily_stats", len(rollups),
+             lambda: metrics_from_aggregate(rollups_to_aggregate(rollups), quizzes_dict, from_date, to_date)),
+        )
+        for name, documents, func in runs:
+            elapsed = best_of(func)
+            print(f"{size:>10} {name:>26} {documents:>10} {elapsed:>9.2f} {elapsed * 1000 / size:>13.3f} "
+                  f"{peak_kib(func):>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
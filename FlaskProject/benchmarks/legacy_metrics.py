@@ -0,0 +1,226 @@
+# legacy_metrics.py
+"""
+Implémentations de référence des métriques d'un historique de tentatives telles
+qu'avant MetricsAccumulator : une passe (et un tri pour la persévérance) par
+métrique. Utilisées uniquement par bench_metrics.py pour comparer les deux
+chemins et vérifier qu'ils produisent les mêmes résultats.
+"""
+from controllers.performanceController import get_subject_from_quiz, longest_consecutive_days
+
+
+def grade_stats(attempts, quizzes_dict):
+    """Statistiques par niveau, matière et chapitre"""
+    grade_stats = {}
+    
+    for attempt in attempts:
+        try:
+            quiz_id = str(attempt.get("quizID", ""))
+            if not quiz_id or quiz_id not in quizzes_dict:
+                continue
+                
+            quiz_data = quizzes_dict[quiz_id]
+            grade = quiz_data.get("grade", "Inconnu")
+            subject = quiz_data.get("subject", "Inconnu")
+            chapter = quiz_data.get("chapter", "Inconnu")
+            
+            score = float(attempt.get("score", 0))
+            completed = 1 if attempt.get("completed", 0) == 1 else 0
+            
+            # Initialiser le niveau
+            if grade not in grade_stats:
+                grade_stats[grade] = {}
+            
+            # Initialiser la matière dans le niveau
+            if subject not in grade_stats[grade]:
+                grade_stats[grade][subject] = {
+                    "count": 0,
+                    "completed": 0,
+                    "total_score": 0.0,
+                    "average_score": 0.0,
+                    "chapters": {}
+                }
+            
+            # Initialiser le chapitre dans la matière
+            if chapter not in grade_stats[grade][subject]["chapters"]:
+                grade_stats[grade][subject]["chapters"][chapter] = {
+                    "count": 0,
+                    "completed": 0,
+                    "total_score": 0.0,
+                    "average_score": 0.0
+                }
+            
+            # Mettre à jour les statistiques de la matière
+            subject_stats = grade_stats[grade][subject]
+            subject_stats["count"] += 1
+            subject_stats["completed"] += completed
+            subject_stats["total_score"] += score
+            
+            # Mettre à jour les statistiques du chapitre
+            chapter_stats = grade_stats[grade][subject]["chapters"][chapter]
+            chapter_stats["count"] += 1
+            chapter_stats["completed"] += completed
+            chapter_stats["total_score"] += score
+            
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Erreur lors du traitement de l'attempt: {e}")
+            continue
+    
+    # Calculer les moyennes finales
+    for grade in grade_stats:
+        for subject in grade_stats[grade]:
+            subject_stats = grade_stats[grade][subject]
+            
+            # Calculer la moyenne pour la matière
+            if subject_stats["count"] > 0:
+                subject_stats["average_score"] = round(subject_stats["total_score"] / subject_stats["count"], 4)
+            del subject_stats["total_score"]
+            
+            # Calculer les moyennes pour chaque chapitre
+            for chapter in subject_stats["chapters"]:
+                chapter_stats = subject_stats["chapters"][chapter]
+                if chapter_stats["count"] > 0:
+                    chapter_stats["average_score"] = round(chapter_stats["total_score"] / chapter_stats["count"], 4)
+                del chapter_stats["total_score"]
+    
+    return grade_stats
+
+def calculate_engagement(attempts, from_date, to_date):
+    """Nombre de jours de pratique entre from_date et to_date inclus."""
+    if not from_date or not to_date:
+        return 0, 0
+        
+    practice_days = set()
+
+    for attempt in attempts:
+        start_time = attempt["start_time"]
+        if from_date <= start_time <= to_date:
+            practice_days.add(start_time.date())
+
+    total_days = (to_date.date() - from_date.date()).days + 1
+    return len(practice_days), total_days
+
+def calculate_streak(attempts):
+    """
+    Calcule le nombre maximum de jours consécutifs avec au moins un quiz complété.
+    """
+    if not attempts:
+        return 0
+
+    # Extraire les dates des tentatives complétées
+    completed_days = set()
+    for a in attempts:
+        if a.get("completed", 0) == 1:
+            completed_days.add(a["start_time"].date())
+
+    if not completed_days:
+        return 0
+
+    return longest_consecutive_days(completed_days)
+
+
+def calculate_completion_rate(attempts):
+    """Taux de complétion des quiz"""
+    if not attempts:
+        return 0, 0
+        
+    completed = sum(1 for a in attempts if a.get("completed") == 1)
+    total = len(attempts)
+    return completed, total
+
+def calculate_perseverance(attempts):
+    """Retourne les statistiques de persévérance"""
+    if not attempts or len(attempts) < 2:
+        return {"retries": 0, "improved": 0, "perseverance_score": 0}
+        
+    sorted_attempts = sorted(attempts, key=lambda x: x["start_time"])
+    
+    retries = 0
+    improved = 0
+    
+    for i in range(1, len(sorted_attempts)):
+        prev = sorted_attempts[i-1]
+        current = sorted_attempts[i]
+        
+        if prev["quizID"] == current["quizID"]:
+            if prev.get("aborted", 0) == 1 or prev.get("score", 0) < 0.5:
+                retries += 1
+                if  current.get("score", 0) - prev.get("score", 0) >= 0.2 :
+                    improved += 1
+    
+    return {
+        "retries": retries,
+        "improved": improved,
+        "perseverance_score": min(100, improved * 20)
+    }
+
+def abandonment_rate(attempts):
+    """Taux d'abandon des quiz"""
+    if not attempts:
+        return 0, 0
+        
+    total = len(attempts)
+    abandoned = sum(1 for a in attempts if a.get("abandoned") == 1)
+    return abandoned, total
+
+def total_time_spent(attempts):
+    """Temps total passé sur les quiz (en minutes)"""
+    if not attempts:
+        return 0
+        
+    total_time = 0
+    for a in attempts:
+        if a.get("timeout") != 1 and a.get("duration"):
+            total_time += a.get("duration")
+    return total_time  # minutes
+
+def persistent_failures(attempts):
+    """Quiz échoués de manière persistante (≥ 3 fois)"""
+    if not attempts:
+        return {}
+        
+    failed_quizzes = {}
+    for a in attempts:
+        if a.get("failed") == 1 :
+            quiz_id = str(a.get("quizID"))
+            failed_quizzes[quiz_id] = failed_quizzes.get(quiz_id, 0) + 1
+    return {k: v for k, v in failed_quizzes.items() if v >= 3}
+
+def subject_stats(attempts, quizzes_dict):
+    """Statistiques par matière"""
+    subject_stats = {}
+    score_accumulator = {}
+
+    for attempt in attempts:
+        subject = get_subject_from_quiz(attempt, quizzes_dict)
+
+        if subject not in subject_stats:
+            subject_stats[subject] = {"count": 0, "completed": 0, "average_score": 0}
+            score_accumulator[subject] = 0
+
+        subject_stats[subject]["count"] += 1
+        if attempt.get("completed", 0) == 1:
+            subject_stats[subject]["completed"] += 1
+        if attempt.get("score") is not None:
+            score_accumulator[subject] += attempt.get("score", 0)
+
+    for subject, stats in subject_stats.items():
+        if stats["count"] > 0 and score_accumulator.get(subject, 0) > 0:
+            stats["average_score"] = score_accumulator[subject] / stats["count"]
+    
+    return subject_stats
+
+def calculate_mastery(attempts, quizzes_dict):
+    """Sujets maîtrisés (score moyen > 70%)"""
+    subject_scores = {}
+
+    for attempt in attempts:
+        subject = get_subject_from_quiz(attempt, quizzes_dict)
+        if attempt.get("score") is not None:
+            subject_scores.setdefault(subject, []).append(attempt.get("score", 0))
+
+    mastery = {
+        subject: sum(scores) / len(scores)
+        for subject, scores in subject_scores.items()
+        if len(scores) > 20 and sum(scores) / len(scores) >= 0.7
+    }
+    return mastery
@@ -5,3 +5,36 @@ load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://127.0.0.1:27017")
 DB_NAME = os.getenv("DB_NAME", "db")
+
+# Cache des métadonnées de quiz (services/quiz_cache.py)
+QUIZ_CACHE_SIZE = int(os.getenv("QUIZ_CACHE_SIZE", 1024))
+QUIZ_CACHE_TTL = int(os.getenv("QUIZ_CACHE_TTL", 300))
+
+# Cache des prénoms des enfants pour le classement admin (services/kid_names.py)
+KID_NAMES_CACHE_SIZE = int(os.getenv("KID_NAMES_CACHE_SIZE", 10000))
+KID_NAMES_CACHE_TTL = int(os.getenv("KID_NAMES_CACHE_TTL", 300))
+
+# Scores triés par périmètre du classement (rang, nombre d'élèves) : services/leaderboard.py
+LEADERBOARD_CACHE_SIZE = int(os.getenv("LEADERBOARD_CACHE_SIZE", 256))
+LEADERBOARD_CACHE_TTL = int(os.getenv("LEADERBOARD_CACHE_TTL", 60))
+
+# API distante des métadonnées de quiz (services/quiz_metadata.py)
+QUIZ_METADATA_URL = os.getenv("QUIZ_METADATA_URL", "http://48.216.249.114:8080/api/getquizesmetadata")
+QUIZ_METADATA_TTL = int(os.getenv("QUIZ_METADATA_TTL", 300))
+QUIZ_METADATA_CONNECT_TIMEOUT = float(os.getenv("QUIZ_METADATA_CONNECT_TIMEOUT", 2))
+QUIZ_METADATA_READ_TIMEOUT = float(os.getenv("QUIZ_METADATA_READ_TIMEOUT", 5))
+
+# Cache des réponses du tableau de bord parent (services/response_cache.py)
+DASHBOARD_CACHE_SIZE = int(os.getenv("DASHBOARD_CACHE_SIZE", 2048))
+DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", 300))
+
+# Fuseau horaire par défaut des graphiques de scores (paramètre ?tz=)
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "UTC")
+
+# Rafraîchissement des statistiques admin matérialisées (services/stats_snapshots.py), en minutes
+STATS_SNAPSHOT_INTERVAL = int(os.getenv("STATS_SNAPSHOT_INTERVAL", 5))
+# Durée du bail d'un rafraîchissement, en secondes (prolongé après chaque jour recalculé)
+STATS_SNAPSHOT_LEASE = int(os.getenv("STATS_SNAPSHOT_LEASE", 600))
+
+# Comptage des élèves distincts des statistiques admin : "exact" ou "approx" (HyperLogLog, ?distinct=)
+STATS_DISTINCT_MODE = os.getenv("STATS_DISTINCT_MODE", "exact")
@@ -1,5 +1,6 @@
 from models.account import AccountData
 from bson import ObjectId
+from services.pagination import iter_documents, keyset_page, MAX_PAGE_SIZE
 
 
 def mongo_to_dict(obj):
@@ -18,7 +19,11 @@ def create_account(data):
         return {"error": str(e)}, 400
 
 
-def get_all_accounts():
+def get_all_accounts(after=None, limit=None, stream=False):
+    if stream:
+        return iter_documents(AccountData.objects, mongo_to_dict, after, limit), 200
+    if after or limit:
+        return keyset_page(AccountData.objects, mongo_to_dict, after, limit or MAX_PAGE_SIZE), 200
     accounts = AccountData.objects()
     accounts_list = [mongo_to_dict(acc) for acc in accounts]
     return accounts_list, 200
@@ -1,10 +1,22 @@
-from models.attempt import AttemptData, QuestionAttempt
-from models.quiz import Quiz
+from models.attempt import AttemptData, AttemptCounter, QuestionAttempt, QUIZ_FIELDS
+from services.quiz_cache import quiz_cache
+from services import score_recalculation
+from services.kid_rollups import record_terminal_attempts, retry_pending_rollups
+from services.pagination import iter_documents, keyset_page, MAX_PAGE_SIZE
 from bson import ObjectId
 from bson.errors import InvalidId
 from mongoengine.errors import ValidationError
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from datetime import datetime, timedelta, timezone
 from math import log
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+ATTEMPT_TIMEOUT = timedelta(hours=1)
+
 
 def mongo_to_dict(obj):
     data = obj.to_mongo().to_dict()
@@ -14,6 +26,12 @@ def mongo_to_dict(obj):
     return data
 
 
+def _answer_field(ans, name):
+    if isinstance(ans, dict):
+        return ans.get(name) or 0
+    return getattr(ans, name, 0) or 0
+
+
 def calculate_score(answers, attempts_count, min_time=0, max_time=90):
     num_questions = len(answers)
     if num_questions == 0:
@@ -22,7 +40,7 @@ def calculate_score(answers, attempts_count, min_time=0, max_time=90):
     sum_success_rate = 0
     sum_speed = 0
     for ans in answers:
-        t = ans.duration or 0
+        t = _answer_field(ans, "duration")
         # Calculate speed
         if t < min_time:
             speed = 1
@@ -32,12 +50,13 @@ def calculate_score(answers, attempts_count, min_time=0, max_time=90):
             speed = 0
         speed = max(0, min(1, speed))
 
-        numerator = ans.correct_answer
-        denominator = ans.wrong_answer + ans.hint_used + 1
+        correct = _answer_field(ans, "correct_answer")
+        numerator = correct
+        denominator = _answer_field(ans, "wrong_answer") + _answer_field(ans, "hint_used") + 1
         success = numerator / denominator
 
         sum_success_rate += success
-        sum_speed += ans.correct_answer * speed
+        sum_speed += correct * speed
 
     avg_success_rate = sum_success_rate / num_questions
     avg_speed = sum_speed / num_questions
@@ -50,6 +69,50 @@ def calculate_score(answers, attempts_count, min_time=0, max_time=90):
     return score, avg_success_rate
 
 
+def next_attempt_number(userID, kidIndex, quizID):
+    """Incrémente atomiquement le compteur (userID, kidIndex, quizID) et retourne sa nouvelle valeur."""
+    query = {"userID": userID, "kidIndex": kidIndex, "quizID": quizID}
+    collection = AttemptCounter._get_collection()
+    try:
+        counter = collection.find_one_and_update(
+            query, {"$inc": {"count": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Deux upserts concurrents : le document existe désormais
+        counter = collection.find_one_and_update(
+            query, {"$inc": {"count": 1}}, return_document=ReturnDocument.AFTER
+        )
+    return counter["count"]
+
+
+def backfill_attempt_counters():
+    """Initialise attemptcounters à partir des tentatives existantes (idempotent)."""
+    pipeline = [
+        {"$group": {
+            "_id": {"userID": "$userID", "kidIndex": "$kidIndex", "quizID": "$quizID"},
+            "max_count": {"$max": "$attempts_count"},
+            "total": {"$sum": 1},
+        }},
+    ]
+    ops = []
+    seeded = 0
+    for group in AttemptData._get_collection().aggregate(pipeline, allowDiskUse=True):
+        key = group["_id"]
+        if not key.get("userID") or key.get("kidIndex") is None or not key.get("quizID"):
+            continue
+        count = max(group.get("max_count") or 0, group["total"])
+        # $max : ne jamais faire reculer un compteur déjà incrémenté
+        ops.append(UpdateOne(key, {"$max": {"count": count}}, upsert=True))
+        if len(ops) >= 1000:
+            seeded += len(ops)
+            AttemptCounter._get_collection().bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        seeded += len(ops)
+        AttemptCounter._get_collection().bulk_write(ops, ordered=False)
+    return seeded
+
+
 # ------------------ CRUD & LOGIC -------------------
 
 def create_attempt(data):
@@ -66,26 +129,23 @@ def create_attempt(data):
             return {"error": "Invalid quizID"}, 400
 
         quizID = ObjectId(quizID)
-        quiz = Quiz.objects(id=quizID).first()
+        quiz = quiz_cache.get(quizID)
         if not quiz:
             return {"error": "Quiz not found"}, 404
 
-        num_questions = len(quiz.questions)
-
-        stats = AttemptData.objects(userID=userID, kidIndex=kidIndex, quizID=quizID).first()
-        if not stats:
-            stats = AttemptData(userID=userID, kidIndex=kidIndex, quizID=quizID, attempts_count=0)
+        num_questions = quiz["question_count"]
 
-        stats.attempts_count += 1
+        attempts_count = next_attempt_number(userID, kidIndex, quizID)
         now = datetime.now(timezone.utc)
 
         attempt = AttemptData(
             userID=userID,
             kidIndex=kidIndex,
             quizID=quizID,
+            **{field: quiz.get(field) for field in QUIZ_FIELDS},
             deviceType=deviceType,
             device=device,
-            attempts_count=stats.attempts_count,
+            attempts_count=attempts_count,
             createdAt=now,
             updatedAt=now
         )
@@ -102,91 +162,323 @@ def create_attempt(data):
         return {"error": str(e)}, 500
 
 
+def _load_attempt_states(attempt_ids):
+    """
+    Charge l'état minimal nécessaire pour appliquer des événements de question :
+    statut, compteurs par réponse, nombre de tentatives et dernière tentative.
+    Les listes `attempts` imbriquées ne sont jamais renvoyées en entier.
+    """
+    pipeline = [
+        {"$match": {"_id": {"$in": list(attempt_ids)}}},
+        {"$project": {
+            "completed": 1, "failed": 1, "aborted": 1, "timeout": 1,
+            "attempts_count": 1, "__v": 1,
+            "answers": {"$map": {
+                "input": {"$ifNull": ["$answers", []]},
+                "as": "ans",
+                "in": {
+                    "correct_answer": "$$ans.correct_answer",
+                    "wrong_answer": "$$ans.wrong_answer",
+                    "hint_used": "$$ans.hint_used",
+                    "duration": "$$ans.duration",
+                    "attempts_count": {"$size": {"$ifNull": ["$$ans.attempts", []]}},
+                    "last_attempt": {"$arrayElemAt": [{"$ifNull": ["$$ans.attempts", []]}, -1]},
+                },
+            }},
+        }},
+    ]
+    states = {}
+    for doc in AttemptData._get_collection().aggregate(pipeline):
+        doc["stages"] = []
+        _new_stage(doc)
+        states[doc["_id"]] = doc
+    return states
+
+
+def _new_stage(state):
+    """
+    Ouvre une nouvelle étape de mise à jour : les événements d'une tentative
+    sont regroupés en étapes appliquées dans l'ordre (une opération chacune).
+    """
+    state["stages"].append({"update": {"$set": {}, "$push": {}}, "pending": {}, "events": []})
+    return state["stages"][-1]
+
+
+def _is_closed(state):
+    return any(state.get(flag) for flag in ("completed", "failed", "aborted", "timeout"))
+
+
+def _event_time(data, now, sent_at=None):
+    """
+    Heure de l'événement côté client (`timestamp`, ms epoch), recalée sur
+    l'horloge serveur : son âge au moment de l'envoi (`sent_at`, ms epoch,
+    horloge du client) est retranché de `now`. Borné à [now - ATTEMPT_TIMEOUT, now].
+    """
+    try:
+        timestamp = float(data["timestamp"])
+        sent_at = float(sent_at) if sent_at is not None else now.timestamp() * 1000
+    except (KeyError, TypeError, ValueError):
+        return now
+    age = min(max((sent_at - timestamp) / 1000, 0), ATTEMPT_TIMEOUT.total_seconds())
+    return now - timedelta(seconds=age)
+
+
+def _apply_question_event(state, data, now, sent_at=None):
+    """
+    Applique un événement de question sur l'état chargé et accumule les
+    opérations $set/$push ciblées sur `answers.<i>` dans l'étape courante
+    (state["stages"]). Les heures de début / fin viennent de l'horodatage
+    client de l'événement (cf. _event_time), updatedAt de l'heure serveur.
+    """
+    question_index = data.get("question_index")
+    is_correct = int(data.get("is_correct", 0))
+    hint_used = int(data.get("hint_used", 0))
+    is_wrong = int(data.get("is_wrong", 0))
+    is_starting = bool(data.get("is_starting", False))
+    duration = int(data.get("duration", 0))
+
+    if _is_closed(state):
+        return {"message": "Attempt already completed"}, 400
+
+    answers = state["answers"]
+    num_questions = len(answers)
+    if question_index is None or question_index < 0 or question_index >= num_questions:
+        return {"error": f"Index {question_index} is invalid"}, 400
+
+    if question_index > 0 and _answer_field(answers[question_index - 1], "correct_answer") == 0:
+        return {"error": f"You must first answer question {question_index - 1}"}, 400
+
+    answer = answers[question_index]
+    if _answer_field(answer, "correct_answer") == 1:
+        return {"error": f"Question {question_index} is already correct"}, 400
+
+    at = _event_time(data, now, sent_at)
+    prefix = f"answers.{question_index}"
+    stage = state["stages"][-1]
+    if is_starting and any(path.startswith(f"{prefix}.attempts.") for path in stage["update"]["$set"]):
+        # $set sur answers.<i>.attempts.<k> et $push sur answers.<i>.attempts dans
+        # une même opération : conflit de chemins refusé par MongoDB
+        stage = _new_stage(state)
+    update = stage["update"]
+    pending = stage["pending"].setdefault(question_index, [])
+
+    if is_starting:
+        qa = QuestionAttempt(start_time=at).to_mongo().to_dict()
+        pending.append(qa)
+        update["$push"][f"{prefix}.attempts"] = {"$each": pending}
+        update["$set"][f"{prefix}.start_time"] = at
+        answer["attempts_count"] += 1
+        answer["last_attempt"] = qa
+    else:
+        last = answer.get("last_attempt")
+        if not last or not last.get("start_time"):
+            return {"error": "No attempt in progress"}, 400
+
+        new_values = {
+            "is_correct": is_correct,
+            "is_wrong": is_wrong,
+            "hint_used": hint_used,
+            "duration": duration,
+        }
+        # Les totaux de la réponse sont maintenus par différence avec
+        # l'ancienne valeur de la dernière tentative.
+        for qa_field, ans_field in (("is_correct", "correct_answer"), ("is_wrong", "wrong_answer"),
+                                    ("hint_used", "hint_used"), ("duration", "duration")):
+            answer[ans_field] = (
+                _answer_field(answer, ans_field) - (last.get(qa_field) or 0) + new_values[qa_field]
+            )
+        last.update(new_values, end_time=at)
+
+        if not pending:
+            last_path = f"{prefix}.attempts.{answer['attempts_count'] - 1}"
+            for field, value in last.items():
+                if field != "start_time":
+                    update["$set"][f"{last_path}.{field}"] = value
+
+        update["$set"].update({
+            f"{prefix}.end_time": at,
+            f"{prefix}.attempts_count": answer["attempts_count"],
+            f"{prefix}.correct_answer": answer["correct_answer"],
+            f"{prefix}.wrong_answer": answer["wrong_answer"],
+            f"{prefix}.hint_used": answer["hint_used"],
+            f"{prefix}.duration": answer["duration"],
+        })
+
+    correct_answers = sum(_answer_field(ans, "correct_answer") for ans in answers)
+    total_wrong_attempts = sum(_answer_field(ans, "wrong_answer") for ans in answers)
+
+    if correct_answers == num_questions:
+        state["completed"] = 1
+        update["$set"].update({"completed": 1, "end_time": at})
+    elif total_wrong_attempts >= 3:
+        state["failed"] = 1
+        update["$set"].update({"failed": 1, "end_time": at})
+
+    score, success_rate = calculate_score(answers, state.get("attempts_count") or 1)
+    update["$set"].update({
+        "duration": sum(_answer_field(ans, "duration") for ans in answers),
+        "updatedAt": now,
+        "score": score,
+        "success_rate": success_rate,
+        "answered_questions": correct_answers,
+    })
+
+    status = (
+        "completed" if state.get("completed") else
+        "failed" if state.get("failed") else
+        "in_progress"
+    )
+    response = {"message": "Answer updated", "status": status, "attempt_id": str(state["_id"])}
+    if not is_starting:
+        response["score"] = score
+    return response, 200
+
+
+def _attempt_update_ops(state):
+    """
+    Filtre conditionnel (__v) + mise à jour ciblée pour chaque étape d'un état
+    modifié ; chaque étape attend le __v laissé par la précédente.
+    """
+    ops, version = [], state.get("__v")
+    for stage in state["stages"]:
+        update = {op: fields for op, fields in stage["update"].items() if fields}
+        if not update:
+            continue
+        update["$inc"] = {"__v": 1}
+        ops.append(({"_id": state["_id"], "__v": version}, update, stage))
+        version = (version or 0) + 1
+    return ops
+
+
+CONFLICT_ERROR = "Attempt was modified concurrently, please retry"
+
+
 def update_attempt(data):
     try:
         attempt_id = data.get("attempt_id")
-        question_index = data.get("question_index")
-        is_correct = int(data.get("is_correct", 0))
-        hint_used = int(data.get("hint_used", 0))
-        is_wrong = int(data.get("is_wrong", 0))
-        is_starting = bool(data.get("is_starting", False))
-        duration = int(data.get("duration", 0))
-
         if not ObjectId.is_valid(attempt_id):
             return {"error": "Invalid attempt_id"}, 400
 
-        attempt = AttemptData.objects(id=ObjectId(attempt_id)).first()
-        if not attempt:
+        attempt_id = ObjectId(attempt_id)
+        state = _load_attempt_states([attempt_id]).get(attempt_id)
+        if not state:
             return {"error": "Attempt not found"}, 404
-        
-        if attempt.completed or attempt.failed or attempt.aborted or attempt.timeout:
-            return {"message": "Attempt already completed"}, 400
 
-        num_questions = len(attempt.answers)
-        if question_index is None or question_index < 0 or question_index >= num_questions:
-            return {"error": f"Index {question_index} is invalid"}, 400
+        response, status = _apply_question_event(state, data, datetime.now(timezone.utc))
+        if status != 200:
+            return response, status
 
-        if question_index > 0 and attempt.answers[question_index - 1].correct_answer == 0:
-            return {"error": f"You must first answer question {question_index - 1}"}, 400
+        # Un seul événement : une seule étape
+        (query, update, _), = _attempt_update_ops(state)
+        result = AttemptData._get_collection().update_one(query, update)
+        if result.matched_count == 0:
+            return {"error": CONFLICT_ERROR}, 409
 
-        if attempt.answers[question_index].correct_answer == 1:
-            return {"error": f"Question {question_index} is already correct"}, 400
+        if _is_closed(state):
+            record_terminal_attempts({"_id": attempt_id})
 
-        now = datetime.now(timezone.utc)
-        answer = attempt.answers[question_index]
-
-        if is_starting:
-            qa = QuestionAttempt(
-                start_time=now,
-            )
-            answer.start_time = now
-            answer.attempts.append(qa)
-        else:
-            if not answer.attempts or not answer.attempts[-1].start_time:
-                return {"error": "No attempt in progress"}, 400
-
-            qa = answer.attempts[-1]
-            qa.end_time = now
-            qa.is_correct = is_correct
-            qa.is_wrong = is_wrong
-            qa.hint_used = hint_used
-            qa.duration = duration
-
-            answer.end_time = now
-            answer.attempts_count = len(answer.attempts)
-            answer.correct_answer = sum(a.is_correct for a in answer.attempts)
-            answer.wrong_answer = sum(a.is_wrong for a in answer.attempts)
-            answer.hint_used = sum(a.hint_used for a in answer.attempts)
-            answer.duration = sum(a.duration for a in answer.attempts)
-
-        correct_answers = sum(ans.correct_answer for ans in attempt.answers)
-        total_wrong_attempts = sum(ans.wrong_answer for ans in attempt.answers)
-
-        if correct_answers == num_questions:
-            attempt.completed = 1
-            attempt.end_time = now
-        elif total_wrong_attempts >= 3:
-            attempt.failed = 1
-            attempt.end_time = now
-
-        attempt.duration = sum(ans.duration for ans in attempt.answers)
-        attempt.updatedAt = now
-        attempt.score, attempt.success_rate = calculate_score(attempt.answers, attempt.attempts_count)
-        attempt.answered_questions = correct_answers
+        return response, 200
 
-        attempt.save()
+    except ValidationError as e:
+        return {"error": str(e)}, 400
+    except Exception as e:
+        return {"error": str(e)}, 500
 
-        status = (
-            "completed" if attempt.completed else
-            "failed" if attempt.failed else
-            "aborted" if getattr(attempt, "aborted", 0) else
-            "in_progress"
-        )
 
-        response = {"message": "Answer updated", "status": status, "attempt_id": str(attempt.id)}
-        if not is_starting:
-            response["score"] = attempt.score
-        return response, 200
+def _write_stages(states, applied, results):
+    """
+    Écrit les étapes des tentatives modifiées : un bulk_write non ordonné par
+    rang d'étape (la k-ième étape de chaque tentative), pour garder l'ordre
+    au sein d'une tentative. Une étape en échec (erreur d'écriture ou __v
+    inattendu) invalide ses événements et ceux des étapes suivantes de la
+    même tentative. Retourne les tentatives entièrement écrites.
+    """
+    collection = AttemptData._get_collection()
+    remaining = {_id: _attempt_update_ops(states[_id]) for _id in applied}
+    written = set()
+
+    def fail(_id, stage_index, error):
+        for _, _, stage in remaining.pop(_id)[stage_index:]:
+            for i in stage["events"]:
+                results[i] = error
+
+    rank = 0
+    while remaining:
+        batch = [(_id, ops[rank]) for _id, ops in remaining.items() if rank < len(ops)]
+        for _id in [_id for _id, ops in remaining.items() if rank >= len(ops)]:
+            del remaining[_id]
+            written.add(_id)
+        if not batch:
+            break
+
+        try:
+            matched = collection.bulk_write(
+                [UpdateOne(query, update) for _, (query, update, _) in batch], ordered=False
+            ).matched_count
+            errors = []
+        except BulkWriteError as e:
+            matched = e.details.get("nMatched", 0)
+            errors = e.details.get("writeErrors", [])
+
+        for error in errors:
+            _id = batch[error["index"]][0]
+            fail(_id, rank, {"status_code": 500, "error": error.get("errmsg", "Write error")})
+
+        if matched < len(batch) - len(errors):
+            # Identifier les tentatives modifiées entre-temps (__v inattendu)
+            pending = {_id: query["__v"] for _id, (query, _, _) in batch if _id in remaining}
+            for doc in collection.find({"_id": {"$in": list(pending)}}, {"__v": 1}):
+                if doc.get("__v") != (pending[doc["_id"]] or 0) + 1:
+                    fail(doc["_id"], rank, {"status_code": 409, "error": CONFLICT_ERROR})
+        rank += 1
+
+    return written
+
+
+def update_attempts_batch(data):
+    """
+    Applique une liste ordonnée d'événements de question (une ou plusieurs
+    tentatives) avec une seule lecture et, en général, un seul bulk_write.
+    Retourne un statut par événement, dans l'ordre reçu.
+    """
+    try:
+        events = (data or {}).get("events")
+        if not isinstance(events, list) or not events:
+            return {"error": "Missing events"}, 400
+
+        attempt_ids = {
+            ObjectId(e["attempt_id"]) for e in events
+            if isinstance(e, dict) and ObjectId.is_valid(e.get("attempt_id"))
+        }
+        states = _load_attempt_states(attempt_ids) if attempt_ids else {}
+        now = datetime.now(timezone.utc)
+        sent_at = data.get("sent_at")
+
+        results = []
+        applied = set()  # tentatives ayant au moins un événement appliqué
+        for i, event in enumerate(events):
+            if not isinstance(event, dict) or not ObjectId.is_valid(event.get("attempt_id")):
+                results.append({"status_code": 400, "error": "Invalid attempt_id"})
+                continue
+
+            state = states.get(ObjectId(event["attempt_id"]))
+            if not state:
+                results.append({"status_code": 404, "error": "Attempt not found"})
+                continue
+
+            response, status = _apply_question_event(state, event, now, sent_at)
+            results.append({"status_code": status, **response})
+            if status == 200:
+                state["stages"][-1]["events"].append(i)
+                applied.add(state["_id"])
+
+        if applied:
+            written = _write_stages(states, applied, results)
+            terminal_ids = [_id for _id in written if _is_closed(states[_id])]
+            if terminal_ids:
+                record_terminal_attempts({"_id": {"$in": terminal_ids}})
+
+        return {"results": results}, 200
 
     except ValidationError as e:
         return {"error": str(e)}, 400
@@ -199,44 +491,81 @@ def abandon_attempt(data):
     if not attempt_id or not ObjectId.is_valid(attempt_id):
         return {"error": "Invalid attempt_id"}, 400
 
-    attempt = AttemptData.objects(id=ObjectId(attempt_id)).first()
-    if not attempt:
-        return {"error": "Attempt not found"}, 404
-
-    if attempt.completed or attempt.failed or attempt.aborted or attempt.timeout:
+    attempt_id = ObjectId(attempt_id)
+    now = datetime.now(timezone.utc)
+    # Une seule écriture conditionnée à l'état ouvert : une fin concurrente
+    # (réponse, balayage des timeouts) ne peut pas être agrégée deux fois
+    result = AttemptData._get_collection().update_one(
+        {"_id": attempt_id, "completed": 0, "failed": 0, "aborted": 0, "timeout": 0},
+        {"$set": {"aborted": 1, "end_time": now, "updatedAt": now}, "$inc": {"__v": 1}},
+    )
+    if result.modified_count != 1:
+        if not AttemptData.objects(id=attempt_id).only("id").first():
+            return {"error": "Attempt not found"}, 404
         return {"message": "Attempt already completed"}, 400
 
-    attempt.aborted = 1
-    attempt.end_time = datetime.now(timezone.utc)
-    attempt.save()
-    return {"message": "Quiz abandoned", "attempt_id": str(attempt.id)}, 200
+    record_terminal_attempts({"_id": attempt_id})
+    return {"message": "Quiz abandoned", "attempt_id": str(attempt_id)}, 200
 
 
 def mark_timeout_attempts():
-    one_hour_ago = datetime.now(timezone.utc) - timedelta(hours=1)
-    attempts = AttemptData.objects(
-        completed=0, failed=0, aborted=0, timeout=0,
-        start_time__lt=one_hour_ago
+    """
+    Marque en timeout toutes les tentatives ouvertes démarrées il y a plus
+    d'une heure, en un seul update_many (pipeline) calculé côté serveur.
+    S'appuie sur l'index partiel des tentatives ouvertes. Les tentatives
+    balayées sont marquées (timeout_sweep) le temps de mettre à jour
+    kid_daily_stats ; les agrégats en échec (rollup_pending) sont rejoués.
+    """
+    started = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    sweep_id = ObjectId()
+    result = AttemptData._get_collection().update_many(
+        {
+            "completed": 0, "failed": 0, "aborted": 0, "timeout": 0,
+            "start_time": {"$lt": now - ATTEMPT_TIMEOUT},
+        },
+        [{"$set": {
+            "timeout": 1,
+            "end_time": {"$add": ["$start_time", int(ATTEMPT_TIMEOUT.total_seconds() * 1000)]},
+            "time_spent": int(ATTEMPT_TIMEOUT.total_seconds()),
+            "updatedAt": now,
+            "__v": {"$add": [{"$ifNull": ["$__v", 0]}, 1]},
+            "timeout_sweep": sweep_id,
+        }}],
     )
-    for attempt in attempts:
-        attempt.timeout = 1
-        attempt.end_time = attempt.start_time + timedelta(hours=1)
-        attempt.time_spent = 3600
-        attempt.save()
-
-
-def recalculate_scores():
+    if result.modified_count:
+        record_terminal_attempts({"timeout_sweep": sweep_id})
+        AttemptData._get_collection().update_many(
+            {"timeout_sweep": sweep_id}, {"$unset": {"timeout_sweep": ""}}
+        )
+    retried = retry_pending_rollups()
+    report = {
+        "matched": result.matched_count,
+        "modified": result.modified_count,
+        "retried": retried,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    if report["modified"] or report["retried"]:
+        logger.info("Timeout sweep: %s tentatives, %s agrégats rejoués en %s ms",
+                    report["modified"], report["retried"], report["elapsed_ms"])
+    return report
+
+
+def recalculate_scores(batch_size=500, resume=False, max_batches=None, rebuild=True):
     try:
-        attempts = AttemptData.objects()
-        for attempt in attempts:
-            attempt.score, attempt.success_rate = calculate_score(attempt.answers, attempt.attempts_count)
-            attempt.save()
-        return {"message": "Scores recalculated"}, 200
+        report = score_recalculation.recalculate_scores(
+            batch_size=batch_size, resume=resume, max_batches=max_batches, rebuild=rebuild
+        )
+        return {"message": "Scores recalculated", **report}, 200
     except Exception as e:
         return {"error": str(e)}, 500
 
 
-def get_all_attempts():
+def get_all_attempts(after=None, limit=None, stream=False):
+    if stream:
+        return iter_documents(AttemptData.objects, mongo_to_dict, after, limit), 200
+    if after or limit:
+        return keyset_page(AttemptData.objects, mongo_to_dict, after, limit or MAX_PAGE_SIZE), 200
     return [mongo_to_dict(a) for a in AttemptData.objects()], 200
 
 
@@ -250,100 +579,35 @@ def get_attempt_by_id(attempt_id):
         return {"error": str(e)}, 400
 
 
-def get_attempts_per_kid(user_id, kid_index, from_date, to_date):
-    attempts = AttemptData.objects(
-        userID=user_id,
-        kidIndex=kid_index,
-        start_time__gte=from_date,
-        start_time__lte=to_date
-    )
-    results = []
-    for a in attempts:
-        quiz = Quiz.objects(id=a.quizID).first()
-        results.append({
-            "id": str(a.id),
-            "quizID": str(a.quizID),
-            "level": quiz.level,
-            "subject": quiz.subject,
-            "start_time": a.start_time,
-            "end_time": a.end_time,
-            "score": a.score,
-            "completed": a.completed,
-            "failed": a.failed,
-            "aborted": a.aborted
-        })
-    return results, 200
-
+def get_attempts_in_range(user_id, kid_index, from_date, to_date, inclusive_end=False):
+    """
+    Liste les tentatives d'un enfant sur une période : une requête projetée
+    sur les tentatives + une seule résolution groupée des quiz.
+    """
+    date_range = {"start_time__gte": from_date}
+    date_range["start_time__lte" if inclusive_end else "start_time__lt"] = to_date
 
-def get_attempts_per_week(user_id, kid_index, start_date, end_date):
-    attempts = AttemptData.objects(
-        userID=user_id,
-        kidIndex=kid_index,
-        start_time__gte=start_date,
-        start_time__lt=end_date
+    attempts = list(
+        AttemptData.objects(userID=user_id, kidIndex=kid_index, **date_range)
+        .only("id", "quizID", "start_time", "end_time", "score", "completed", "failed", "aborted")
+        .as_pymongo()
     )
-    results = []
-    for a in attempts:
-        quiz = Quiz.objects(id=a.quizID).first()
-        results.append({
-            "id": str(a.id),
-            "quizID": str(a.quizID),
-            "level": quiz.level,
-            "subject": quiz.subject,
-            "chapter": quiz.chapter,
-            "start_time": a.start_time,
-            "end_time": a.end_time,
-            "score": a.score,
-            "completed": a.completed,
-            "failed": a.failed,
-            "aborted": a.aborted
-        })
-    return results, 200
-
+    quizzes = quiz_cache.get_many({a.get("quizID") for a in attempts})
 
-def get_attempts_per_month(user_id, kid_index, start_date, end_date):
-    attempts = AttemptData.objects(
-        userID=user_id,
-        kidIndex=kid_index,
-        start_time__gte=start_date,
-        start_time__lt=end_date
-    )
     results = []
     for a in attempts:
-        quiz = Quiz.objects(id=a.quizID).first()
+        quiz = quizzes.get(str(a.get("quizID")), {})
         results.append({
-            "id": str(a.id),
-            "quizID": str(a.quizID),
-            "level": quiz.level,
-            "subject": quiz.subject,
-            "chapter": quiz.chapter,
-            "start_time": a.start_time,
-            "end_time": a.end_time,
-            "score": a.score,
-            "completed": a.completed,
-            "failed": a.failed,
-            "aborted": a.aborted
+            "id": str(a["_id"]),
+            "quizID": str(a.get("quizID")),
+            "level": quiz.get("level"),
+            "subject": quiz.get("subject"),
+            "chapter": quiz.get("chapter"),
+            "start_time": a.get("start_time"),
+            "end_time": a.get("end_time"),
+            "score": a.get("score", 0.0),
+            "completed": a.get("completed", 0),
+            "failed": a.get("failed", 0),
+            "aborted": a.get("aborted", 0)
         })
     return results, 200
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
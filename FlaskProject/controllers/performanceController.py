@@ -1,11 +1,16 @@
 from flask import jsonify, request
 from datetime import datetime, timedelta, timezone
 import pandas as pd
-from models.attempt import AttemptData
-from models.quiz import Quiz
+from services.attempt_repository import find_attempts, score_buckets
+from services.quiz_cache import quiz_cache
+from services.quiz_metadata import get_quizzes_metadata
+from services.kid_rollups import load_kid_rollups, load_kids_rollups, rollups_to_aggregate
+from services.kid_names import load_kid_names
 from bson import ObjectId
 from dateutil import parser
 import calendar
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import config
 
 
 class PerformanceController:    
@@ -13,213 +18,18 @@ class PerformanceController:
     def get_messages_codes(userId, kidIndex):
         try:
             # --- Récupérer période ---
-            from_str = request.args.get("from")
-            to_str = request.args.get("to")
-            period = request.args.get("period", "week")
-
-            to_date = datetime.now(timezone.utc) if not to_str else parse_date(to_str)
-            from_date = (
-                to_date - timedelta(days=7) if period == "week" else
-                to_date - timedelta(days=30) if period == "month" else
-                (to_date - timedelta(days=60) if not from_str else parse_date(from_str))
-            )
-
+            from_date, to_date, period = messages_codes_range(request.args)
             if not from_date or not to_date:
                 return jsonify({"error": "Dates invalides"}), 400
 
-            # --- Charger attempts ---
-            attempts = AttemptData.objects(
-                userID=userId,
-                kidIndex=kidIndex,
-                start_time__gte=from_date,
-                start_time__lte=to_date
-            )
-
-            if not attempts:
-                return jsonify({
-                    "userID": userId,
-                    "kidIndex": kidIndex,
-                    "from": from_date.isoformat(),
-                    "to": to_date.isoformat(),
-                    "period": period,
-                    "metrics": {
-                        "engagement": (0, 7),
-                        "time_spent": 0,
-                        "streak": 0,
-                        "completion_rate": (0, 0),
-                        "abandon_rate": (0, 0),
-                        "mastery": {},
-                        "perseverance": {"retries": 0, "improved": 0},
-                        "subject_balance": 0,
-                        "recommendation": None
-                    },
-                    "achievements": ["NO_ACTIVITY"],
-                    "alerts": [],
-                    "recommendations": ["START_SMALL"]
-                }), 200
-
-            kid_attempts = [a.to_mongo().to_dict() for a in attempts]
-            
-            # Extraire les quizIDs uniques
-            quiz_ids = list(set(str(attempt.get("quizID")) for attempt in kid_attempts if attempt.get("quizID")))
-
-            if not quiz_ids:
-                return jsonify({
-                    "userID": userId,
-                    "kidIndex": kidIndex,
-                    "from": from_date.isoformat(),
-                    "to": to_date.isoformat(),
-                    "period": period,
-                    "metrics": {
-                        "engagement": (0, 7),
-                        "time_spent": 0,
-                        "streak": 0,
-                        "completion_rate": (0, 0),
-                        "abandon_rate": (0, 0),
-                        "mastery": {},
-                        "perseverance": {"retries": 0, "improved": 0},
-                        "subject_balance": 0,
-                        "recommendation": None
-                    },
-                    "achievements": ["FIRST_STEPS"],
-                    "alerts": ["NO_COMPLETED"],
-                    "recommendations": ["COMPLETE_ACTIVITY"]
-                }), 200
-            
-            # Récupérer les métadonnées via l'API externe
-            quizzes_dict = get_quizzes_metadata(quiz_ids)
-            
-            kid_subject_stats = subject_stats(kid_attempts, quizzes_dict)
-
-            # --- Calcul des métriques ---
-            metrics = {
-                "engagement": calculate_engagement(kid_attempts, from_date, to_date),
-                "time_spent": total_time_spent(kid_attempts),
-                "streak": calculate_streak(kid_attempts),
-                "completion_rate": calculate_completion_rate(kid_attempts),
-                "abandon_rate": abandonment_rate(kid_attempts),
-                "mastery": calculate_mastery(kid_attempts, quizzes_dict),
-                "perseverance": calculate_perseverance(kid_attempts),
-                "subject_balance": calculate_balance_score(kid_subject_stats),
-                "recommendation": recommend_subject(kid_subject_stats)
-            }
-
-            # === Génération des codes de messages ===
-            achievements, alerts, recommendations = [], [], []
-            days, total_days = metrics["engagement"]
-            engagement_rate = days / total_days if total_days > 0 else 0
-
-            # Engagement
-            if engagement_rate == 1.0:
-                achievements.append(f"ENGAGEMENT_HIGH")
-            elif engagement_rate >= 0.6:
-                achievements.append(f"ENGAGEMENT_GOOD")
-            elif engagement_rate >= 0.4:
-                achievements.append(f"ENGAGEMENT_AVERAGE")
-            else:
-                alerts.append(f"ENGAGEMENT_LOW")
-
-            # Streak
-            streak = metrics["streak"]
-            if period == "week":
-                if streak >= 7:
-                    return "STREAK_WEEK_7"
-                elif streak >= 5:
-                    return "STREAK_WEEK_5"
-                elif streak >= 3:
-                    return "STREAK_WEEK_3"
-            elif period == "month":
-                if streak >= 21:
-                    return "STREAK_MONTH_21"
-                elif streak >= 14:
-                    return "STREAK_MONTH_14"
-                elif streak >= 7:
-                    return "STREAK_MONTH_7"
-
-
-            # Completion
-            completed, started = metrics["completion_rate"]
-            if started > 0:
-                rate = completed / started
-                if rate >= 0.9:
-                    achievements.append(f"COMPLETION_EXCELLENT")
-                elif rate >= 0.7:
-                    achievements.append(f"COMPLETION_GOOD")
-                elif rate >= 0.5:
-                    achievements.append(f"COMPLETION_AVERAGE")
-                if rate < 0.5 and started > 3:
-                    alerts.append(f"COMPLETION_LOW_ALERT")
-
-            # Mastery
-            for subject, score in metrics["mastery"].items():
-                if score >= 0.9:
-                    achievements.append(f"MASTERY_EXCELLENT_{subject}")
-                elif score >= 0.8:
-                    achievements.append(f"MASTERY_GOOD_{subject}")
-                elif score >= 0.7:
-                    achievements.append(f"MASTERY_AVERAGE_{subject}")
-                elif score < 0.5:
-                    alerts.append(f"MASTERY_LOW_ALERT_{subject}")
-
-            # Abandon
-            abandoned = metrics["abandon_rate"][0]
-            if abandoned > 0:
-                alerts.append(f"ABANDON_ALERT")
-
-            # Perseverance
-            perseverance = metrics["perseverance"]
-            if perseverance["improved"] >= 5:
-                achievements.append(f"PERSEVERANCE_STRONG")
-            elif perseverance["improved"] >= 3:
-                achievements.append(f"PERSEVERANCE_GOOD")
-            elif perseverance["retries"] > 0:
-                achievements.append(f"PERSEVERANCE_RETRIES")
-
-            # Balance
-            balance = metrics["subject_balance"]
-            if balance < 40:
-                recommendations.append(f"BALANCE_LOW")
-            elif balance >= 80:
-                achievements.append(f"BALANCE_GOOD")
-
-            # Recommendation matière
-            if metrics["recommendation"] and metrics["recommendation"] != "Aucune":
-                recommendations.append(f"RECOMMEND_{metrics['recommendation']}")
-
-            # Temps passé
-            total_minutes = metrics["time_spent"]
-            if total_minutes >= 300:
-                achievements.append(f"TIME_HIGH")
-            elif total_minutes >= 180:
-                achievements.append(f"TIME_MEDIUM")
-            elif total_minutes > 0:
-                alerts.append(f"TIME_LOW")
-
-            # Inspiration
-            if period == "week":
-                achievements.append("INSPIRATION_WEEK")
-            elif period == "month":
-                achievements.append("INSPIRATION_MONTH")
-
-            # Valeurs par défaut
-            if not achievements:
-                achievements.append("DEFAULT_ACHIEVEMENT")
-            if not alerts:
-                alerts.append("DEFAULT_ALERT")
-            if not recommendations:
-                recommendations.append("DEFAULT_RECOMMENDATION")
+            # --- Charger les agrégats quotidiens ---
+            aggregate = rollups_to_aggregate(load_kid_rollups(userId, kidIndex, from_date, to_date))
+            quizzes_dict = resolve_quizzes(aggregate)
 
-            return jsonify({
-                "userID": userId,
-                "kidIndex": kidIndex,
-                "from": from_date.isoformat(),
-                "to": to_date.isoformat(),
-                "period": period,
-                "metrics": metrics,
-                "achievements": achievements,
-                "alerts": alerts,
-                "recommendations": recommendations
-            }), 200
+            response, status = build_messages_codes(
+                userId, kidIndex, aggregate, quizzes_dict, from_date, to_date, period
+            )
+            return jsonify(response), status
 
         except Exception as e:
             return jsonify({"error": str(e)}), 500
@@ -228,51 +38,14 @@ class PerformanceController:
     def get_metrics(userId, kidIndex):
         """Retourne les métriques de performance détaillées"""
         try:
-            from_str = request.args.get("from")
-            to_str = request.args.get("to")
-            from_date = parse_date(from_str) if from_str else None
-            to_date = parse_date(to_str) if to_str else None
-
-            query = {"userID": userId, "kidIndex": kidIndex}
-            if from_date and to_date:
-                query["start_time__gte"] = from_date
-                query["start_time__lte"] = to_date
-
-            attempts_list = AttemptData.objects(**query)
-            kid_attempts = [a.to_mongo().to_dict() for a in attempts_list]
-            
-            if not kid_attempts:
-                return jsonify({"message": "Aucune tentative trouvée"}), 200
-            
-            
-            
-            # Extraire les quizIDs uniques
-            quiz_ids = list(set(str(attempt.get("quizID")) for attempt in kid_attempts if attempt.get("quizID")))
+            from_date, to_date = metrics_range(request.args)
 
-            if not quiz_ids:
-                return jsonify({"message": "Aucun quizID valide trouvé"}), 200
-            
-            # Récupérer les métadonnées via l'API externe
-            quizzes_dict = get_quizzes_metadata(quiz_ids)
-            
-            kid_subject_stats = subject_stats(kid_attempts, quizzes_dict)
-
-            metrics = {
-                "engagement": calculate_engagement(kid_attempts, from_date, to_date),
-                "time_spent": total_time_spent(kid_attempts),
-                "streak": calculate_streak(kid_attempts),
-                "completion_rate": calculate_completion_rate(kid_attempts),
-                "abandon_rate": abandonment_rate(kid_attempts),
-                "mastery": calculate_mastery(kid_attempts, quizzes_dict),
-                "perseverance": calculate_perseverance(kid_attempts),
-                "persistent_failures": persistent_failures(kid_attempts),
-                "subject_stats": kid_subject_stats,
-                "subject_balance": calculate_balance_score(kid_subject_stats),
-                "recommendation": recommend_subject(kid_subject_stats),
-                "grade_stats": grade_stats(kid_attempts, quizzes_dict)
-            }
+            # Agrégats quotidiens (kid_daily_stats) : au plus jours × matières documents
+            aggregate = rollups_to_aggregate(load_kid_rollups(userId, kidIndex, from_date, to_date))
+            quizzes_dict = resolve_quizzes(aggregate)
 
-            return jsonify(metrics), 200
+            response, status = build_metrics(aggregate, quizzes_dict, from_date, to_date)
+            return jsonify(response), status
 
         except Exception as e:
             return jsonify({"error": str(e)}), 500
@@ -282,68 +55,128 @@ class PerformanceController:
         """
         Retourne les scores moyens par jour (week) ou par jour du mois (month)
         period: 'week' ou 'month'
+        granularity (optionnel): série 'day', 'week' (ISO) ou 'month' sur la période
+        tz: fuseau horaire des tranches (config.DEFAULT_TIMEZONE par défaut)
         """
         try:
-            from_str = request.args.get("from")
-            to_str = request.args.get("to")
-            period = request.args.get("period", "week")
-
-            from_date = parse_date(from_str) if from_str else None
-            to_date = parse_date(to_str) if to_str else None
+            from_date, to_date = metrics_range(request.args)
 
             if not from_date or not to_date:
                 return jsonify({"error": "Dates invalides"}), 400
 
-            # Récupérer les attempts
-            attempts = AttemptData.objects(
-                userID=userID,
-                kidIndex=kidIndex,
-                createdAt__gte=from_date,
-                createdAt__lte=to_date
+            response, status = build_average_scores(
+                userID, kidIndex, from_date, to_date, *scores_options(request.args)
             )
+            return jsonify(response), status
+
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
 
-            if period == 'week':
-                labels = ['Lun', 'Mar', 'Mer', 'Jeu', 'Ven', 'Sam', 'Dim']
-                scores_dict = {j: [] for j in labels}
-
-                # Collecter les scores par jour
-                for att in attempts:
-                    day_index = att.createdAt.weekday()  # 0=Lundi, 6=Dimanche
-                    jour = labels[day_index]
-                    scores_dict[jour].append(att.score)
-
-                # Diviser par le max nombre d'essais pour normaliser
-                data = []
-                for jour in labels:
-                    max_attempts = max(len(v) for v in scores_dict.values()) if scores_dict else 1
-                    total_score = sum(scores_dict[jour])
-                    avg = round(total_score / max_attempts, 2) if total_score else 0
-                    data.append(avg)
-
-            elif period == 'month':
-                # Nombre de jours dans le mois de from_date
-                num_days = calendar.monthrange(from_date.year, from_date.month)[1]
-                labels = [str(d) for d in range(1, num_days + 1)]
-                scores_dict = {str(d): [] for d in range(1, num_days + 1)}
-
-                for att in attempts:
-                    day = str(att.createdAt.day)
-                    scores_dict[day].append(att.score)
-
-                max_attempts = max(len(v) for v in scores_dict.values()) if scores_dict else 1
-                data = [round(sum(scores_dict[day]) / max_attempts, 2) if scores_dict[day] else 0 for day in labels]
+    @staticmethod
+    def get_dashboard(userId, kidIndex):
+        """
+        Messages, métriques et scores en un seul appel : les agrégats quotidiens
+        sont lus une seule fois (union des périodes) et les métadonnées résolues
+        une fois.
+        ?sections=messages,metrics,scores (toutes par défaut)
+        """
+        try:
+            sections = request.args.get("sections")
+            sections = set(sections.split(",")) if sections else set(DASHBOARD_SECTIONS)
+            unknown = sections - set(DASHBOARD_SECTIONS)
+            if unknown:
+                return jsonify({"error": f"Sections inconnues : {', '.join(sorted(unknown))}"}), 400
+
+            messages_from, messages_to, period = messages_codes_range(request.args)
+            metrics_from, metrics_to = metrics_range(request.args)
+            if "messages" in sections and (not messages_from or not messages_to):
+                return jsonify({"error": "Dates invalides"}), 400
+            if "scores" in sections and (not metrics_from or not metrics_to):
+                return jsonify({"error": "Dates invalides"}), 400
 
+            # Période couverte par les sections lues dans les agrégats quotidiens
+            ranges = []
+            if "messages" in sections:
+                ranges.append((messages_from, messages_to))
+            if "metrics" in sections:
+                ranges.append((metrics_from, metrics_to))
+            if ranges and all(start and end for start, end in ranges):
+                load_from = min(_day_start(start) for start, _ in ranges)
+                load_to = max(_naive_utc(end) for _, end in ranges)
             else:
-                return jsonify({"error": "Période invalide"}), 400
+                load_from = load_to = None
+            rollups = load_kid_rollups(userId, kidIndex, load_from, load_to) if ranges else []
+
+            aggregates = {}
+            if "messages" in sections:
+                aggregates["messages"] = rollups_to_aggregate(
+                    rollups_in_range(rollups, messages_from, messages_to)
+                )
+            if "metrics" in sections:
+                aggregates["metrics"] = rollups_to_aggregate(
+                    rollups_in_range(rollups, metrics_from, metrics_to)
+                )
+
+            # Une seule résolution des métadonnées pour toutes les sections
+            quiz_ids = {str(g["_id"]) for a in aggregates.values() for g in a["quizzes"] if g["_id"]}
+            quizzes_dict = get_quizzes_metadata(list(quiz_ids)) if quiz_ids else {}
+
+            result, status = {}, 200
+            if "messages" in sections:
+                result["messages"], _ = build_messages_codes(
+                    userId, kidIndex, aggregates["messages"], quizzes_dict,
+                    messages_from, messages_to, period
+                )
+            if "metrics" in sections:
+                result["metrics"], _ = build_metrics(
+                    aggregates["metrics"], quizzes_dict, metrics_from, metrics_to
+                )
+            if "scores" in sections:
+                # Tranches calculées par MongoDB dans le fuseau de l'utilisateur
+                result["scores"], status = build_average_scores(
+                    userId, kidIndex, metrics_from, metrics_to, *scores_options(request.args)
+                )
+            return jsonify(result), status
+
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        
+    @staticmethod
+    def get_kids_metrics(userId):
+        """
+        Métriques de tous les enfants d'un compte : une requête ($in) sur les
+        agrégats quotidiens et une seule résolution des métadonnées.
+        """
+        try:
+            # Prénoms seulement : les historiques `quizes` des enfants ne sont pas lus
+            accounts = load_kid_names([userId])
+            if userId not in accounts:
+                return jsonify({"error": "Account not found"}), 404
+
+            kids = accounts[userId]
+            from_date, to_date = metrics_range(request.args)
+
+            rollups = load_kids_rollups(userId, kids.keys(), from_date, to_date)
+            aggregates = {kidIndex: rollups_to_aggregate(docs) for kidIndex, docs in rollups.items()}
+
+            quiz_ids = {str(g["_id"]) for a in aggregates.values() for g in a["quizzes"] if g["_id"]}
+            quizzes_dict = get_quizzes_metadata(list(quiz_ids)) if quiz_ids else {}
+
+            result = {}
+            for kidIndex, aggregate in aggregates.items():
+                metrics, _ = build_metrics(aggregate, quizzes_dict, from_date, to_date)
+                result[kidIndex] = {"name": kids[kidIndex], "metrics": metrics}
 
             return jsonify({
-                "labels": labels,
-                "data": data
-            })
+                "userID": userId,
+                "from": from_date.isoformat() if from_date else None,
+                "to": to_date.isoformat() if to_date else None,
+                "kids": result
+            }), 200
 
         except Exception as e:
             return jsonify({"error": str(e)}), 500
-        
+
     @staticmethod
     def get_grade_stats(userID, kidIndex):
         """Statistiques par niveau, matière et chapitre"""
@@ -359,8 +192,7 @@ class PerformanceController:
                 query["start_time__gte"] = from_date
                 query["start_time__lte"] = to_date
 
-            attempts_list = AttemptData.objects(**query)
-            kid_attempts = [a.to_mongo().to_dict() for a in attempts_list]
+            kid_attempts = find_attempts(**query)
             
             if not kid_attempts:
                 return jsonify({"message": "Aucune tentative trouvée"}), 200
@@ -372,164 +204,561 @@ class PerformanceController:
                 return jsonify({"message": "Aucun quizID valide trouvé"}), 200
             
             # Appeler l'API une seule fois avec tous les IDs
-            quizzes = Quiz.objects(id__in=quiz_ids).only('subject', 'chapter', 'grade')
-            quizzes_dict = {str(q.id): {"subject": q.subject, "chapter": q.chapter, "grade": q.grade} 
-                          for q in quizzes}
+            quizzes_dict = quiz_cache.get_many(quiz_ids)
             
-            grade_stats = {}
-            
-            for attempt in kid_attempts:
-                try:
-                    quiz_id = str(attempt.get("quizID", ""))
-                    if not quiz_id or quiz_id not in quizzes_dict:
-                        continue
-                        
-                    quiz_data = quizzes_dict[quiz_id]
-                    grade = quiz_data.get("grade", "Inconnu")
-                    subject = quiz_data.get("subject", "Inconnu")
-                    chapter = quiz_data.get("chapter", "Inconnu")
-                    
-                    score = float(attempt.get("score", 0))
-                    completed = 1 if attempt.get("completed", 0) == 1 else 0
-                    
-                    # Initialiser le niveau
-                    if grade not in grade_stats:
-                        grade_stats[grade] = {}
-                    
-                    # Initialiser la matière dans le niveau
-                    if subject not in grade_stats[grade]:
-                        grade_stats[grade][subject] = {
-                            "count": 0,
-                            "completed": 0,
-                            "total_score": 0.0,
-                            "average_score": 0.0,
-                            "chapters": {}
-                        }
-                    
-                    # Initialiser le chapitre dans la matière
-                    if chapter not in grade_stats[grade][subject]["chapters"]:
-                        grade_stats[grade][subject]["chapters"][chapter] = {
-                            "count": 0,
-                            "completed": 0,
-                            "total_score": 0.0,
-                            "average_score": 0.0
-                        }
-                    
-                    # Mettre à jour les statistiques de la matière
-                    subject_stats = grade_stats[grade][subject]
-                    subject_stats["count"] += 1
-                    subject_stats["completed"] += completed
-                    subject_stats["total_score"] += score
-                    
-                    # Mettre à jour les statistiques du chapitre
-                    chapter_stats = grade_stats[grade][subject]["chapters"][chapter]
-                    chapter_stats["count"] += 1
-                    chapter_stats["completed"] += completed
-                    chapter_stats["total_score"] += score
-                    
-                except (KeyError, TypeError, ValueError) as e:
-                    print(f"Erreur lors du traitement de l'attempt: {e}")
-                    continue
-            
-            # Calculer les moyennes finales
-            for grade in grade_stats:
-                for subject in grade_stats[grade]:
-                    subject_stats = grade_stats[grade][subject]
-                    
-                    # Calculer la moyenne pour la matière
-                    if subject_stats["count"] > 0:
-                        subject_stats["average_score"] = round(subject_stats["total_score"] / subject_stats["count"], 4)
-                    del subject_stats["total_score"]
-                    
-                    # Calculer les moyennes pour chaque chapitre
-                    for chapter in subject_stats["chapters"]:
-                        chapter_stats = subject_stats["chapters"][chapter]
-                        if chapter_stats["count"] > 0:
-                            chapter_stats["average_score"] = round(chapter_stats["total_score"] / chapter_stats["count"], 4)
-                        del chapter_stats["total_score"]
-            
-            return grade_stats
+            return grade_stats(kid_attempts, quizzes_dict)
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
 
+# ===== CONSTRUCTION DES RÉPONSES DU TABLEAU DE BORD =====
+
+DASHBOARD_SECTIONS = ("messages", "metrics", "scores")
+
+
+def messages_codes_range(args):
+    """Période des messages : dépend de `period` (week / month / from-to)."""
+    from_str = args.get("from")
+    to_str = args.get("to")
+    period = args.get("period", "week")
+
+    to_date = datetime.now(timezone.utc) if not to_str else parse_date(to_str)
+    if not to_date:
+        return None, None, period
+    from_date = (
+        to_date - timedelta(days=7) if period == "week" else
+        to_date - timedelta(days=30) if period == "month" else
+        (to_date - timedelta(days=60) if not from_str else parse_date(from_str))
+    )
+    return from_date, to_date, period
+
+
+def metrics_range(args):
+    """Période des métriques et des scores : from/to tels quels (optionnels)."""
+    from_str = args.get("from")
+    to_str = args.get("to")
+    from_date = parse_date(from_str) if from_str else None
+    to_date = parse_date(to_str) if to_str else None
+    return from_date, to_date
+
+
+def _naive_utc(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _day_start(value):
+    """Minuit du jour de `value` (dans son fuseau), ramené en UTC naïf."""
+    return _naive_utc(value.replace(hour=0, minute=0, second=0, microsecond=0))
+
+
+def rollups_in_range(rollups, from_date, to_date):
+    """Même filtre que load_kid_rollups, appliqué en mémoire."""
+    if not from_date or not to_date:
+        return rollups
+    start = _day_start(from_date)
+    end = _naive_utc(to_date)
+    return [doc for doc in rollups if start <= _naive_utc(doc["day"]) <= end]
+
+
+def resolve_quizzes(aggregate):
+    quiz_ids = [str(g["_id"]) for g in aggregate["quizzes"] if g["_id"]]
+    return get_quizzes_metadata(quiz_ids) if quiz_ids else {}
+
+
+def build_messages_codes(userId, kidIndex, aggregate, quizzes_dict, from_date, to_date, period):
+    if not aggregate["totals"]:
+        return {
+            "userID": userId,
+            "kidIndex": kidIndex,
+            "from": from_date.isoformat(),
+            "to": to_date.isoformat(),
+            "period": period,
+            "metrics": {
+                "engagement": (0, 7),
+                "time_spent": 0,
+                "streak": 0,
+                "completion_rate": (0, 0),
+                "abandon_rate": (0, 0),
+                "mastery": {},
+                "perseverance": {"retries": 0, "improved": 0},
+                "subject_balance": 0,
+                "recommendation": None
+            },
+            "achievements": ["NO_ACTIVITY"],
+            "alerts": [],
+            "recommendations": ["START_SMALL"]
+        }, 200
+
+    if not any(g["_id"] for g in aggregate["quizzes"]):
+        return {
+            "userID": userId,
+            "kidIndex": kidIndex,
+            "from": from_date.isoformat(),
+            "to": to_date.isoformat(),
+            "period": period,
+            "metrics": {
+                "engagement": (0, 7),
+                "time_spent": 0,
+                "streak": 0,
+                "completion_rate": (0, 0),
+                "abandon_rate": (0, 0),
+                "mastery": {},
+                "perseverance": {"retries": 0, "improved": 0},
+                "subject_balance": 0,
+                "recommendation": None
+            },
+            "achievements": ["FIRST_STEPS"],
+            "alerts": ["NO_COMPLETED"],
+            "recommendations": ["COMPLETE_ACTIVITY"]
+        }, 200
+
+    # --- Calcul des métriques ---
+    all_metrics = metrics_from_aggregate(aggregate, quizzes_dict, from_date, to_date)
+    metrics = {key: all_metrics[key] for key in MESSAGE_METRICS}
+
+    # === Génération des codes de messages ===
+    achievements, alerts, recommendations = [], [], []
+    days, total_days = metrics["engagement"]
+    engagement_rate = days / total_days if total_days > 0 else 0
+
+    # Engagement
+    if engagement_rate == 1.0:
+        achievements.append(f"ENGAGEMENT_HIGH")
+    elif engagement_rate >= 0.6:
+        achievements.append(f"ENGAGEMENT_GOOD")
+    elif engagement_rate >= 0.4:
+        achievements.append(f"ENGAGEMENT_AVERAGE")
+    else:
+        alerts.append(f"ENGAGEMENT_LOW")
+
+    # Streak
+    streak = metrics["streak"]
+    if period == "week":
+        if streak >= 7:
+            achievements.append("STREAK_WEEK_7")
+        elif streak >= 5:
+            achievements.append("STREAK_WEEK_5")
+        elif streak >= 3:
+            achievements.append("STREAK_WEEK_3")
+    elif period == "month":
+        if streak >= 21:
+            achievements.append("STREAK_MONTH_21")
+        elif streak >= 14:
+            achievements.append("STREAK_MONTH_14")
+        elif streak >= 7:
+            achievements.append("STREAK_MONTH_7")
+
+
+    # Completion
+    completed, started = metrics["completion_rate"]
+    if started > 0:
+        rate = completed / started
+        if rate >= 0.9:
+            achievements.append(f"COMPLETION_EXCELLENT")
+        elif rate >= 0.7:
+            achievements.append(f"COMPLETION_GOOD")
+        elif rate >= 0.5:
+            achievements.append(f"COMPLETION_AVERAGE")
+        if rate < 0.5 and started > 3:
+            alerts.append(f"COMPLETION_LOW_ALERT")
+
+    # Mastery
+    for subject, score in metrics["mastery"].items():
+        if score >= 0.9:
+            achievements.append(f"MASTERY_EXCELLENT_{subject}")
+        elif score >= 0.8:
+            achievements.append(f"MASTERY_GOOD_{subject}")
+        elif score >= 0.7:
+            achievements.append(f"MASTERY_AVERAGE_{subject}")
+        elif score < 0.5:
+            alerts.append(f"MASTERY_LOW_ALERT_{subject}")
+
+    # Abandon
+    abandoned = metrics["abandon_rate"][0]
+    if abandoned > 0:
+        alerts.append(f"ABANDON_ALERT")
+
+    # Perseverance
+    perseverance = metrics["perseverance"]
+    if perseverance["improved"] >= 5:
+        achievements.append(f"PERSEVERANCE_STRONG")
+    elif perseverance["improved"] >= 3:
+        achievements.append(f"PERSEVERANCE_GOOD")
+    elif perseverance["retries"] > 0:
+        achievements.append(f"PERSEVERANCE_RETRIES")
+
+    # Balance
+    balance = metrics["subject_balance"]
+    if balance < 40:
+        recommendations.append(f"BALANCE_LOW")
+    elif balance >= 80:
+        achievements.append(f"BALANCE_GOOD")
+
+    # Recommendation matière
+    if metrics["recommendation"] and metrics["recommendation"] != "Aucune":
+        recommendations.append(f"RECOMMEND_{metrics['recommendation']}")
+
+    # Temps passé
+    total_minutes = metrics["time_spent"]
+    if total_minutes >= 300:
+        achievements.append(f"TIME_HIGH")
+    elif total_minutes >= 180:
+        achievements.append(f"TIME_MEDIUM")
+    elif total_minutes > 0:
+        alerts.append(f"TIME_LOW")
+
+    # Inspiration
+    if period == "week":
+        achievements.append("INSPIRATION_WEEK")
+    elif period == "month":
+        achievements.append("INSPIRATION_MONTH")
+
+    # Valeurs par défaut
+    if not achievements:
+        achievements.append("DEFAULT_ACHIEVEMENT")
+    if not alerts:
+        alerts.append("DEFAULT_ALERT")
+    if not recommendations:
+        recommendations.append("DEFAULT_RECOMMENDATION")
+
+    return {
+        "userID": userId,
+        "kidIndex": kidIndex,
+        "from": from_date.isoformat(),
+        "to": to_date.isoformat(),
+        "period": period,
+        "metrics": metrics,
+        "achievements": achievements,
+        "alerts": alerts,
+        "recommendations": recommendations
+    }, 200
+
+
+def build_metrics(aggregate, quizzes_dict, from_date, to_date):
+    if not aggregate["totals"]:
+        return {"message": "Aucune tentative trouvée"}, 200
+
+    if not any(g["_id"] for g in aggregate["quizzes"]):
+        return {"message": "Aucun quizID valide trouvé"}, 200
+
+    return metrics_from_aggregate(aggregate, quizzes_dict, from_date, to_date), 200
+
+
+WEEKDAY_LABELS = ['Lun', 'Mar', 'Mer', 'Jeu', 'Ven', 'Sam', 'Dim']
+SCORE_GRANULARITIES = ("day", "week", "month")
+
+
+def scores_options(args):
+    """(period, granularity, tz) du graphique de scores"""
+    return (
+        args.get("period", "week"),
+        args.get("granularity"),
+        args.get("tz") or config.DEFAULT_TIMEZONE,
+    )
+
+
+def _bucket_label(day, granularity):
+    if granularity == "week":
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    if granularity == "month":
+        return day.strftime("%Y-%m")
+    return day.isoformat()
+
+
+def _series_labels(first_day, last_day, granularity):
+    """Libellés continus de first_day à last_day inclus (jours locaux)."""
+    labels = []
+    day = first_day
+    while day <= last_day:
+        label = _bucket_label(day, granularity)
+        if not labels or labels[-1] != label:
+            labels.append(label)
+        day += timedelta(days=1)
+    return labels
+
+
+def build_average_scores(userID, kidIndex, from_date, to_date, period, granularity=None, tz=None):
+    try:
+        zone = ZoneInfo(tz or config.DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return {"error": "Fuseau horaire invalide"}, 400
+
+    # Les dates sans fuseau sont en UTC (comme dans MongoDB)
+    local_from = _naive_utc(from_date).replace(tzinfo=timezone.utc).astimezone(zone)
+    local_to = _naive_utc(to_date).replace(tzinfo=timezone.utc).astimezone(zone)
+
+    if granularity:
+        if granularity not in SCORE_GRANULARITIES:
+            return {"error": "Granularité invalide"}, 400
+        labels = _series_labels(local_from.date(), local_to.date(), granularity)
+        buckets = {
+            _bucket_label(key.replace(tzinfo=timezone.utc).astimezone(zone).date(), granularity): bucket
+            for key, bucket in score_buckets(
+                userID, kidIndex, from_date, to_date, granularity, zone.key
+            ).items()
+        }
+
+    elif period == 'week':
+        labels = list(WEEKDAY_LABELS)
+        # $isoDayOfWeek : 1=Lundi, 7=Dimanche
+        buckets = {
+            labels[key - 1]: bucket
+            for key, bucket in score_buckets(userID, kidIndex, from_date, to_date, "weekday", zone.key).items()
+        }
+
+    elif period == 'month':
+        # Nombre de jours dans le mois de from_date (heure locale)
+        num_days = calendar.monthrange(local_from.year, local_from.month)[1]
+        labels = [str(d) for d in range(1, num_days + 1)]
+        buckets = {
+            str(key): bucket
+            for key, bucket in score_buckets(userID, kidIndex, from_date, to_date, "monthday", zone.key).items()
+        }
+
+    else:
+        return {"error": "Période invalide"}, 400
+
+    # Diviser par le max nombre d'essais pour normaliser
+    max_attempts = max((buckets[label]["count"] for label in labels if label in buckets), default=0) or 1
+    data = [
+        round(buckets[label]["score_sum"] / max_attempts, 2) if label in buckets else 0
+        for label in labels
+    ]
+
+    return {
+        "labels": labels,
+        "data": data
+    }, 200
+
+
+# ===== ACCUMULATEUR EN UNE PASSE =====
+
+class MetricsAccumulator:
+    """
+    Parcourt les tentatives une seule fois et produit toutes les métriques.
+    La matière / le niveau de chaque quiz ne sont résolus qu'une fois par quiz.
+    """
+
+    def __init__(self, quizzes_dict=None, from_date=None, to_date=None):
+        self.quizzes_dict = quizzes_dict or {}
+        self.from_date = from_date
+        self.to_date = to_date
+
+        self.total = 0
+        self.completed = 0
+        self.abandoned = 0
+        self.time_spent = 0
+        self.practice_days = set()
+        self.completed_days = set()
+
+        self.quizzes = {}     # quizID -> compteurs + matière / niveau résolus
+        self.subjects = {}    # matière -> compteurs (subject_stats, mastery)
+        self.grades = {}      # niveau -> matière -> chapitre (grade_stats)
+
+        # Persévérance : tentatives consécutives, triées par start_time
+        self.retries = 0
+        self.improved = 0
+        self._attempts = []       # références seulement (tri de secours)
+        self._previous = None
+        self._in_order = True
+
+    def consume(self, attempts):
+        for attempt in attempts:
+            self.add(attempt)
+        return self
+
+    def add(self, attempt):
+        get = attempt.get
+        completed = get("completed", 0) == 1
+        start_time = get("start_time")
+        quiz_id = get("quizID")
+        score = get("score", 0)
+
+        self.total += 1
+        if completed:
+            self.completed += 1
+            self.completed_days.add(start_time.date())
+        if get("abandoned") == 1:
+            self.abandoned += 1
+        duration = get("duration")
+        if duration and get("timeout") != 1:
+            self.time_spent += duration
+        if self.from_date and self.to_date and self.from_date <= start_time <= self.to_date:
+            self.practice_days.add(start_time.date())
+
+        key = str(quiz_id)
+        quiz = self.quizzes.get(key) or self._quiz_entry(key)
+        quiz["count"] += 1
+        if get("failed") == 1:
+            quiz["failed"] += 1
+
+        subject = quiz["subject"]
+        subject["count"] += 1
+        if completed:
+            subject["completed"] += 1
+        if get("score") is not None:
+            subject["score_sum"] += score
+            subject["scored"] += 1
+
+        if quiz["grade_key"]:
+            self._add_grade(quiz, completed, score)
+
+        # Persévérance : calcul au fil de l'eau tant que l'entrée est triée
+        current = (start_time, quiz_id, score, get("aborted", 0))
+        previous = self._previous
+        if previous is not None and self._in_order:
+            if start_time < previous[0]:
+                self._in_order = False
+            elif previous[1] == quiz_id and (previous[3] == 1 or previous[2] < 0.5):
+                self.retries += 1
+                if score - previous[2] >= 0.2:
+                    self.improved += 1
+        self._previous = current
+        self._attempts.append(attempt)
+
+    def _quiz_entry(self, key):
+        quiz_data = self.quizzes_dict.get(key)
+        subject = quiz_data.get("subject", "Inconnu") if quiz_data else "Inconnu"
+        quiz = self.quizzes[key] = {
+            "count": 0,
+            "failed": 0,
+            "subject": self.subjects.setdefault(
+                subject, {"count": 0, "completed": 0, "score_sum": 0, "scored": 0}
+            ),
+            "grade_key": (
+                quiz_data.get("grade", "Inconnu"),
+                quiz_data.get("subject", "Inconnu"),
+                quiz_data.get("chapter", "Inconnu"),
+            ) if key and key in self.quizzes_dict else None,
+            "grade_entries": None,
+        }
+        return quiz
+
+    def _add_grade(self, quiz, completed, score):
+        try:
+            score = float(score)
+        except (TypeError, ValueError) as e:
+            print(f"Erreur lors du traitement de l'attempt: {e}")
+            return
+
+        if quiz["grade_entries"] is None:
+            grade, subject, chapter = quiz["grade_key"]
+            subject_entry = self.grades.setdefault(grade, {}).setdefault(subject, {
+                "count": 0, "completed": 0, "total_score": 0.0, "chapters": {}
+            })
+            chapter_entry = subject_entry["chapters"].setdefault(chapter, {
+                "count": 0, "completed": 0, "total_score": 0.0
+            })
+            quiz["grade_entries"] = (subject_entry, chapter_entry)
+
+        for entry in quiz["grade_entries"]:
+            entry["count"] += 1
+            entry["completed"] += 1 if completed else 0
+            entry["total_score"] += score
+
+    def _count_retry(self, previous, current):
+        if previous[1] == current[1] and (previous[3] == 1 or previous[2] < 0.5):
+            self.retries += 1
+            if current[2] - previous[2] >= 0.2:
+                self.improved += 1
+
+    # --- Résultats ---
+
+    def engagement(self):
+        if not self.from_date or not self.to_date:
+            return 0, 0
+        total_days = (self.to_date.date() - self.from_date.date()).days + 1
+        return len(self.practice_days), total_days
+
+    def streak(self):
+        return longest_consecutive_days(self.completed_days)
+
+    def completion_rate(self):
+        return self.completed, self.total
+
+    def abandon_rate(self):
+        return self.abandoned, self.total
+
+    def perseverance(self):
+        if not self._in_order:
+            # Tri stable : même ordre que sorted(attempts, key=start_time)
+            self._attempts.sort(key=lambda a: a.get("start_time"))
+            history = [
+                (a.get("start_time"), a.get("quizID"), a.get("score", 0), a.get("aborted", 0))
+                for a in self._attempts
+            ]
+            self.retries = self.improved = 0
+            for i in range(1, len(history)):
+                self._count_retry(history[i-1], history[i])
+            self._previous, self._in_order = history[-1], True
+
+        return {
+            "retries": self.retries,
+            "improved": self.improved,
+            "perseverance_score": min(100, self.improved * 20)
+        }
+
+    def persistent_failures(self):
+        return {key: quiz["failed"] for key, quiz in self.quizzes.items() if quiz["failed"] >= 3}
+
+    def subject_stats(self):
+        stats = {}
+        for subject, entry in self.subjects.items():
+            stats[subject] = {"count": entry["count"], "completed": entry["completed"], "average_score": 0}
+            if entry["count"] > 0 and entry["score_sum"] > 0:
+                stats[subject]["average_score"] = entry["score_sum"] / entry["count"]
+        return stats
+
+    def mastery(self):
+        return {
+            subject: entry["score_sum"] / entry["scored"]
+            for subject, entry in self.subjects.items()
+            if entry["scored"] > 20 and entry["score_sum"] / entry["scored"] >= 0.7
+        }
+
+    def grade_stats(self):
+        def averaged(entry):
+            average = round(entry["total_score"] / entry["count"], 4) if entry["count"] > 0 else 0.0
+            return {"count": entry["count"], "completed": entry["completed"], "average_score": average}
+
+        return {
+            grade: {
+                subject: {
+                    **averaged(entry),
+                    "chapters": {chapter: averaged(c) for chapter, c in entry["chapters"].items()}
+                }
+                for subject, entry in subjects.items()
+            }
+            for grade, subjects in self.grades.items()
+        }
+
+    def metrics(self):
+        """Même structure que metrics_from_aggregate"""
+        kid_subject_stats = self.subject_stats()
+        return {
+            "engagement": self.engagement(),
+            "time_spent": self.time_spent,
+            "streak": self.streak(),
+            "completion_rate": self.completion_rate(),
+            "abandon_rate": self.abandon_rate(),
+            "mastery": self.mastery(),
+            "perseverance": self.perseverance(),
+            "persistent_failures": self.persistent_failures(),
+            "subject_stats": kid_subject_stats,
+            "subject_balance": calculate_balance_score(kid_subject_stats),
+            "recommendation": recommend_subject(kid_subject_stats),
+            "grade_stats": self.grade_stats()
+        }
+
+
 # ===== FONCTIONS UTILITAIRES =====
 
 def grade_stats(attempts, quizzes_dict):
     """Statistiques par niveau, matière et chapitre"""
-    grade_stats = {}
-    
-    for attempt in attempts:
-        try:
-            quiz_id = str(attempt.get("quizID", ""))
-            if not quiz_id or quiz_id not in quizzes_dict:
-                continue
-                
-            quiz_data = quizzes_dict[quiz_id]
-            grade = quiz_data.get("grade", "Inconnu")
-            subject = quiz_data.get("subject", "Inconnu")
-            chapter = quiz_data.get("chapter", "Inconnu")
-            
-            score = float(attempt.get("score", 0))
-            completed = 1 if attempt.get("completed", 0) == 1 else 0
-            
-            # Initialiser le niveau
-            if grade not in grade_stats:
-                grade_stats[grade] = {}
-            
-            # Initialiser la matière dans le niveau
-            if subject not in grade_stats[grade]:
-                grade_stats[grade][subject] = {
-                    "count": 0,
-                    "completed": 0,
-                    "total_score": 0.0,
-                    "average_score": 0.0,
-                    "chapters": {}
-                }
-            
-            # Initialiser le chapitre dans la matière
-            if chapter not in grade_stats[grade][subject]["chapters"]:
-                grade_stats[grade][subject]["chapters"][chapter] = {
-                    "count": 0,
-                    "completed": 0,
-                    "total_score": 0.0,
-                    "average_score": 0.0
-                }
-            
-            # Mettre à jour les statistiques de la matière
-            subject_stats = grade_stats[grade][subject]
-            subject_stats["count"] += 1
-            subject_stats["completed"] += completed
-            subject_stats["total_score"] += score
-            
-            # Mettre à jour les statistiques du chapitre
-            chapter_stats = grade_stats[grade][subject]["chapters"][chapter]
-            chapter_stats["count"] += 1
-            chapter_stats["completed"] += completed
-            chapter_stats["total_score"] += score
-            
-        except (KeyError, TypeError, ValueError) as e:
-            print(f"Erreur lors du traitement de l'attempt: {e}")
-            continue
-    
-    # Calculer les moyennes finales
-    for grade in grade_stats:
-        for subject in grade_stats[grade]:
-            subject_stats = grade_stats[grade][subject]
-            
-            # Calculer la moyenne pour la matière
-            if subject_stats["count"] > 0:
-                subject_stats["average_score"] = round(subject_stats["total_score"] / subject_stats["count"], 4)
-            del subject_stats["total_score"]
-            
-            # Calculer les moyennes pour chaque chapitre
-            for chapter in subject_stats["chapters"]:
-                chapter_stats = subject_stats["chapters"][chapter]
-                if chapter_stats["count"] > 0:
-                    chapter_stats["average_score"] = round(chapter_stats["total_score"] / chapter_stats["count"], 4)
-                del chapter_stats["total_score"]
-    
-    return grade_stats
+    return MetricsAccumulator(quizzes_dict).consume(attempts).grade_stats()
 
 def parse_date(date_str):
     """Parse une date string en objet datetime avec gestion d'erreurs"""
@@ -542,35 +771,22 @@ def calculate_engagement(attempts, from_date, to_date):
     """Nombre de jours de pratique entre from_date et to_date inclus."""
     if not from_date or not to_date:
         return 0, 0
-        
-    practice_days = set()
-
-    for attempt in attempts:
-        start_time = attempt["start_time"]
-        if from_date <= start_time <= to_date:
-            practice_days.add(start_time.date())
-
-    total_days = (to_date.date() - from_date.date()).days + 1
-    return len(practice_days), total_days
+    return MetricsAccumulator(from_date=from_date, to_date=to_date).consume(attempts).engagement()
 
 def calculate_streak(attempts):
     """
     Calcule le nombre maximum de jours consécutifs avec au moins un quiz complété.
     """
-    if not attempts:
-        return 0
+    return MetricsAccumulator().consume(attempts).streak()
 
-    # Extraire les dates des tentatives complétées
-    completed_days = set()
-    for a in attempts:
-        if a.get("completed", 0) == 1:
-            completed_days.add(a["start_time"].date())
 
-    if not completed_days:
+def longest_consecutive_days(days):
+    """Plus longue suite de jours consécutifs dans un ensemble de dates."""
+    if not days:
         return 0
 
     # Trier les dates
-    sorted_days = sorted(completed_days)
+    sorted_days = sorted(days)
 
     max_streak = 1
     current_streak = 1
@@ -586,70 +802,23 @@ def calculate_streak(attempts):
     
 def calculate_completion_rate(attempts):
     """Taux de complétion des quiz"""
-    if not attempts:
-        return 0, 0
-        
-    completed = sum(1 for a in attempts if a.get("completed") == 1)
-    total = len(attempts)
-    return completed, total
+    return MetricsAccumulator().consume(attempts).completion_rate()
 
 def calculate_perseverance(attempts):
     """Retourne les statistiques de persévérance"""
-    if not attempts or len(attempts) < 2:
-        return {"retries": 0, "improved": 0, "perseverance_score": 0}
-        
-    sorted_attempts = sorted(attempts, key=lambda x: x["start_time"])
-    
-    retries = 0
-    improved = 0
-    
-    for i in range(1, len(sorted_attempts)):
-        prev = sorted_attempts[i-1]
-        current = sorted_attempts[i]
-        
-        if prev["quizID"] == current["quizID"]:
-            if prev.get("aborted", 0) == 1 or prev.get("score", 0) < 0.5:
-                retries += 1
-                if  current.get("score", 0) - prev.get("score", 0) >= 0.2 :
-                    improved += 1
-    
-    return {
-        "retries": retries,
-        "improved": improved,
-        "perseverance_score": min(100, improved * 20)
-    }
+    return MetricsAccumulator().consume(attempts).perseverance()
 
 def abandonment_rate(attempts):
     """Taux d'abandon des quiz"""
-    if not attempts:
-        return 0, 0
-        
-    total = len(attempts)
-    abandoned = sum(1 for a in attempts if a.get("abandoned") == 1)
-    return abandoned, total
+    return MetricsAccumulator().consume(attempts).abandon_rate()
 
 def total_time_spent(attempts):
     """Temps total passé sur les quiz (en minutes)"""
-    if not attempts:
-        return 0
-        
-    total_time = 0
-    for a in attempts:
-        if a.get("timeout") != 1 and a.get("duration"):
-            total_time += a.get("duration")
-    return total_time  # minutes
+    return MetricsAccumulator().consume(attempts).time_spent  # minutes
 
 def persistent_failures(attempts):
     """Quiz échoués de manière persistante (≥ 3 fois)"""
-    if not attempts:
-        return {}
-        
-    failed_quizzes = {}
-    for a in attempts:
-        if a.get("failed") == 1 :
-            quiz_id = str(a.get("quizID"))
-            failed_quizzes[quiz_id] = failed_quizzes.get(quiz_id, 0) + 1
-    return {k: v for k, v in failed_quizzes.items() if v >= 3}
+    return MetricsAccumulator().consume(attempts).persistent_failures()
 
 def calculate_balance_score(subject_stats):
     """Score basé sur la répartition des attempts entre les matières"""
@@ -676,60 +845,122 @@ def get_subject_from_quiz(attempt, quizzes_dict):
 
 def subject_stats(attempts, quizzes_dict):
     """Statistiques par matière"""
-    subject_stats = {}
-    score_accumulator = {}
+    return MetricsAccumulator(quizzes_dict).consume(attempts).subject_stats()
 
-    for attempt in attempts:
-        subject = get_subject_from_quiz(attempt, quizzes_dict)
+def calculate_mastery(attempts, quizzes_dict):
+    """Sujets maîtrisés (score moyen > 70%)"""
+    return MetricsAccumulator(quizzes_dict).consume(attempts).mastery()
 
-        if subject not in subject_stats:
-            subject_stats[subject] = {"count": 0, "completed": 0, "average_score": 0}
-            score_accumulator[subject] = 0
 
-        subject_stats[subject]["count"] += 1
-        if attempt.get("completed", 0) == 1:
-            subject_stats[subject]["completed"] += 1
-        if attempt.get("score") is not None:
-            score_accumulator[subject] += attempt.get("score", 0)
+# ===== MÉTRIQUES À PARTIR DES GROUPES =====
 
-    for subject, stats in subject_stats.items():
-        if stats["count"] > 0 and score_accumulator.get(subject, 0) > 0:
-            stats["average_score"] = score_accumulator[subject] / stats["count"]
-    
-    return subject_stats
+MESSAGE_METRICS = (
+    "engagement", "time_spent", "streak", "completion_rate", "abandon_rate",
+    "mastery", "perseverance", "subject_balance", "recommendation"
+)
 
-def calculate_mastery(attempts, quizzes_dict):
-    """Sujets maîtrisés (score moyen > 70%)"""
-    subject_scores = {}
 
-    for attempt in attempts:
-        subject = get_subject_from_quiz(attempt, quizzes_dict)
-        if attempt.get("score") is not None:
-            subject_scores.setdefault(subject, []).append(attempt.get("score", 0))
+def metrics_from_aggregate(aggregate, quizzes_dict, from_date, to_date):
+    """
+    Assemble les métriques à partir d'une structure {"totals", "days", "quizzes"}
+    (voir services.kid_rollups.rollups_to_aggregate).
+    """
+    totals = aggregate["totals"][0]
+    day_groups = [g for g in aggregate["days"] if g["_id"]]
+    quiz_groups = [g for g in aggregate["quizzes"] if g["_id"]]
+
+    if from_date and to_date:
+        engagement = (len(day_groups), (to_date.date() - from_date.date()).days + 1)
+    else:
+        engagement = (0, 0)
 
-    mastery = {
-        subject: sum(scores) / len(scores)
-        for subject, scores in subject_scores.items()
-        if len(scores) > 20 and sum(scores) / len(scores) >= 0.7
+    completed_days = {
+        datetime.strptime(g["_id"], "%Y-%m-%d").date() for g in day_groups if g["completed"]
     }
-    return mastery
 
+    kid_subject_stats = subject_stats_from_groups(quiz_groups, quizzes_dict)
+    retries, improved = totals["retries"], totals["improved"]
+    if totals["total"] < 2:
+        retries = improved = 0
 
+    return {
+        "engagement": engagement,
+        "time_spent": totals["time_spent"],
+        "streak": longest_consecutive_days(completed_days),
+        "completion_rate": (totals["completed"], totals["total"]),
+        "abandon_rate": (totals["abandoned"], totals["total"]),
+        "mastery": mastery_from_groups(quiz_groups, quizzes_dict),
+        "perseverance": {
+            "retries": retries,
+            "improved": improved,
+            "perseverance_score": min(100, improved * 20)
+        },
+        "persistent_failures": {str(g["_id"]): g["failed"] for g in quiz_groups if g["failed"] >= 3},
+        "subject_stats": kid_subject_stats,
+        "subject_balance": calculate_balance_score(kid_subject_stats),
+        "recommendation": recommend_subject(kid_subject_stats),
+        "grade_stats": grade_stats_from_groups(quiz_groups, quizzes_dict)
+    }
 
 
+def subject_stats_from_groups(quiz_groups, quizzes_dict):
+    """subject_stats à partir des groupes par quiz"""
+    stats, score_accumulator = {}, {}
+    for group in quiz_groups:
+        subject = get_subject_from_quiz({"quizID": group["_id"]}, quizzes_dict)
+        entry = stats.setdefault(subject, {"count": 0, "completed": 0, "average_score": 0})
+        entry["count"] += group["count"]
+        entry["completed"] += group["completed"]
+        score_accumulator[subject] = score_accumulator.get(subject, 0) + group["score_sum"]
 
+    for subject, entry in stats.items():
+        if entry["count"] > 0 and score_accumulator[subject] > 0:
+            entry["average_score"] = score_accumulator[subject] / entry["count"]
+    return stats
 
-import requests
 
-def get_quizzes_metadata(quiz_ids):
-    url = "http://48.216.249.114:8080/api/getquizesmetadata"
-    payload = {"quizIds": quiz_ids}
-    
-    try:
-        response = requests.post(url, json=payload)
-        response.raise_for_status()  # Lève une erreur si statut != 200
-        quizzes_dict = response.json()  # Ton dictionnaire comme dans l'exemple
-        return quizzes_dict
-    except requests.exceptions.RequestException as e:
-        print("Erreur API:", e)
-        return {}  # Retourne un dict vide en cas d'erreur
+def mastery_from_groups(quiz_groups, quizzes_dict):
+    """calculate_mastery à partir des groupes par quiz"""
+    totals = {}
+    for group in quiz_groups:
+        subject = get_subject_from_quiz({"quizID": group["_id"]}, quizzes_dict)
+        count, score_sum = totals.get(subject, (0, 0))
+        totals[subject] = (count + group["count"], score_sum + group["score_sum"])
+
+    return {
+        subject: score_sum / count
+        for subject, (count, score_sum) in totals.items()
+        if count > 20 and score_sum / count >= 0.7
+    }
+
+
+def grade_stats_from_groups(quiz_groups, quizzes_dict):
+    """grade_stats à partir des groupes par quiz"""
+    stats = {}
+    for group in quiz_groups:
+        quiz_data = quizzes_dict.get(str(group["_id"]))
+        if not quiz_data:
+            continue
+        grade = quiz_data.get("grade", "Inconnu")
+        subject = quiz_data.get("subject", "Inconnu")
+        chapter = quiz_data.get("chapter", "Inconnu")
+
+        subject_entry = stats.setdefault(grade, {}).setdefault(subject, {
+            "count": 0, "completed": 0, "total_score": 0.0, "average_score": 0.0, "chapters": {}
+        })
+        chapter_entry = subject_entry["chapters"].setdefault(chapter, {
+            "count": 0, "completed": 0, "total_score": 0.0, "average_score": 0.0
+        })
+        for entry in (subject_entry, chapter_entry):
+            entry["count"] += group["count"]
+            entry["completed"] += group["completed"]
+            entry["total_score"] += float(group["score_sum"])
+
+    for subjects in stats.values():
+        for subject_entry in subjects.values():
+            entries = [subject_entry, *subject_entry["chapters"].values()]
+            for entry in entries:
+                if entry["count"] > 0:
+                    entry["average_score"] = round(entry["total_score"] / entry["count"], 4)
+                del entry["total_score"]
+    return stats
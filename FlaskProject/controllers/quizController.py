@@ -1,4 +1,9 @@
 from models.quiz import Quiz
+from models.attempt import QUIZ_FIELDS
+from services.quiz_cache import quiz_cache
+from services.leaderboard import restamp_quiz
+from services.quiz_fields import stamp_quiz_fields
+from services.pagination import iter_documents, keyset_page, MAX_PAGE_SIZE
 from bson import ObjectId
 from bson.errors import InvalidId
 
@@ -19,7 +24,11 @@ def create_quiz(data):
         return {"error": str(e)}, 400
 
 
-def get_all_quizzes():
+def get_all_quizzes(after=None, limit=None, stream=False):
+    if stream:
+        return iter_documents(Quiz.objects, mongo_to_dict, after, limit), 200
+    if after or limit:
+        return keyset_page(Quiz.objects, mongo_to_dict, after, limit or MAX_PAGE_SIZE), 200
     quizzes = Quiz.objects()
     return [mongo_to_dict(q) for q in quizzes], 200
 
@@ -48,6 +57,13 @@ def update_quiz(quiz_id, data):
 
     try:
         quiz.update(**data)
+        quiz_cache.invalidate(quiz_id)
+        if any(field in data for field in QUIZ_FIELDS):
+            # Garder les métadonnées recopiées sur les tentatives à jour
+            quiz.reload(*QUIZ_FIELDS)
+            fields = {field: quiz[field] for field in QUIZ_FIELDS}
+            stamp_quiz_fields(quiz.id, fields)
+            restamp_quiz(quiz.id, fields)
         return {"message": "Quiz updated"}, 200
     except Exception as e:
         return {"error": str(e)}, 400
@@ -64,6 +80,10 @@ def delete_quiz(quiz_id):
         return {"error": "Quiz not found"}, 404
 
     quiz.delete()
+    quiz_cache.invalidate(quiz_id)
+    # Tentatives du quiz supprimé : exclues des statistiques, comme sans quiz connu
+    stamp_quiz_fields(quiz.id, {})
+    restamp_quiz(quiz.id, {})
     return {"message": "Quiz deleted"}, 200
 
 
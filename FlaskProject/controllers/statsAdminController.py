@@ -1,186 +1,193 @@
 from flask import jsonify, request
-from controllers.accountController import get_kids_names
-from models.attempt import AttemptData
-import requests
-from datetime import datetime, timedelta
-from collections import defaultdict
-
-
-# ---------- API pour récupérer les métadonnées des quiz ----------
-def get_quizzes_metadata(quiz_ids):
-    url = "http://48.216.249.114:8080/api/getquizesmetadata"
-    payload = {"quizIds": quiz_ids}
-    
-    try:
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-        quizzes_dict = response.json()
-        return quizzes_dict
-    except requests.exceptions.RequestException as e:
-        print("Erreur API:", e)
-        return {}
-
-# ---------- Filtrage global ----------
-def filter_attempts(grade=None, subject=None, period=7):
-    since = datetime.now() - timedelta(days=period)
-    query = {"start_time__gte": since}
-    attempts_queryset = AttemptData.objects(**query)
-    attempts = [a.to_mongo().to_dict() for a in attempts_queryset]
-
-    # Récupérer métadonnées quiz
-    quiz_ids = list(set(str(a.get("quizID")) for a in attempts if a.get("quizID")))
-    quizzes = get_quizzes_metadata(quiz_ids)
-
-    # Appliquer filtres quiz
-    if grade:
-        quizzes = {k: v for k, v in quizzes.items() if str(v.get("grade")) == grade}
-    if subject:
-        quizzes = {k: v for k, v in quizzes.items() if str(v.get("subject")) == subject}
-
-    # Garde uniquement les attempts dont le quiz est encore dans quizzes
-    attempts = [a for a in attempts if str(a.get("quizID")) in quizzes]
-
-    return attempts, quizzes
-
-
-# ---------- Stats globales ----------
-def stats_overview(attempts):
-    student_pairs = set()
-    for a in attempts:
-        user_id = a.get("userID")
-        kid_index = a.get("kidIndex")
-        if user_id is not None and kid_index is not None:
-            student_pairs.add((user_id, kid_index))
-
-    total_students = len(student_pairs)
-    total_attempts = len(attempts)
-    scores = [a.get("score") for a in attempts if a.get("score") is not None]
-    average_score = (sum(scores) / len(scores)) if scores else 0
-    times = [a.get("duration") for a in attempts if a.get("duration") is not None]
-    average_time = (sum(times) / total_students) if total_students else 0
-
-    return {
-        "total_students": total_students,
-        "total_attempts": total_attempts,
-        "average_score": average_score,
-        "average_time": average_time
-    }
-
-
-# ---------- Stats par niveau/matière/chapitre ----------
-def stats_grades(attempts, quizzes_dict):
-    grade_stats = {}
-    for attempt in attempts:
-        try:
-            quiz_id = str(attempt.get("quizID", ""))
-            if not quiz_id or quiz_id not in quizzes_dict:
-                continue
-
-            quiz_data = quizzes_dict[quiz_id]
-            grade = quiz_data.get("grade", "Inconnu")
-            subject = quiz_data.get("subject", "Inconnu")
-            chapter = quiz_data.get("chapter", "Inconnu")
-
-            score = float(attempt.get("score", 0))
-            completed = 1 if attempt.get("completed", 0) == 1 else 0
-
-            if grade not in grade_stats:
-                grade_stats[grade] = {}
-            if subject not in grade_stats[grade]:
-                grade_stats[grade][subject] = {
-                    "count": 0,
-                    "completed": 0,
-                    "total_score": 0.0,
-                    "average_score": 0.0,
-                    "chapters": {}
-                }
-            if chapter not in grade_stats[grade][subject]["chapters"]:
-                grade_stats[grade][subject]["chapters"][chapter] = {
-                    "count": 0,
-                    "completed": 0,
-                    "total_score": 0.0,
-                    "average_score": 0.0
-                }
-
-            # Update stats
-            subject_stats = grade_stats[grade][subject]
-            subject_stats["count"] += 1
-            subject_stats["completed"] += completed
-            subject_stats["total_score"] += score
+import config
+from models.attempt import QUIZ_FIELDS, stamped_quiz
+from services.attempt_repository import iter_attempts
+from services.quiz_metadata import get_quizzes_metadata
+from services.stats_snapshots import DISTINCT_MODES, read_stats
+from services.hll import HyperLogLog, STANDARD_ERROR
+from services.leaderboard import leaderboard_page, resolve_window, student_rank
+from services.pagination import MAX_PAGE_SIZE
+from datetime import datetime, timedelta, timezone
+from itertools import islice
 
-            chapter_stats = subject_stats["chapters"][chapter]
-            chapter_stats["count"] += 1
-            chapter_stats["completed"] += completed
-            chapter_stats["total_score"] += score
+DEFAULT_LEADERBOARD_SIZE = 100
 
-        except (KeyError, TypeError, ValueError) as e:
-            print(f"Erreur lors du traitement: {e}")
-            continue
 
-    # Moyennes finales
-    for grade in grade_stats:
-        for subject in grade_stats[grade]:
-            subject_stats = grade_stats[grade][subject]
-            if subject_stats["count"] > 0:
-                subject_stats["average_score"] = round(subject_stats["total_score"] / subject_stats["count"], 4)
-            del subject_stats["total_score"]
+# ---------- Flux de tentatives (mémoire bornée) ----------
+STREAM_BATCH_SIZE = 1000
+STREAM_FIELDS = ("userID", "kidIndex", "quizID", "duration", "score", "completed", *QUIZ_FIELDS)
 
-            for chapter in subject_stats["chapters"]:
-                chapter_stats = subject_stats["chapters"][chapter]
-                if chapter_stats["count"] > 0:
-                    chapter_stats["average_score"] = round(chapter_stats["total_score"] / chapter_stats["count"], 4)
-                del chapter_stats["total_score"]
 
-    return grade_stats
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
 
 
-def summary_by_grade(attempts, quizzes_dict):
+def iter_filtered_attempts(grade=None, subject=None, period=7, batch_size=STREAM_BATCH_SIZE):
     """
-    Retourne un résumé par grade :
-    {
-        "Grade X": {
-            "total_students": N,
-            "total_attempts": M
-        },
-        ...
-    }
+    Génère (tentative, métadonnées du quiz) lot par lot depuis un curseur
+    projeté : seuls un lot et les métadonnées des quiz rencontrés sont en mémoire.
+    Les métadonnées sont celles recopiées sur la tentative ; elles ne sont
+    résolues (get_quizzes_metadata) que pour les tentatives non renseignées.
+    Les filtres grade / subject portent sur les champs recopiés (index).
+    """
+    since = datetime.now() - timedelta(days=period)
+    query = {"start_time__gte": since}
+    if grade:
+        query["grade"] = grade
+    if subject:
+        query["subject"] = subject
+
+    quizzes = {}   # quiz_id -> métadonnées, None si inconnu
+    cursor = iter_attempts(STREAM_FIELDS, **query).batch_size(batch_size)
+    for batch in _batches(cursor, batch_size):
+        stamped = [stamped_quiz(a) for a in batch]
+        missing = {
+            str(a["quizID"]) for a, quiz in zip(batch, stamped) if quiz is None and a.get("quizID")
+        } - quizzes.keys()
+        if missing:
+            found = get_quizzes_metadata(list(missing))
+            quizzes.update({quiz_id: found.get(quiz_id) for quiz_id in missing})
+        for attempt, quiz in zip(batch, stamped):
+            if quiz is None:
+                quiz = quizzes.get(str(attempt.get("quizID")))
+            if quiz is not None:
+                yield attempt, quiz
+
+
+# ---------- Accumulateur en une passe ----------
+class AdminStatsAccumulator:
+    """
+    overview / grade_stats / summary_by_grade calculés tentative par tentative :
+    la mémoire dépend du nombre de groupes (niveau, matière, chapitre) et
+    d'élèves distincts, pas du nombre de tentatives. En mode "approx", les
+    élèves distincts sont comptés par HyperLogLog (mémoire constante).
     """
-    summary = {}
-    students_by_grade = {}
 
-    for attempt in attempts:
+    def __init__(self, distinct="exact"):
+        if distinct not in DISTINCT_MODES:
+            raise ValueError(f"distinct must be one of {', '.join(DISTINCT_MODES)}")
+        self.distinct = distinct
+        self.students = self._new_students()
+        self.total_attempts = 0
+        self.scored = 0
+        self.scored_sum = 0
+        self.duration_sum = 0
+        self._grade_stats = {}
+        self._summary = {}
+        self._students_by_grade = {}
+
+    def _new_students(self):
+        return HyperLogLog() if self.distinct == "approx" else set()
+
+    def _add_student(self, students, user_id, kid_index):
+        if self.distinct == "approx":
+            students.add(user_id, kid_index)
+        else:
+            students.add((user_id, kid_index))
+
+    def _count(self, students):
+        return students.count() if self.distinct == "approx" else len(students)
+
+    def add(self, attempt, quiz=None):
+        """Ajoute une tentative ; `quiz` (métadonnées) alimente les stats par niveau."""
+        user_id = attempt.get("userID")
+        kid_index = attempt.get("kidIndex")
+        has_student = user_id is not None and kid_index is not None
+
+        # Stats globales
+        self.total_attempts += 1
+        if has_student:
+            self._add_student(self.students, user_id, kid_index)
+        if attempt.get("score") is not None:
+            self.scored += 1
+            self.scored_sum += attempt["score"]
+        if attempt.get("duration") is not None:
+            self.duration_sum += attempt["duration"]
+
+        if quiz is None:
+            return
+        grade = quiz.get("grade", "Inconnu")
+
+        # Résumé par niveau
+        summary = self._summary.setdefault(grade, {"total_students": 0, "total_attempts": 0})
+        summary["total_attempts"] += 1
+        grade_students = self._students_by_grade.setdefault(grade, self._new_students())
+        if has_student:
+            self._add_student(grade_students, user_id, kid_index)
+
+        # Stats par niveau/matière/chapitre (tentative ignorée si son score est invalide)
         try:
-            quiz_id = str(attempt.get("quizID", ""))
-            if not quiz_id or quiz_id not in quizzes_dict:
-                continue
-
-            grade = quizzes_dict[quiz_id].get("grade", "Inconnu")
-
-            if grade not in summary:
-                summary[grade] = {
-                    "total_students": 0,
-                    "total_attempts": 0
+            score = float(attempt.get("score", 0))
+        except (TypeError, ValueError):
+            return
+        completed = 1 if attempt.get("completed", 0) == 1 else 0
+        subject_stats = self._grade_stats.setdefault(grade, {}).setdefault(quiz.get("subject", "Inconnu"), {
+            "count": 0, "completed": 0, "total_score": 0.0, "chapters": {}
+        })
+        chapter_stats = subject_stats["chapters"].setdefault(quiz.get("chapter", "Inconnu"), {
+            "count": 0, "completed": 0, "total_score": 0.0
+        })
+        for stats in (subject_stats, chapter_stats):
+            stats["count"] += 1
+            stats["completed"] += completed
+            stats["total_score"] += score
+
+    def consume(self, pairs):
+        """Consomme un flux de (tentative, métadonnées du quiz)."""
+        for attempt, quiz in pairs:
+            self.add(attempt, quiz)
+        return self
+
+    def overview(self):
+        total_students = self._count(self.students)
+        return {
+            "total_students": total_students,
+            "total_attempts": self.total_attempts,
+            "average_score": (self.scored_sum / self.scored) if self.scored else 0,
+            "average_time": (self.duration_sum / total_students) if total_students else 0,
+        }
+
+    def grade_stats(self):
+        def averaged(stats):
+            return {
+                "count": stats["count"],
+                "completed": stats["completed"],
+                "average_score": round(stats["total_score"] / stats["count"], 4) if stats["count"] else 0.0,
+            }
+
+        return {
+            grade: {
+                subject: {
+                    **averaged(subject_stats),
+                    "chapters": {chapter: averaged(stats) for chapter, stats in subject_stats["chapters"].items()},
                 }
-                students_by_grade[grade] = set()
-
-            # incrémenter total_attempts
-            summary[grade]["total_attempts"] += 1
+                for subject, subject_stats in subjects.items()
+            }
+            for grade, subjects in self._grade_stats.items()
+        }
 
-            # stocker l'élève unique
-            user_id = attempt.get("userID")
-            kid_index = attempt.get("kidIndex")
-            if user_id is not None and kid_index is not None:
-                students_by_grade[grade].add((user_id, kid_index))
+    def summary_by_grade(self):
+        return {
+            grade: {**summary, "total_students": self._count(self._students_by_grade[grade])}
+            for grade, summary in self._summary.items()
+        }
 
-        except Exception as e:
-            print(f"Erreur lors du traitement: {e}")
-            continue
+    def result(self):
+        return {
+            "overview": self.overview(),
+            "grade_stats": self.grade_stats(),
+            "summary_by_grade": self.summary_by_grade(),
+            "distinct": {"mode": self.distinct, "standard_error": round(STANDARD_ERROR, 4) if self.distinct == "approx" else 0},
+            "refreshedAt": datetime.now(timezone.utc).isoformat(),
+        }
 
-    # calcul final des total_students
-    for grade, students in students_by_grade.items():
-        summary[grade]["total_students"] = len(students)
 
-    return summary
+def stream_stats(grade=None, subject=None, period=7, distinct="exact", batch_size=STREAM_BATCH_SIZE):
+    """Statistiques admin calculées en direct sur les tentatives, en flux."""
+    accumulator = AdminStatsAccumulator(distinct)
+    return accumulator.consume(iter_filtered_attempts(grade, subject, period, batch_size)).result()
 
 
 # ---------- Route unique ----------
@@ -188,74 +195,64 @@ def stats_all():
     grade = request.args.get('grade')
     subject = request.args.get('subject')
     period = int(request.args.get('period', 7))
+    distinct = request.args.get('distinct', config.STATS_DISTINCT_MODE)
+    source = request.args.get('source', 'snapshots')
 
-    # Filtrage unique
-    attempts, quizzes = filter_attempts(grade, subject, period)
+    try:
+        if source == 'live':
+            # Calcul direct sur les tentatives, en flux (mémoire bornée)
+            return jsonify(stream_stats(grade, subject, period, distinct))
+        if source != 'snapshots':
+            raise ValueError("source must be one of snapshots, live")
+        # Agrégats matérialisés (stats_snapshots), rafraîchis en arrière-plan
+        return jsonify(read_stats(grade, subject, period, distinct))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    # Calculs
-    overview = stats_overview(attempts)
-    grade_stats_data = stats_grades(attempts, quizzes)
 
-    return jsonify({
-        "overview": overview,
-        "grade_stats": grade_stats_data,
-        "summary_by_grade": summary_by_grade(attempts, quizzes)
-    })
+# ---------- Leaderboard (meilleur score par quiz, tenu à jour incrémentalement) ----------
 
+def _leaderboard_args():
+    """(fenêtre, grade, subject) ; lève ValueError si la fenêtre est invalide."""
+    window = resolve_window(request.args.get('window'), request.args.get('period'))
+    return window, request.args.get('grade') or None, request.args.get('subject') or None
 
-# ---------- fonctions pour leaderboard avec meilleurs scores par quiz ----------
 
 def get_unique_students_from_attempts():
-    """Récupère tous les enfants distincts à partir des attempts filtrés avec leur score total"""
-    
-    grade = request.args.get('grade')
-    subject = request.args.get('subject')
-    period = int(request.args.get('period', 7))
-
-    # Filtrage unique
-    attempts, quizzes = filter_attempts(grade, subject, period)
-
-    # D'abord, organiser les attempts par étudiant et par quiz
-    student_quiz_scores = {}
-    
-    for attempt in attempts:
-        user_id = attempt.get("userID")
-        kid_index = attempt.get("kidIndex")
-        quiz_id = str(attempt.get("quizID", ""))
-        score = attempt.get("score", 0)
-        
-        if user_id is not None and kid_index is not None and quiz_id:
-            student_key = (user_id, kid_index)
-            
-            if student_key not in student_quiz_scores:
-                student_quiz_scores[student_key] = {}
-            
-            # Garder le meilleur score pour chaque quiz
-            if quiz_id not in student_quiz_scores[student_key] or score > student_quiz_scores[student_key][quiz_id]:
-                student_quiz_scores[student_key][quiz_id] = score
-    
-    # Maintenant calculer le score total pour chaque étudiant
-    student_scores = []
-    
-    for student_key, quiz_scores in student_quiz_scores.items():
-        user_id, kid_index = student_key
-        total_score = sum(quiz_scores.values())
-        quiz_count = len(quiz_scores)
-        average_score = total_score / quiz_count if quiz_count > 0 else 0
-        
-        student_scores.append({
-            "userID": user_id,
-            "kidIndex": kid_index,
-            "kidName": get_kids_names(user_id)[0][kid_index],
-            "total_score": round(total_score,2),
-            "quiz_count": quiz_count,
-            "average_score": round(average_score, 2),
-            "quiz_scores": quiz_scores  # Dictionnaire {quiz_id: meilleur_score}
-        })
-
-        student_scores = sorted(student_scores, key=lambda x: x["total_score"], reverse=True)
-
-    
-    return student_scores
-
-   
\ No newline at end of file
+    """
+    Classement des enfants : ?window=week|month|all (ou ?period=jours), ?limit,
+    ?after=<curseur X-Next-After de la page précédente>
+    """
+    try:
+        window, grade, subject = _leaderboard_args()
+        limit = int(request.args.get('limit', DEFAULT_LEADERBOARD_SIZE))
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        rows, total, next_after = leaderboard_page(
+            window, grade, subject, limit=limit, after=request.args.get('after')
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    response = jsonify(rows)
+    response.headers["X-Total-Count"] = str(total)
+    if next_after:
+        response.headers["X-Next-After"] = next_after
+    return response
+
+
+def get_student_rank():
+    """Rang d'un enfant : ?userID=&kidIndex= (+ mêmes filtres que le classement)"""
+    user_id = request.args.get('userID')
+    kid_index = request.args.get('kidIndex')
+    if not user_id or kid_index is None:
+        return jsonify({"error": "userID and kidIndex are required"}), 400
+    try:
+        window, grade, subject = _leaderboard_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    row = student_rank(window, user_id, kid_index, grade, subject)
+    if row is None:
+        return jsonify({"error": "Student not ranked"}), 404
+    return jsonify(row), 200
@@ -35,13 +35,31 @@ class Answer(DynamicEmbeddedDocument):
     duration = IntField(min_value=0, default=0)              # durée totale (s)
 
 
-    
+
+# Champs du quiz recopiés sur chaque tentative
+QUIZ_FIELDS = ("grade", "subject", "chapter")
+# Tentatives dont les champs du quiz sont renseignés (recopiés à la création ou
+# par backfill-attempt-quiz-fields, effacés à la suppression du quiz)
+STAMPED_QUERY = {"$or": [{field: {"$ne": None}} for field in QUIZ_FIELDS]}
+
+
+def stamped_quiz(attempt):
+    """Métadonnées {grade, subject, chapter} recopiées sur la tentative, ou None."""
+    quiz = {field: attempt[field] for field in QUIZ_FIELDS if attempt.get(field) is not None}
+    return quiz or None
+
+
 class AttemptData(Document):
     # Contexte utilisateur
     userID = StringField(required=True)                               # ID parent/tuteur
     kidIndex = StringField(required=True)                             # index ou identifiant de l’enfant
     quizID = ObjectIdField(required=True)                             # référence au quiz
 
+    # Métadonnées du quiz recopiées à la création (filtres admin indexés)
+    grade = StringField()
+    subject = StringField()
+    chapter = StringField()
+
     # Global timing
     start_time = DateTimeField()                                      # début du quiz
     end_time = DateTimeField()                                        # fin du quiz
@@ -61,6 +79,8 @@ class AttemptData(Document):
     completed = IntField(default=0)                                  
     aborted = IntField(default=0) 
     timeout = IntField(default=0) 
+    timeout_sweep = ObjectIdField()                                   # balayage timeout en attente d'agrégation
+    rollup_pending = ListField(StringField())                         # agrégats en échec à rejouer ("leaderboard", "kid_daily_stats")
 
     # Appareil
     deviceType = StringField()                                        # mobile / desktop / tablet
@@ -75,7 +95,34 @@ class AttemptData(Document):
     meta = {
         'collection': 'attemptsdata',
         'ordering': ['-start_time'],
-        'indexes': ['userID', 'kidIndex', 'quizID'],
+        'indexes': [
+            'quizID',
+            # Tableaux de bord parent : (userID, kidIndex) + plage de dates
+            ('userID', 'kidIndex', 'start_time'),
+            # Statistiques admin : plage sur start_time seule
+            'start_time',
+            # Statistiques admin filtrées par niveau / matière
+            ('grade', 'subject', 'start_time'),
+            ('subject', 'start_time'),
+            # Tentatives modifiées depuis le dernier rafraîchissement (stats_snapshots)
+            'updatedAt',
+            # Tentatives encore ouvertes (balayage des timeouts)
+            {
+                'fields': ['start_time'],
+                'name': 'open_attempts_start_time',
+                'partialFilterExpression': {'completed': 0, 'failed': 0, 'aborted': 0, 'timeout': 0},
+            },
+            # Tentatives balayées en attente d'agrégation (kid_daily_stats)
+            {
+                'fields': ['timeout_sweep'],
+                'partialFilterExpression': {'timeout_sweep': {'$exists': True}},
+            },
+            # Agrégats en échec à rejouer (retry_pending_rollups)
+            {
+                'fields': ['rollup_pending'],
+                'partialFilterExpression': {'rollup_pending': {'$exists': True}},
+            },
+        ],
         "strict": False  
     }
 
@@ -93,3 +140,19 @@ class AttemptData(Document):
         return super(AttemptData, self).save(*args, **kwargs)
 
 
+# =========================
+# Compteur de tentatives par (enfant, quiz)
+# =========================
+class AttemptCounter(Document):
+    userID = StringField(required=True)
+    kidIndex = StringField(required=True)
+    quizID = ObjectIdField(required=True)
+    count = IntField(default=0)                                       # nb de tentatives démarrées
+
+    meta = {
+        'collection': 'attemptcounters',
+        'indexes': [
+            {'fields': ['userID', 'kidIndex', 'quizID'], 'unique': True},
+        ],
+        "strict": False
+    }
@@ -0,0 +1,18 @@
+from mongoengine import Document, StringField, ObjectIdField, IntField, DateTimeField
+from datetime import datetime, timezone
+
+
+class JobCheckpoint(Document):
+    """Point de reprise d'un traitement par lots (dernier _id traité)."""
+    name = StringField(required=True, unique=True)
+    last_id = ObjectIdField()
+    processed = IntField(default=0)
+    updatedAt = DateTimeField(default=lambda: datetime.now(timezone.utc))
+    # Bail des jobs planifiés (services/job_lease.py)
+    lockedBy = StringField()
+    lockedUntil = DateTimeField()
+
+    meta = {
+        'collection': 'jobcheckpoints',
+        "strict": False
+    }
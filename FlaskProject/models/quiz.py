@@ -64,7 +64,11 @@ class Quiz(Document):
 
     meta = {
         'collection': 'quizesdata',
-        'indexes': ['key'],
+        'indexes': [
+            'key',
+            # Index couvrant pour la résolution des métadonnées (services/quiz_metadata.py)
+            {'fields': ['_id', 'subject', 'chapter', 'grade'], 'name': 'quiz_metadata'},
+        ],
         'ordering': ['-createdAt'],
         "strict": False  # ✅ ignore les champs inconnus comme __v
 
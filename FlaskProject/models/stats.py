@@ -0,0 +1,114 @@
+# stats.py
+from mongoengine import *
+
+
+# =========================
+# Agrégat quotidien par enfant et par matière
+# =========================
+class KidDailyStats(Document):
+    userID = StringField(required=True)
+    kidIndex = StringField(required=True)
+    day = DateTimeField(required=True)                                # minuit UTC du jour de start_time
+    subject = StringField(required=True)
+
+    # Tentatives terminées ce jour-là
+    count = IntField(default=0)
+    completed = IntField(default=0)
+    failed = IntField(default=0)
+    aborted = IntField(default=0)
+    timeout = IntField(default=0)
+    score_sum = FloatField(default=0.0)
+    duration = IntField(default=0)                                    # hors timeouts (s)
+
+    # Persévérance : comparaison avec la tentative précédente de l'enfant
+    retries = IntField(default=0)
+    improved = IntField(default=0)
+
+    # Détail par quiz : {quizID: {count, completed, failed, score_sum}}
+    quizzes = DictField()
+
+    meta = {
+        'collection': 'kid_daily_stats',
+        'indexes': [
+            {'fields': ['userID', 'kidIndex', 'day', 'subject'], 'unique': True},
+        ],
+        "strict": False
+    }
+
+
+# =========================
+# Statistiques admin matérialisées par jour, niveau, matière et chapitre
+# =========================
+class StatsSnapshot(Document):
+    day = DateTimeField(required=True)                                # minuit UTC du jour de start_time
+    grade = StringField()
+    subject = StringField()
+    chapter = StringField()
+
+    attempts = IntField(default=0)
+    completed = IntField(default=0)
+    score_sum = FloatField(default=0.0)                               # score absent compté 0 (stats par niveau)
+    scored = IntField(default=0)                                      # tentatives avec un score (score moyen global)
+    scored_sum = FloatField(default=0.0)
+    duration_sum = IntField(default=0)
+
+    # Élèves distincts du groupe : [{userID, kidIndex}]
+    students = ListField(DictField())
+    # Sketch HyperLogLog des mêmes élèves (services/hll.py), pour le mode approx
+    students_hll = BinaryField()
+
+    refreshedAt = DateTimeField()
+    runId = StringField()                                             # passage de refresh_stats_snapshots qui l'a écrit
+
+    meta = {
+        'collection': 'stats_snapshots',
+        'indexes': [
+            # Clé du $merge (services/stats_snapshots.py)
+            {'fields': ['day', 'grade', 'subject', 'chapter'], 'unique': True},
+        ],
+        "strict": False
+    }
+
+
+# =========================
+# Classement : meilleur score par (fenêtre, élève, quiz)
+# =========================
+class StudentQuizBest(Document):
+    window = StringField(required=True)                               # "all", "week:AAAA-MM-JJ" (lundi), "month:AAAA-MM"
+    userID = StringField(required=True)
+    kidIndex = StringField(required=True)
+    quizID = ObjectIdField(required=True)
+    grade = StringField()
+    subject = StringField()
+    best = FloatField(default=0.0)
+
+    meta = {
+        'collection': 'leaderboard_bests',
+        'indexes': [
+            {'fields': ['window', 'userID', 'kidIndex', 'quizID'], 'unique': True},
+        ],
+        "strict": False
+    }
+
+
+# =========================
+# Classement : total des meilleurs scores par (fenêtre, niveau, matière, élève)
+# =========================
+class LeaderboardEntry(Document):
+    window = StringField(required=True)
+    grade = StringField(required=True)                                # "*" = tous les niveaux
+    subject = StringField(required=True)                              # "*" = toutes les matières
+    userID = StringField(required=True)
+    kidIndex = StringField(required=True)
+    total_score = FloatField(default=0.0)
+    quiz_count = IntField(default=0)
+
+    meta = {
+        'collection': 'leaderboard_entries',
+        'indexes': [
+            {'fields': ['window', 'grade', 'subject', 'userID', 'kidIndex'], 'unique': True},
+            # Pages du classement et calcul du rang : parcours de l'index, sans tri en mémoire
+            {'fields': ['window', 'grade', 'subject', '-total_score', 'userID', 'kidIndex'], 'name': 'leaderboard_rank'},
+        ],
+        "strict": False
+    }
@@ -1,4 +1,5 @@
 from flask import Blueprint, redirect, render_template, request, jsonify, session, url_for
+from services.pagination import parse_page_args, wants_ndjson, ndjson_response
 from controllers.accountController import (
     create_account,
     get_all_accounts,
@@ -19,7 +20,15 @@ def create_account_route():
 
 @accounts_bp.route("/get-all", methods=["GET"])
 def get_all_accounts_route():
-    response, status = get_all_accounts()
+    try:
+        after, limit = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    stream = wants_ndjson(request)
+    response, status = get_all_accounts(after, limit, stream)
+    if stream:
+        return ndjson_response(response), status
     return jsonify(response), status
 
 
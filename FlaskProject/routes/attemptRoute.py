@@ -1,9 +1,10 @@
 from flask import Blueprint, request, jsonify
+from services.pagination import parse_page_args, wants_ndjson, ndjson_response
 from datetime import datetime, timedelta, timezone
 from controllers.attemptController import (
-    create_attempt, update_attempt, abandon_attempt,
+    create_attempt, update_attempt, update_attempts_batch, abandon_attempt,
     recalculate_scores, get_all_attempts, get_attempt_by_id,
-    get_attempts_per_kid, get_attempts_per_week, get_attempts_per_month
+    get_attempts_in_range
 )
 
 attempts_bp = Blueprint("attemptsdata", __name__)
@@ -23,6 +24,13 @@ def update_attempt_route():
     return jsonify(response), status
 
 
+@attempts_bp.route("/update-attempt/batch", methods=["POST"])
+def update_attempt_batch_route():
+    data = request.get_json()
+    response, status = update_attempts_batch(data)
+    return jsonify(response), status
+
+
 @attempts_bp.route("/attempts/abandon", methods=["POST"])
 def abandon_attempt_route():
     data = request.get_json()
@@ -32,13 +40,25 @@ def abandon_attempt_route():
 
 @attempts_bp.route("/attempts/recalculate_scores", methods=["POST"])
 def recalculate_scores_route():
-    response, status = recalculate_scores()
+    batch_size = request.args.get("batch_size", 500, type=int)
+    max_batches = request.args.get("max_batches", type=int)
+    resume = request.args.get("resume", "false").lower() in ("1", "true", "yes")
+    rebuild = request.args.get("rebuild", "true").lower() in ("1", "true", "yes")
+    response, status = recalculate_scores(batch_size, resume, max_batches, rebuild)
     return jsonify(response), status
 
 
 @attempts_bp.route("/attempts", methods=["GET"])
 def get_all_attempts_route():
-    response, status = get_all_attempts()
+    try:
+        after, limit = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    stream = wants_ndjson(request)
+    response, status = get_all_attempts(after, limit, stream)
+    if stream:
+        return ndjson_response(response), status
     return jsonify(response), status
 
 
@@ -55,7 +75,7 @@ def get_attempts_per_kid_route(user_id, kid_index):
     to_date = datetime.now(timezone.utc) if not to_str else datetime.fromisoformat(to_str)
     from_date = to_date - timedelta(days=7) if not from_str else datetime.fromisoformat(from_str)
 
-    response, status = get_attempts_per_kid(user_id, kid_index, from_date, to_date)
+    response, status = get_attempts_in_range(user_id, kid_index, from_date, to_date, inclusive_end=True)
     return jsonify(response), status
 
 
@@ -65,7 +85,7 @@ def get_attempts_per_week_route(user_id, kid_index, week_str):
     start_date = datetime.fromisocalendar(year, week_num, 1).replace(tzinfo=timezone.utc)
     end_date = (datetime.fromisocalendar(year, week_num, 7) + timedelta(days=1)).replace(tzinfo=timezone.utc)
 
-    response, status = get_attempts_per_week(user_id, kid_index, start_date, end_date)
+    response, status = get_attempts_in_range(user_id, kid_index, start_date, end_date)
     return jsonify(response), status
 
 
@@ -81,5 +101,5 @@ def get_attempts_per_month_route(user_id, kid_index, month_str):
     else:
         end_date = datetime(year, month + 1, 1, tzinfo=timezone.utc)
 
-    response, status = get_attempts_per_month(user_id, kid_index, start_date, end_date)
+    response, status = get_attempts_in_range(user_id, kid_index, start_date, end_date)
     return jsonify(response), status
@@ -1,18 +1,31 @@
 from flask import Blueprint, jsonify, request
 from controllers.performanceController import PerformanceController
+from services.response_cache import cached_kid_response
 
 performance_bp = Blueprint("performance", __name__)
 
 @performance_bp.route("/user/<userId>/kid/<kidIndex>/messages-codes", methods=["GET"])
+@cached_kid_response
 def messages_codes(userId, kidIndex):
     return PerformanceController.get_messages_codes(userId, kidIndex)
 
 @performance_bp.route("/user/<userId>/kid/<kidIndex>/metrics", methods=["GET"])
+@cached_kid_response
 def metrics(userId, kidIndex):
     return PerformanceController.get_metrics(userId, kidIndex)
 
 @performance_bp.route("/user/<userId>/kid/<kidIndex>/scores", methods=["GET"])
+@cached_kid_response
 def weekly_scores(userId, kidIndex):
     return PerformanceController.get_average_scores(userId, kidIndex)
 
 
+
+@performance_bp.route("/user/<userId>/kid/<kidIndex>/dashboard", methods=["GET"])
+@cached_kid_response
+def dashboard(userId, kidIndex):
+    return PerformanceController.get_dashboard(userId, kidIndex)
+
+@performance_bp.route("/user/<userId>/kids/metrics", methods=["GET"])
+def kids_metrics(userId):
+    return PerformanceController.get_kids_metrics(userId)
@@ -1,4 +1,5 @@
 from flask import Blueprint, request, jsonify
+from services.pagination import parse_page_args, wants_ndjson, ndjson_response
 from controllers.quizController import (
     create_quiz,
     get_all_quizzes,
@@ -21,7 +22,15 @@ def create_quiz_route():
 
 @quiz_bp.route("/", methods=["GET"])
 def get_all_quizzes_route():
-    response, status = get_all_quizzes()
+    try:
+        after, limit = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    stream = wants_ndjson(request)
+    response, status = get_all_quizzes(after, limit, stream)
+    if stream:
+        return ndjson_response(response), status
     return jsonify(response), status
 
 
@@ -0,0 +1,63 @@
+# attempt_repository.py
+"""
+Lecture des tentatives pour les statistiques : documents bruts (as_pymongo)
+limités aux champs de premier niveau, sans hydrater `answers` en
+Answer / QuestionAttempt ni repasser par to_mongo().to_dict().
+Les séries de scores sont regroupées côté serveur ($group), dans le fuseau
+horaire de l'utilisateur.
+"""
+from models.attempt import AttemptData
+from services.kid_rollups import TERMINAL_QUERY
+
+# Champs lus par les métriques (performanceController, statsAdminController)
+ANALYTICS_FIELDS = (
+    "userID", "kidIndex", "quizID",
+    "start_time", "duration", "score",
+    "completed", "failed", "aborted", "timeout",
+)
+
+
+def iter_attempts(fields=ANALYTICS_FIELDS, **query):
+    """Tentatives filtrées par `query` (syntaxe mongoengine), en dicts bruts."""
+    return AttemptData.objects(**query).only(*fields).as_pymongo()
+
+
+def find_attempts(fields=ANALYTICS_FIELDS, **query):
+    return list(iter_attempts(fields, **query))
+
+
+# Clés de regroupement de score_buckets, évaluées par MongoDB dans le fuseau demandé
+def _bucket_key(unit, timezone):
+    date = {"date": "$start_time", "timezone": timezone}
+    return {
+        "weekday": {"$isoDayOfWeek": date},   # 1 = lundi … 7 = dimanche
+        "monthday": {"$dayOfMonth": date},    # 1 … 31
+        "day": {"$dateTrunc": {**date, "unit": "day"}},
+        "week": {"$dateTrunc": {**date, "unit": "week", "startOfWeek": "monday"}},
+        "month": {"$dateTrunc": {**date, "unit": "month"}},
+    }[unit]
+
+
+def score_buckets(userID, kidIndex, from_date, to_date, unit, timezone="UTC"):
+    """
+    Somme des scores et nombre de tentatives terminées d'un enfant, par tranche
+    (`unit`) : un document par tranche, quel que soit le nombre de tentatives.
+    Retourne {clé de tranche: {"score_sum", "count"}}.
+    """
+    pipeline = [
+        {"$match": {
+            "userID": userID,
+            "kidIndex": kidIndex,
+            "start_time": {"$gte": from_date, "$lte": to_date},
+            **TERMINAL_QUERY,
+        }},
+        {"$group": {
+            "_id": _bucket_key(unit, timezone),
+            "score_sum": {"$sum": {"$ifNull": ["$score", 0]}},
+            "count": {"$sum": 1},
+        }},
+    ]
+    return {
+        group.pop("_id"): group
+        for group in AttemptData._get_collection().aggregate(pipeline)
+    }
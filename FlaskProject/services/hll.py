@@ -0,0 +1,69 @@
+# hll.py
+"""
+HyperLogLog : estimation du nombre d'élèves distincts en mémoire constante.
+
+Un sketch occupe M = 2^P octets (4 Ko pour P = 12) quel que soit le nombre
+d'élèves ; l'union de deux ensembles est le maximum registre par registre,
+sans perte, ce qui permet de fusionner à la demande les sketches par jour et
+par niveau stockés dans stats_snapshots.
+
+Erreur : écart type relatif 1.04 / sqrt(M) ≈ 1.6 % pour P = 12 (≈ 3.3 % dans
+95 % des cas) ; en dessous de 2.5 * M élèves (≈ 10 000), la correction par
+comptage linéaire rend l'estimation quasi exacte.
+"""
+import math
+from hashlib import blake2b
+
+import numpy as np
+
+P = 12
+M = 1 << P
+STANDARD_ERROR = 1.04 / math.sqrt(M)
+
+_ALPHA = 0.7213 / (1 + 1.079 / M)
+_RANK_BITS = 64 - P
+
+
+def _hash(user_id, kid_index):
+    return int.from_bytes(blake2b(f"{user_id}:{kid_index}".encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    def __init__(self, registers=None):
+        # bytearray : accès registre rapide dans add(), vue NumPy pour merge() / count()
+        self.registers = bytearray(M) if registers is None else bytearray(registers)
+
+    @classmethod
+    def of_students(cls, students):
+        """Sketch d'une liste [{userID, kidIndex}] (champ students des snapshots)."""
+        sketch = cls()
+        for student in students:
+            if student.get("userID") is not None and student.get("kidIndex") is not None:
+                sketch.add(student["userID"], student["kidIndex"])
+        return sketch
+
+    def add(self, user_id, kid_index):
+        h = _hash(user_id, kid_index)
+        index = h >> _RANK_BITS
+        rank = _RANK_BITS - (h & ((1 << _RANK_BITS) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """Union : `other` est un HyperLogLog ou des registres sérialisés (bytes)."""
+        registers = other.registers if isinstance(other, HyperLogLog) else other
+        mine = np.frombuffer(self.registers, dtype=np.uint8)
+        np.maximum(mine, np.frombuffer(registers, dtype=np.uint8), out=mine)
+        return self
+
+    def count(self):
+        registers = np.frombuffer(self.registers, dtype=np.uint8)
+        estimate = _ALPHA * M * M / np.sum(np.ldexp(1.0, -registers.astype(np.int32)))
+        zeros = int(np.count_nonzero(registers == 0))
+        if estimate <= 2.5 * M and zeros:
+            # Petites cardinalités : comptage linéaire
+            estimate = M * math.log(M / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return bytes(self.registers)
@@ -0,0 +1,126 @@
+# indexes.py
+"""
+Création des index déclarés dans les modèles et vérification des plans
+d'exécution (explain) pour chaque forme de requête des contrôleurs.
+"""
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from models.attempt import AttemptData, AttemptCounter
+from models.job import JobCheckpoint
+from models.quiz import Quiz
+from models.stats import KidDailyStats, LeaderboardEntry, StatsSnapshot, StudentQuizBest
+from services.kid_rollups import TERMINAL_QUERY
+from services.leaderboard import RANK_SORT
+from services.pagination import after_filter
+
+MODELS = [AttemptData, AttemptCounter, Quiz, JobCheckpoint, KidDailyStats, StatsSnapshot,
+          StudentQuizBest, LeaderboardEntry]
+
+# Étapes refusées dans un plan gagnant
+REJECTED_STAGES = {"COLLSCAN", "AND_SORTED", "AND_HASH"}
+
+# Index retirés des modèles, supprimés des bases existantes par ensure_indexes
+OBSOLETE_INDEXES = {AttemptData: ["userID_1_kidIndex_1_createdAt_1"]}
+
+
+def _query_shapes():
+    """(nom, collection, filtre, tri) — une entrée par forme de requête utilisée."""
+    now = datetime.now(timezone.utc)
+    week_ago = now - timedelta(days=7)
+    kid = {"userID": "explain-user", "kidIndex": "0"}
+    attempts = AttemptData._get_collection()
+    return [
+        ("attempt by id", attempts, {"_id": ObjectId()}, None),
+        ("kid attempts by start_time", attempts,
+         {**kid, "start_time": {"$gte": week_ago, "$lte": now}}, [("start_time", -1)]),
+        ("kid attempts (no range)", attempts, dict(kid), [("start_time", -1)]),
+        ("kid score buckets", attempts,
+         {**kid, "start_time": {"$gte": week_ago, "$lte": now}, **TERMINAL_QUERY}, None),
+        ("admin attempts by start_time", attempts,
+         {"start_time": {"$gte": week_ago}}, [("start_time", -1)]),
+        ("admin attempts by grade and subject", attempts,
+         {"grade": "1", "subject": "math", "start_time": {"$gte": week_ago}}, [("start_time", -1)]),
+        ("admin attempts by subject", attempts,
+         {"subject": "math", "start_time": {"$gte": week_ago}}, [("start_time", -1)]),
+        ("attempts of a quiz (metadata copy)", attempts, {"quizID": ObjectId()}, None),
+        ("open attempts timeout sweep", attempts,
+         {"completed": 0, "failed": 0, "aborted": 0, "timeout": 0, "start_time": {"$lt": week_ago}}, None),
+        ("sweep rollup pending", attempts, {"timeout_sweep": ObjectId()}, None),
+        ("failed rollups to retry", attempts, {"rollup_pending": "kid_daily_stats"}, None),
+        ("attempts changed since snapshot", attempts, {"updatedAt": {"$gte": week_ago}}, None),
+        ("kid daily stats", KidDailyStats._get_collection(),
+         {**kid, "day": {"$gte": week_ago, "$lte": now}}, None),
+        ("stats snapshots by day", StatsSnapshot._get_collection(),
+         {"day": {"$gte": week_ago}, "grade": "1"}, None),
+        ("leaderboard best score", StudentQuizBest._get_collection(),
+         {"window": "all", **kid, "quizID": ObjectId()}, None),
+        ("leaderboard page", LeaderboardEntry._get_collection(),
+         {"window": "all", "grade": "*", "subject": "*"}, [("total_score", -1), ("userID", 1), ("kidIndex", 1)]),
+        ("leaderboard next page (after)", LeaderboardEntry._get_collection(),
+         {"window": "all", "grade": "*", "subject": "*",
+          **after_filter(RANK_SORT, [1.0, "explain-user", "0"])}, RANK_SORT),
+        ("attempt counter", AttemptCounter._get_collection(),
+         {**kid, "quizID": ObjectId()}, None),
+        ("quizzes by id", Quiz._get_collection(), {"_id": {"$in": [ObjectId()]}}, None),
+    ]
+
+
+def _covered_shapes():
+    """Requêtes qui doivent rester couvertes par un index (aucun FETCH)."""
+    from services.quiz_metadata import METADATA_FIELDS, METADATA_INDEX
+
+    return [
+        ("quiz metadata (covered)", Quiz._get_collection(), {"_id": {"$in": [ObjectId()]}},
+         {"_id": 1, **{field: 1 for field in METADATA_FIELDS}}, METADATA_INDEX),
+        ("leaderboard scope scores (covered)", LeaderboardEntry._get_collection(),
+         {"window": "all", "grade": "*", "subject": "*"}, {"_id": 0, "total_score": 1}, "leaderboard_rank"),
+    ]
+
+
+def ensure_indexes():
+    """Crée les index déclarés dans meta['indexes'] ; retourne {collection: [noms]}."""
+    created = {}
+    for model in MODELS:
+        model.ensure_indexes()
+        collection = model._get_collection()
+        existing = collection.index_information()
+        for name in OBSOLETE_INDEXES.get(model, []):
+            if name in existing:
+                collection.drop_index(name)
+        created[collection.name] = sorted(collection.index_information())
+    return created
+
+
+def _plan_stages(plan):
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("queryPlan", "inputStage"):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+def verify_query_plans():
+    """
+    Exécute explain() sur chaque forme de requête.
+    Retourne une liste de (nom, étapes, ok).
+    """
+    results = []
+    for name, collection, query, sort in _query_shapes():
+        cursor = collection.find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = cursor.explain()
+        stages = list(_plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {})))
+        results.append((name, stages, not REJECTED_STAGES.intersection(stages)))
+
+    for name, collection, query, projection, hint in _covered_shapes():
+        explain = collection.find(query, projection).hint(hint).explain()
+        stages = list(_plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {})))
+        results.append((name, stages, "FETCH" not in stages and "COLLSCAN" not in stages))
+    return results
@@ -0,0 +1,49 @@
+# job_lease.py
+"""
+Bail (verrou à durée limitée) des traitements planifiés, stocké dans
+jobcheckpoints : un seul processus exécute le job à la fois, même si plusieurs
+workers lancent leur scheduler. Le bail expire seul si son détenteur meurt.
+"""
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from models.job import JobCheckpoint
+
+
+def _name(job):
+    return f"{job}:lease"
+
+
+def acquire(job, owner, seconds):
+    """Prend le bail de `job` pour `owner` ; False s'il est détenu par un autre et non expiré."""
+    now = datetime.now(timezone.utc)
+    try:
+        lease = JobCheckpoint._get_collection().find_one_and_update(
+            {"name": _name(job), "$or": [{"lockedUntil": None}, {"lockedUntil": {"$lt": now}}]},
+            {"$set": {"lockedBy": owner, "lockedUntil": now + timedelta(seconds=seconds)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # Le document existe et le bail est détenu (index unique sur name)
+        return False
+    return lease["lockedBy"] == owner
+
+
+def renew(job, owner, seconds):
+    """Prolonge le bail ; False si `owner` l'a perdu (expiré puis repris)."""
+    now = datetime.now(timezone.utc)
+    result = JobCheckpoint._get_collection().update_one(
+        {"name": _name(job), "lockedBy": owner},
+        {"$set": {"lockedUntil": now + timedelta(seconds=seconds)}},
+    )
+    return result.matched_count == 1
+
+
+def release(job, owner):
+    JobCheckpoint._get_collection().update_one(
+        {"name": _name(job), "lockedBy": owner},
+        {"$set": {"lockedBy": None, "lockedUntil": None}},
+    )
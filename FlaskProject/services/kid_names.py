@@ -0,0 +1,88 @@
+# kid_names.py
+"""
+Résolution groupée des prénoms des enfants (classement admin) : une requête
+$in par lot de parents, projetée sur userID et kids.*.name uniquement (sans
+les historiques `quizes` de chaque enfant), derrière un petit cache LRU + TTL.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import config
+from models.account import AccountData
+
+# kids : {index: {...}} -> {index: name}
+_NAMES_PROJECTION = {
+    "_id": 0,
+    "userID": 1,
+    "kids": {"$arrayToObject": {"$map": {
+        "input": {"$objectToArray": {"$ifNull": ["$kids", {}]}},
+        "as": "kid",
+        "in": {"k": "$$kid.k", "v": {"$ifNull": ["$$kid.v.name", None]}},
+    }}},
+}
+
+
+def load_kid_names(user_ids):
+    """{userID: {kidIndex: name}} lu directement en base (sans cache)."""
+    pipeline = [
+        {"$match": {"userID": {"$in": list(user_ids)}}},
+        {"$project": _NAMES_PROJECTION},
+    ]
+    return {doc["userID"]: doc.get("kids") or {} for doc in AccountData._get_collection().aggregate(pipeline)}
+
+
+class KidNameCache:
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # userID -> (expires_at, {kidIndex: name})
+        self._lock = threading.Lock()
+
+    def _get_cached(self, user_id, now):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, names = entry
+        if expires_at < now:
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return names
+
+    def _store(self, user_id, names, now):
+        self._entries[user_id] = (now + self.ttl, names)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get_many(self, user_ids):
+        """Retourne {userID: {kidIndex: name}} ; les comptes inconnus sont absents."""
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            for user_id in set(user_ids):
+                names = self._get_cached(user_id, now)
+                if names is None:
+                    missing.append(user_id)
+                else:
+                    found[user_id] = names
+
+        if missing:
+            loaded = load_kid_names(missing)
+            with self._lock:
+                for user_id, names in loaded.items():
+                    self._store(user_id, names, now)
+            found.update(loaded)
+
+        return found
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+
+kid_name_cache = KidNameCache(max_size=config.KID_NAMES_CACHE_SIZE, ttl=config.KID_NAMES_CACHE_TTL)
@@ -0,0 +1,255 @@
+# kid_rollups.py
+"""
+Agrégats quotidiens par enfant (kid_daily_stats), incrémentés ($inc) quand une
+tentative atteint un état terminal : complétée, échouée, abandonnée ou timeout.
+Les tableaux de bord parent lisent ces agrégats au lieu des tentatives brutes :
+les tentatives encore ouvertes n'y figurent pas (taux de complétion, abandons
+et temps passé sont calculés sur les tentatives terminales).
+Une mise à jour en échec est notée sur la tentative (rollup_pending) et
+rejouée par le balayage des timeouts (retry_pending_rollups).
+"""
+import logging
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from models.attempt import AttemptData
+from models.stats import KidDailyStats
+from services.quiz_cache import quiz_cache
+from services.leaderboard import record_scores
+from services.response_cache import dashboard_cache
+
+TERMINAL_QUERY = {"$or": [{"completed": 1}, {"failed": 1}, {"aborted": 1}, {"timeout": 1}]}
+BULK_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def _flag(field):
+    return {"$cond": [{"$eq": [f"${field}", 1]}, 1, 0]}
+
+
+def _contributions_pipeline(match):
+    """
+    Contributions des tentatives `match`, groupées par (enfant, jour, quiz).
+    La tentative précédente de l'enfant ($lookup, index userID/kidIndex/start_time)
+    sert au calcul de la persévérance.
+    """
+    return [
+        {"$match": match},
+        {"$project": {
+            "userID": 1, "kidIndex": 1, "quizID": 1, "subject": 1, "start_time": 1, "score": 1,
+            "duration": 1, "completed": 1, "failed": 1, "aborted": 1, "timeout": 1,
+        }},
+        {"$lookup": {
+            "from": AttemptData._get_collection_name(),
+            "let": {"user": "$userID", "kid": "$kidIndex", "start": "$start_time"},
+            "pipeline": [
+                {"$match": {"$expr": {"$and": [
+                    {"$eq": ["$userID", "$$user"]},
+                    {"$eq": ["$kidIndex", "$$kid"]},
+                    {"$lt": ["$start_time", "$$start"]},
+                ]}}},
+                {"$sort": {"start_time": -1}},
+                {"$limit": 1},
+                {"$project": {"quizID": 1, "score": {"$ifNull": ["$score", 0]}, "aborted": 1}},
+            ],
+            "as": "previous",
+        }},
+        {"$set": {"previous": {"$arrayElemAt": ["$previous", 0]}}},
+        {"$set": {"is_retry": {"$and": [
+            {"$eq": ["$previous.quizID", "$quizID"]},
+            {"$or": [{"$eq": ["$previous.aborted", 1]}, {"$lt": ["$previous.score", 0.5]}]},
+        ]}}},
+        {"$group": {
+            "_id": {
+                "userID": "$userID",
+                "kidIndex": "$kidIndex",
+                "day": {"$dateTrunc": {"date": "$start_time", "unit": "day"}},
+                "quizID": "$quizID",
+                "subject": "$subject",
+            },
+            "count": {"$sum": 1},
+            "completed": {"$sum": _flag("completed")},
+            "failed": {"$sum": _flag("failed")},
+            "aborted": {"$sum": _flag("aborted")},
+            "timeout": {"$sum": _flag("timeout")},
+            "score_sum": {"$sum": {"$ifNull": ["$score", 0]}},
+            "duration": {"$sum": {"$cond": [{"$ne": ["$timeout", 1]}, {"$ifNull": ["$duration", 0]}, 0]}},
+            "retries": {"$sum": {"$cond": ["$is_retry", 1, 0]}},
+            "improved": {"$sum": {"$cond": [
+                {"$and": ["$is_retry", {"$gte": [
+                    {"$subtract": [{"$ifNull": ["$score", 0]}, "$previous.score"]}, 0.2
+                ]}]}, 1, 0
+            ]}},
+        }},
+    ]
+
+
+def _rollup_ops(groups):
+    """
+    Transforme les groupes (enfant, jour, quiz) en UpdateOne $inc par (enfant, jour, matière).
+    Matière recopiée sur la tentative ; cache des quiz pour les tentatives non renseignées.
+    """
+    unstamped = {g["_id"]["quizID"] for g in groups if not g["_id"].get("subject")}
+    subjects = {quiz_id: meta.get("subject") for quiz_id, meta in quiz_cache.get_many(unstamped).items()}
+    for group in groups:
+        key = group["_id"]
+        quiz_id = str(key["quizID"])
+        subject = key.get("subject") or subjects.get(quiz_id) or "Inconnu"
+        inc = {
+            field: group[field]
+            for field in ("count", "completed", "failed", "aborted", "timeout",
+                          "score_sum", "duration", "retries", "improved")
+        }
+        for field in ("count", "completed", "failed", "score_sum"):
+            inc[f"quizzes.{quiz_id}.{field}"] = group[field]
+        yield UpdateOne(
+            {
+                "userID": key["userID"],
+                "kidIndex": key["kidIndex"],
+                "day": key["day"],
+                "subject": subject,
+            },
+            {"$inc": inc},
+            upsert=True,
+        )
+
+
+def _write(collection, groups):
+    collection.bulk_write(list(_rollup_ops(groups)), ordered=False)
+    # Après l'écriture seulement : une requête servie entre-temps ne doit pas
+    # mettre en cache des données anciennes sous la nouvelle génération
+    for kid in {(g["_id"]["userID"], g["_id"]["kidIndex"]) for g in groups}:
+        dashboard_cache.bump(*kid)
+    return len(groups)
+
+
+def _apply(match):
+    collection = KidDailyStats._get_collection()
+    cursor = AttemptData._get_collection().aggregate(_contributions_pipeline(match), allowDiskUse=True)
+    applied, batch = 0, []
+    for group in cursor:
+        batch.append(group)
+        if len(batch) >= BULK_SIZE:
+            applied += _write(collection, batch)
+            batch = []
+    if batch:
+        applied += _write(collection, batch)
+    return applied
+
+
+def _mark_pending(match, part):
+    """Note sur les tentatives `match` l'agrégat `part` à rejouer."""
+    try:
+        AttemptData._get_collection().update_many(match, {"$addToSet": {"rollup_pending": part}})
+    except Exception:
+        # Base indisponible : seules les reconstructions complètes resynchronisent
+        logger.exception("Impossible de marquer %s en attente (%s)", part, match)
+
+
+def record_terminal_attempts(match):
+    """À appeler une seule fois par tentative, juste après son passage à l'état terminal."""
+    try:
+        record_scores(match)
+    except Exception:
+        logger.exception("Erreur leaderboard")
+        _mark_pending(match, "leaderboard")
+
+    try:
+        return _apply(match)
+    except Exception:
+        # L'agrégat ne doit jamais faire échouer l'écriture de la tentative
+        logger.exception("Erreur kid_daily_stats")
+        _mark_pending(match, "kid_daily_stats")
+        return 0
+
+
+def retry_pending_rollups(limit=BULK_SIZE):
+    """
+    Rejoue les agrégats en échec (rollup_pending), au plus `limit` tentatives
+    par agrégat et par passage ; retourne le nombre de tentatives soldées.
+    """
+    attempts = AttemptData._get_collection()
+    retried = 0
+    for part, apply in (("leaderboard", record_scores), ("kid_daily_stats", _apply)):
+        ids = [a["_id"] for a in attempts.find({"rollup_pending": part}, {"_id": 1}).limit(limit)]
+        if not ids:
+            continue
+        try:
+            apply({"_id": {"$in": ids}})
+        except Exception:
+            logger.exception("Reprise %s en échec (%s tentatives)", part, len(ids))
+            continue
+        attempts.update_many({"_id": {"$in": ids}}, {"$pull": {"rollup_pending": part}})
+        retried += len(ids)
+    return retried
+
+
+def rebuild_kid_daily_stats():
+    """Reconstruit entièrement kid_daily_stats à partir des tentatives terminées."""
+    # Échecs en attente de reprise (rollup_pending) : couverts par la reconstruction
+    AttemptData._get_collection().update_many(
+        {"rollup_pending": "kid_daily_stats"}, {"$pull": {"rollup_pending": "kid_daily_stats"}}
+    )
+    KidDailyStats._get_collection().delete_many({})
+    KidDailyStats.ensure_indexes()
+    applied = _apply(TERMINAL_QUERY)
+    dashboard_cache.clear()
+    return applied
+
+
+def _rollups_query(userID, kidIndex, from_date, to_date):
+    query = {"userID": userID, "kidIndex": kidIndex}
+    if from_date and to_date:
+        start = datetime(from_date.year, from_date.month, from_date.day, tzinfo=from_date.tzinfo)
+        query["day"] = {"$gte": start, "$lte": to_date}
+    return query
+
+
+def load_kid_rollups(userID, kidIndex, from_date=None, to_date=None):
+    """Agrégats d'un enfant sur la période (jours entiers, UTC)."""
+    query = _rollups_query(userID, kidIndex, from_date, to_date)
+    return list(KidDailyStats._get_collection().find(query, {"_id": 0}))
+
+
+def load_kids_rollups(userID, kidIndexes, from_date=None, to_date=None):
+    """Agrégats de plusieurs enfants en une requête ($in) : {kidIndex: [agrégats]}."""
+    query = _rollups_query(userID, {"$in": list(kidIndexes)}, from_date, to_date)
+    rollups = {kidIndex: [] for kidIndex in kidIndexes}
+    for doc in KidDailyStats._get_collection().find(query, {"_id": 0}):
+        rollups[doc["kidIndex"]].append(doc)
+    return rollups
+
+
+def rollups_to_aggregate(rollups):
+    """
+    Convertit les agrégats en la structure {"totals", "days", "quizzes"}
+    attendue par metrics_from_aggregate.
+    """
+    if not rollups:
+        return {"totals": [], "days": [], "quizzes": []}
+
+    totals = {"total": 0, "completed": 0, "abandoned": 0, "time_spent": 0, "retries": 0, "improved": 0}
+    days, quizzes = {}, {}
+    for doc in rollups:
+        totals["total"] += doc.get("count", 0)
+        totals["completed"] += doc.get("completed", 0)
+        totals["abandoned"] += doc.get("aborted", 0)
+        totals["time_spent"] += doc.get("duration", 0)
+        totals["retries"] += doc.get("retries", 0)
+        totals["improved"] += doc.get("improved", 0)
+
+        day = doc["day"].strftime("%Y-%m-%d")
+        days[day] = max(days.get(day, 0), 1 if doc.get("completed", 0) else 0)
+
+        for quiz_id, stats in (doc.get("quizzes") or {}).items():
+            group = quizzes.setdefault(quiz_id, {"_id": quiz_id, "count": 0, "completed": 0, "failed": 0, "score_sum": 0})
+            for field in ("count", "completed", "failed", "score_sum"):
+                group[field] += stats.get(field, 0)
+
+    return {
+        "totals": [totals],
+        "days": [{"_id": day, "completed": completed} for day, completed in days.items()],
+        "quizzes": list(quizzes.values()),
+    }
@@ -0,0 +1,431 @@
+# leaderboard.py
+"""
+Classement des élèves tenu à jour de façon incrémentale : quand des tentatives
+atteignent un état terminal, les meilleurs scores des élèves sur leurs quiz
+sont relevés ($max, un bulk_write), puis les totaux de ces élèves sont
+recalculés depuis leurs meilleurs scores dans chaque périmètre (tous / niveau /
+matière / niveau + matière).
+
+Fenêtres : "all", la semaine calendaire (lundi, UTC) et le mois calendaire ;
+les semaines et mois révolus sont supprimés par prune_expired_windows.
+Les pages sont lues par clé (curseur ?after) sur l'index leaderboard_rank ;
+le rang et le nombre d'élèves viennent des totaux triés de chaque périmètre,
+gardés en cache (ScopeScoreCache) : une requête ne compte pas les élèves.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from models.attempt import AttemptData, STAMPED_QUERY, stamped_quiz
+from models.stats import LeaderboardEntry, StudentQuizBest
+import config
+from services.kid_names import kid_name_cache
+from services.pagination import after_filter, decode_cursor, encode_cursor
+from services.quiz_cache import quiz_cache
+
+ALL = "*"
+WINDOWS = ("week", "month", "all")
+BULK_SIZE = 1000
+
+_SCORE_FIELDS = {"userID": 1, "kidIndex": 1, "quizID": 1, "score": 1, "start_time": 1, "grade": 1, "subject": 1}
+RANK_SORT = [("total_score", -1), ("userID", 1), ("kidIndex", 1)]
+
+
+def _window_keys(start_time):
+    week_start = (start_time - timedelta(days=start_time.weekday())).date()
+    return ("all", f"week:{week_start.isoformat()}", f"month:{start_time:%Y-%m}")
+
+
+def resolve_window(window=None, period=None, now=None):
+    """
+    Clé de la fenêtre courante. `period` (jours, ancien paramètre) est ramené
+    à la plus petite fenêtre calendaire qui le couvre.
+    """
+    if not window:
+        period = int(period or 7)
+        window = "week" if period <= 7 else "month" if period <= 31 else "all"
+    if window not in WINDOWS:
+        raise ValueError(f"window must be one of {', '.join(WINDOWS)}")
+
+    keys = dict(zip(("all", "week", "month"), _window_keys(now or datetime.now(timezone.utc))))
+    return keys[window]
+
+
+def _scopes(grade, subject):
+    return {(ALL, ALL), (grade or ALL, ALL), (ALL, subject or ALL), (grade or ALL, subject or ALL)}
+
+
+def _best_ops(attempt, metas, current):
+    """$max du meilleur score de l'élève sur le quiz, pour chaque fenêtre courante."""
+    meta = stamped_quiz(attempt) or metas.get(str(attempt.get("quizID")))
+    start_time = attempt.get("start_time")
+    if not meta or not start_time:
+        # Quiz sans métadonnées : exclu du classement, comme auparavant
+        return
+
+    student = {"userID": attempt["userID"], "kidIndex": attempt["kidIndex"]}
+    for window in _window_keys(start_time):
+        # Semaine / mois révolus : jamais lus, ni réécrits (cf. prune_expired_windows)
+        if window not in current:
+            continue
+        yield (window, student["userID"], student["kidIndex"]), UpdateOne(
+            {"window": window, **student, "quizID": attempt["quizID"]},
+            {"$max": {"best": attempt.get("score") or 0},
+             "$set": {"grade": meta.get("grade"), "subject": meta.get("subject")}},
+            upsert=True,
+        )
+
+
+def _write_bests(bests, ops):
+    try:
+        bests.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        # Insertion concurrente du même (fenêtre, élève, quiz) : le document existe désormais
+        retry = [ops[error["index"]] for error in e.details["writeErrors"] if error["code"] == 11000]
+        if len(retry) < len(e.details["writeErrors"]):
+            raise
+        bests.bulk_write(retry, ordered=False)
+
+
+def _totals(bests, students):
+    """
+    Totaux des élèves `students` [(fenêtre, userID, kidIndex)] recalculés depuis
+    leurs meilleurs scores : {(fenêtre, niveau, matière, userID, kidIndex): [total, nombre de quiz]}.
+    """
+    totals = {}
+    groups = bests.aggregate([
+        {"$match": {"$or": [{"window": w, "userID": u, "kidIndex": k} for w, u, k in students]}},
+        {"$group": {
+            "_id": {"window": "$window", "userID": "$userID", "kidIndex": "$kidIndex",
+                    "grade": "$grade", "subject": "$subject"},
+            "total_score": {"$sum": "$best"},
+            "quiz_count": {"$sum": 1},
+        }},
+    ])
+    for group in groups:
+        key = group["_id"]
+        for grade, subject in _scopes(key.get("grade"), key.get("subject")):
+            total = totals.setdefault((key["window"], grade, subject, key["userID"], key["kidIndex"]), [0, 0])
+            total[0] += group["total_score"]
+            total[1] += group["quiz_count"]
+    return totals
+
+
+def _total_ops(totals):
+    """
+    Écriture ($set) des totaux `_totals` : idempotente, sans dérive si un passage
+    est interrompu entre l'écriture des meilleurs scores et celle des totaux.
+    """
+    return [
+        UpdateOne(
+            {"window": window, "grade": grade, "subject": subject, "userID": user_id, "kidIndex": kid_index},
+            {"$set": {"total_score": total_score, "quiz_count": quiz_count}},
+            upsert=True,
+        )
+        for (window, grade, subject, user_id, kid_index), (total_score, quiz_count) in totals.items()
+    ]
+
+
+def record_scores(match):
+    """Reporte dans le classement les tentatives terminales `match` (une seule fois chacune)."""
+    attempts = list(AttemptData._get_collection().find(match, _SCORE_FIELDS))
+    if not attempts:
+        return 0
+
+    # Métadonnées recopiées sur la tentative ; cache des quiz pour les autres
+    metas = quiz_cache.get_many({a.get("quizID") for a in attempts if stamped_quiz(a) is None})
+    current = set(_window_keys(datetime.now(timezone.utc)))
+    bests = StudentQuizBest._get_collection()
+    entries = LeaderboardEntry._get_collection()
+
+    students, ops = set(), []
+    for attempt in attempts:
+        for student, op in _best_ops(attempt, metas, current):
+            students.add(student)
+            ops.append(op)
+    for i in range(0, len(ops), BULK_SIZE):
+        _write_bests(bests, ops[i:i + BULK_SIZE])
+
+    students = list(students)
+    for i in range(0, len(students), BULK_SIZE):
+        total_ops = _total_ops(_totals(bests, students[i:i + BULK_SIZE]))
+        if total_ops:
+            entries.bulk_write(total_ops, ordered=False)
+    return len(attempts)
+
+
+def _refresh_totals(students):
+    """
+    Recalcule les totaux des élèves `students` [(fenêtre, userID, kidIndex)] et
+    supprime leurs lignes des périmètres qu'ils ne couvrent plus.
+    """
+    bests = StudentQuizBest._get_collection()
+    entries = LeaderboardEntry._get_collection()
+    for i in range(0, len(students), BULK_SIZE):
+        chunk = students[i:i + BULK_SIZE]
+        totals = _totals(bests, chunk)
+        stale = {"$or": [{"window": w, "userID": u, "kidIndex": k} for w, u, k in chunk]}
+        if totals:
+            stale["$nor"] = [
+                {"window": w, "grade": g, "subject": s, "userID": u, "kidIndex": k}
+                for w, g, s, u, k in totals
+            ]
+        entries.delete_many(stale)
+        if totals:
+            entries.bulk_write(_total_ops(totals), ordered=False)
+
+
+def restamp_quiz(quiz_id, fields):
+    """
+    Reporte le niveau / la matière modifiés d'un quiz (`fields` vide : quiz
+    supprimé, ses scores sortent du classement) sur les meilleurs scores, puis
+    recalcule les totaux des élèves concernés.
+    """
+    bests = StudentQuizBest._get_collection()
+    students = list({
+        (b["window"], b["userID"], b["kidIndex"])
+        for b in bests.find({"quizID": quiz_id}, {"_id": 0, "window": 1, "userID": 1, "kidIndex": 1})
+    })
+    if not students:
+        return 0
+
+    if fields:
+        bests.update_many({"quizID": quiz_id}, {"$set": {"grade": fields.get("grade"), "subject": fields.get("subject")}})
+    else:
+        bests.delete_many({"quizID": quiz_id})
+    _refresh_totals(students)
+    scope_scores.invalidate()
+    return len(students)
+
+
+def _expired_windows(now=None):
+    """Fenêtres semaine / mois antérieures aux fenêtres courantes (clés ISO : ordre lexicographique)."""
+    _, week, month = _window_keys(now or datetime.now(timezone.utc))
+    return {"$or": [
+        {"window": {"$gte": "week:", "$lt": week}},
+        {"window": {"$gte": "month:", "$lt": month}},
+    ]}
+
+
+def prune_expired_windows(now=None):
+    """Supprime les meilleurs scores et totaux des semaines et mois révolus ; retourne le nombre de totaux supprimés."""
+    query = _expired_windows(now)
+    StudentQuizBest._get_collection().delete_many(query)
+    return LeaderboardEntry._get_collection().delete_many(query).deleted_count
+
+
+def _window_expression(kind):
+    if kind == "all":
+        return {"$literal": "all"}
+    if kind == "week":
+        return {"$concat": ["week:", {"$dateToString": {"format": "%Y-%m-%d", "date": {
+            "$dateTrunc": {"date": "$start_time", "unit": "week", "startOfWeek": "monday"}
+        }}}]}
+    return {"$concat": ["month:", {"$dateToString": {"format": "%Y-%m", "date": "$start_time"}}]}
+
+
+def rebuild_leaderboard(match):
+    """Reconstruit entièrement le classement à partir des tentatives terminales `match`."""
+    bests = StudentQuizBest._get_collection()
+    entries = LeaderboardEntry._get_collection()
+    # Échecs en attente de reprise (rollup_pending) : couverts par la reconstruction
+    AttemptData._get_collection().update_many(
+        {"rollup_pending": "leaderboard"}, {"$pull": {"rollup_pending": "leaderboard"}}
+    )
+    bests.delete_many({})
+    entries.delete_many({})
+    StudentQuizBest.ensure_indexes()
+    LeaderboardEntry.ensure_indexes()
+
+    # Semaine / mois : seules les fenêtres courantes sont reconstruites
+    now = datetime.now(timezone.utc)
+    today = datetime(now.year, now.month, now.day, tzinfo=timezone.utc)
+    since = {"all": None, "week": today - timedelta(days=today.weekday()), "month": today.replace(day=1)}
+
+    attempts = AttemptData._get_collection()
+    for kind in WINDOWS:
+        start_time = {"$ne": None} if since[kind] is None else {"$gte": since[kind]}
+        attempts.aggregate([
+            # Niveau / matière recopiés sur les tentatives (sans $lookup) ;
+            # tentatives sans quiz connu (non renseignées) : exclues
+            {"$match": {"$and": [match, STAMPED_QUERY, {"start_time": start_time}]}},
+            {"$group": {
+                "_id": {"window": _window_expression(kind), "userID": "$userID",
+                        "kidIndex": "$kidIndex", "quizID": "$quizID"},
+                "best": {"$max": {"$ifNull": ["$score", 0]}},
+                "grade": {"$last": "$grade"},
+                "subject": {"$last": "$subject"},
+            }},
+            {"$project": {
+                "_id": 0, "window": "$_id.window", "userID": "$_id.userID", "kidIndex": "$_id.kidIndex",
+                "quizID": "$_id.quizID", "grade": 1, "subject": 1, "best": 1,
+            }},
+            {"$merge": {"into": bests.name, "on": ["window", "userID", "kidIndex", "quizID"],
+                        "whenMatched": "replace", "whenNotMatched": "insert"}},
+        ], allowDiskUse=True)
+
+    for by_grade, by_subject in ((False, False), (True, False), (False, True), (True, True)):
+        # Périmètres par niveau / matière : seulement les quiz qui en ont un (cf. _scopes)
+        scoped = {}
+        if by_grade:
+            scoped["grade"] = {"$nin": [None, ""]}
+        if by_subject:
+            scoped["subject"] = {"$nin": [None, ""]}
+        bests.aggregate([
+            {"$match": scoped},
+            {"$group": {
+                "_id": {
+                    "window": "$window",
+                    "grade": "$grade" if by_grade else {"$literal": ALL},
+                    "subject": "$subject" if by_subject else {"$literal": ALL},
+                    "userID": "$userID",
+                    "kidIndex": "$kidIndex",
+                },
+                "total_score": {"$sum": "$best"},
+                "quiz_count": {"$sum": 1},
+            }},
+            {"$project": {
+                "_id": 0, "window": "$_id.window", "grade": "$_id.grade", "subject": "$_id.subject",
+                "userID": "$_id.userID", "kidIndex": "$_id.kidIndex", "total_score": 1, "quiz_count": 1,
+            }},
+            {"$merge": {"into": entries.name, "on": ["window", "grade", "subject", "userID", "kidIndex"],
+                        "whenMatched": "replace", "whenNotMatched": "insert"}},
+        ], allowDiskUse=True)
+
+    scope_scores.invalidate()
+    return entries.count_documents({})
+
+
+def _row(entry, rank, names, quiz_scores):
+    user_id, kid_index = entry["userID"], entry["kidIndex"]
+    total, count = entry.get("total_score", 0), entry.get("quiz_count", 0)
+    return {
+        "rank": rank,
+        "userID": user_id,
+        "kidIndex": kid_index,
+        "kidName": names.get(user_id, {}).get(kid_index),
+        "total_score": round(total, 2),
+        "quiz_count": count,
+        "average_score": round(total / count, 2) if count else 0,
+        "quiz_scores": quiz_scores.get((user_id, kid_index), {}),
+    }
+
+
+class ScopeScoreCache:
+    """
+    Totaux triés de chaque périmètre (fenêtre, niveau, matière), en cache LRU + TTL :
+    le nombre d'élèves et le rang se lisent par recherche dichotomique au lieu
+    d'un count_documents par requête. Une lecture (index leaderboard_rank,
+    requête couverte) par périmètre et par TTL ; les rangs peuvent retarder
+    d'au plus TTL secondes sur les totaux.
+    """
+
+    def __init__(self, max_size=256, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (window, grade, subject) -> (expires_at, totaux croissants)
+        self._lock = threading.Lock()
+
+    def _load(self, scope):
+        cursor = LeaderboardEntry._get_collection().find(
+            scope, {"_id": 0, "total_score": 1}
+        ).sort(RANK_SORT).hint("leaderboard_rank")
+        return np.array([doc.get("total_score", 0) for doc in cursor], dtype=float)[::-1]
+
+    def scores(self, scope):
+        key = (scope["window"], scope["grade"], scope["subject"])
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= now:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        scores = self._load(scope)
+        with self._lock:
+            self._entries[key] = (now + self.ttl, scores)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return scores
+
+    def count(self, scope):
+        return len(self.scores(scope))
+
+    def rank(self, scope, total_score):
+        """Rang (ex æquo partagés) : nombre d'élèves strictement devant + 1."""
+        scores = self.scores(scope)
+        return len(scores) - int(np.searchsorted(scores, total_score, side="right")) + 1
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+
+scope_scores = ScopeScoreCache(max_size=config.LEADERBOARD_CACHE_SIZE, ttl=config.LEADERBOARD_CACHE_TTL)
+
+
+def _scope(window, grade, subject):
+    return {"window": window, "grade": grade or ALL, "subject": subject or ALL}
+
+
+def _quiz_scores(window, grade, subject, students):
+    """{(userID, kidIndex): {quizID: meilleur score}} pour les élèves de la page."""
+    if not students:
+        return {}
+    query = {"window": window, "$or": [{"userID": u, "kidIndex": k} for u, k in students]}
+    if grade:
+        query["grade"] = grade
+    if subject:
+        query["subject"] = subject
+    scores = {}
+    for doc in StudentQuizBest._get_collection().find(query, {"userID": 1, "kidIndex": 1, "quizID": 1, "best": 1}):
+        scores.setdefault((doc["userID"], doc["kidIndex"]), {})[str(doc["quizID"])] = doc["best"]
+    return scores
+
+
+def leaderboard_page(window, grade=None, subject=None, limit=100, after=None):
+    """
+    Page du classement après le curseur `after` (pagination par clé sur
+    total_score, userID, kidIndex : parcours de l'index leaderboard_rank à
+    partir de la page précédente, sans skip).
+    Retourne (lignes, nombre total d'élèves, curseur de la page suivante | None).
+    """
+    scope = _scope(window, grade, subject)
+    query = dict(scope)
+    if after:
+        query.update(after_filter(RANK_SORT, decode_cursor(after, len(RANK_SORT))))
+    page = list(
+        LeaderboardEntry._get_collection().find(query, {"_id": 0}).sort(RANK_SORT).limit(limit + 1)
+    )
+    total = scope_scores.count(scope)
+    has_more = len(page) > limit
+    page = page[:limit]
+    if not page:
+        return [], total, None
+
+    students = [(e["userID"], e["kidIndex"]) for e in page]
+    names = kid_name_cache.get_many(u for u, _ in students)
+    quiz_scores = _quiz_scores(window, grade, subject, students)
+
+    rows = [_row(entry, scope_scores.rank(scope, entry["total_score"]), names, quiz_scores) for entry in page]
+    last = page[-1]
+    next_after = encode_cursor([last["total_score"], last["userID"], last["kidIndex"]]) if has_more else None
+    return rows, total, next_after
+
+
+def student_rank(window, userID, kidIndex, grade=None, subject=None):
+    """Ligne du classement d'un élève (avec son rang), ou None s'il n'est pas classé."""
+    scope = _scope(window, grade, subject)
+    entry = LeaderboardEntry._get_collection().find_one({**scope, "userID": userID, "kidIndex": kidIndex}, {"_id": 0})
+    if not entry:
+        return None
+
+    names = kid_name_cache.get_many([userID])
+    quiz_scores = _quiz_scores(window, grade, subject, [(userID, kidIndex)])
+    return _row(entry, scope_scores.rank(scope, entry["total_score"]), names, quiz_scores)
@@ -0,0 +1,96 @@
+# pagination.py
+"""
+Pagination par clé (_id croissant) et streaming NDJSON pour les listes
+volumineuses : les documents sont lus au fil du curseur, sans jamais
+matérialiser toute la collection.
+
+Pour un tri composé (ex. classement), le curseur opaque encode les valeurs
+de la clé de tri du dernier document (encode_cursor / after_filter).
+"""
+import base64
+import json
+
+from bson import ObjectId
+from flask import Response, current_app, stream_with_context
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+MAX_PAGE_SIZE = 1000
+CURSOR_BATCH_SIZE = 500
+
+
+def parse_page_args(args):
+    """Lit ?after=<_id>&limit=<n> ; lève ValueError si invalides."""
+    after = args.get("after")
+    limit = args.get("limit")
+    if after is not None and not ObjectId.is_valid(after):
+        raise ValueError("Invalid after cursor")
+    if limit is not None:
+        if not limit.isdigit() or not 1 <= int(limit) <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        limit = int(limit)
+    return after, limit
+
+
+def wants_ndjson(request):
+    return request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def iter_documents(queryset, serialize, after=None, limit=None):
+    """Itère les documents par _id croissant à partir de `after` (exclu)."""
+    queryset = queryset.order_by("id").no_cache().batch_size(CURSOR_BATCH_SIZE)
+    if after:
+        queryset = queryset.filter(id__gt=ObjectId(after))
+    if limit:
+        queryset = queryset.limit(limit)
+    for doc in queryset:
+        yield serialize(doc)
+
+
+def keyset_page(queryset, serialize, after=None, limit=MAX_PAGE_SIZE):
+    """Une page : {"items": [...], "next_after": <_id du dernier> | None}."""
+    items = list(iter_documents(queryset, serialize, after, limit + 1))
+    has_more = len(items) > limit
+    items = items[:limit]
+    return {
+        "items": items,
+        "next_after": items[-1]["_id"] if has_more else None
+    }
+
+
+def encode_cursor(values):
+    """Curseur opaque des valeurs de la clé de tri du dernier document d'une page."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token, size):
+    """Valeurs d'un curseur encode_cursor ; lève ValueError s'il est invalide."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid after cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid after cursor")
+    return values
+
+
+def after_filter(sort, values):
+    """
+    Filtre des documents strictement après `values` dans l'ordre `sort`
+    [(champ, 1 | -1)] : chaque clause est un préfixe d'égalités suivi d'une
+    borne, parcourue sur l'index du tri (pas de skip).
+    """
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {name: value for (name, _), value in zip(sort[:i], values[:i])}
+        clause[field] = {"$gt" if direction > 0 else "$lt": values[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+def ndjson_response(items):
+    """Réponse streamée : un document JSON par ligne, envoyé dès qu'il est lu."""
+    def generate():
+        for item in items:
+            yield current_app.json.dumps(item) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
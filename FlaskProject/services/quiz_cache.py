@@ -0,0 +1,91 @@
+# quiz_cache.py
+"""
+Cache en mémoire (LRU + TTL) des métadonnées structurelles des quiz :
+nombre de questions, matière, chapitre, niveau (grade) et level.
+
+Le cache est local au processus : update_quiz / delete_quiz l'invalident,
+et le TTL borne l'obsolescence entre plusieurs workers.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from bson import ObjectId
+
+import config
+from models.quiz import Quiz
+
+_PROJECTION = {
+    "subject": 1,
+    "chapter": 1,
+    "grade": 1,
+    "level": 1,
+    "question_count": {"$size": {"$ifNull": ["$questions", []]}},
+}
+
+
+class QuizStructureCache:
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # quiz_id (str) -> (expires_at, meta)
+        self._lock = threading.Lock()
+
+    def _get_cached(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, meta = entry
+        if expires_at < now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return meta
+
+    def _store(self, key, meta, now):
+        self._entries[key] = (now + self.ttl, meta)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get_many(self, quiz_ids):
+        """Retourne {quiz_id (str): meta} ; les ids inconnus sont absents du résultat."""
+        keys = {str(q) for q in quiz_ids if q and ObjectId.is_valid(str(q))}
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            for key in keys:
+                meta = self._get_cached(key, now)
+                if meta is None:
+                    missing.append(key)
+                else:
+                    found[key] = meta
+
+        if missing:
+            pipeline = [
+                {"$match": {"_id": {"$in": [ObjectId(k) for k in missing]}}},
+                {"$project": _PROJECTION},
+            ]
+            loaded = {}
+            for doc in Quiz._get_collection().aggregate(pipeline):
+                key = str(doc.pop("_id"))
+                loaded[key] = doc
+            with self._lock:
+                for key, meta in loaded.items():
+                    self._store(key, meta, now)
+            found.update(loaded)
+
+        return found
+
+    def get(self, quiz_id):
+        return self.get_many([quiz_id]).get(str(quiz_id))
+
+    def invalidate(self, quiz_id=None):
+        with self._lock:
+            if quiz_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(quiz_id), None)
+
+
+quiz_cache = QuizStructureCache(max_size=config.QUIZ_CACHE_SIZE, ttl=config.QUIZ_CACHE_TTL)
@@ -0,0 +1,41 @@
+# quiz_fields.py
+"""
+Métadonnées des quiz (grade / subject / chapter) recopiées sur les tentatives,
+pour filtrer et grouper les statistiques sans relire les quiz. update_quiz /
+delete_quiz les tiennent à jour ; `flask backfill-attempt-quiz-fields`
+renseigne les tentatives existantes.
+"""
+from pymongo import UpdateMany
+
+from models.attempt import AttemptData, QUIZ_FIELDS
+from models.quiz import Quiz
+
+
+def _stamp_op(quiz_id, fields):
+    fields = {field: fields.get(field) for field in QUIZ_FIELDS}
+    # Seulement les tentatives dont une valeur diffère : idempotent et reprenable
+    return UpdateMany(
+        {"quizID": quiz_id, "$or": [{field: {"$ne": value}} for field, value in fields.items()]},
+        {"$set": fields},
+    )
+
+
+def stamp_quiz_fields(quiz_id, fields):
+    """Recopie grade / subject / chapter d'un quiz sur ses tentatives ; retourne le nombre modifié."""
+    return AttemptData._get_collection().bulk_write([_stamp_op(quiz_id, fields)]).modified_count
+
+
+def backfill_attempt_quiz_fields(batch_size=500):
+    """Recopie les métadonnées des quiz sur les tentatives existantes, quiz par quiz (curseur)."""
+    projection = {field: 1 for field in QUIZ_FIELDS}
+    quizzes = Quiz._get_collection().find({}, projection).batch_size(batch_size)
+    attempts = AttemptData._get_collection()
+    ops, stamped = [], 0
+    for quiz in quizzes:
+        ops.append(_stamp_op(quiz["_id"], quiz))
+        if len(ops) >= batch_size:
+            stamped += attempts.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        stamped += attempts.bulk_write(ops, ordered=False).modified_count
+    return stamped
@@ -0,0 +1,141 @@
+# quiz_metadata.py
+"""
+Résolution des métadonnées de quiz (subject, chapter, grade) : d'abord depuis
+la collection locale quizesdata (requête couverte par un index), puis via
+l'API distante getquizesmetadata pour les IDs inconnus localement.
+
+Client partagé de l'API distante :
+
+- une requests.Session avec pool de connexions et retries,
+- timeouts de connexion / lecture,
+- cache TTL par quiz ID : seuls les IDs absents du cache sont demandés,
+- les demandes concurrentes d'un même ID attendent la requête en cours.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import requests
+from bson import ObjectId
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+from models.quiz import Quiz
+
+METADATA_FIELDS = ("subject", "chapter", "grade")
+METADATA_INDEX = [("_id", 1), ("subject", 1), ("chapter", 1), ("grade", 1)]
+
+
+class QuizMetadataClient:
+    def __init__(self, url, ttl=300, max_size=10000, connect_timeout=2, read_timeout=5,
+                 retries=2, pool_size=10):
+        self.url = url
+        self.ttl = ttl
+        self.max_size = max_size
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=0.2, status_forcelist=(502, 503, 504),
+                      allowed_methods=None)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._cache = OrderedDict()   # quiz_id -> (expires_at, metadata)
+        self._inflight = {}           # quiz_id -> Future partagé
+        self._lock = threading.Lock()
+
+    def _fetch(self, quiz_ids):
+        try:
+            response = self.session.post(self.url, json={"quizIds": quiz_ids}, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json() or {}
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print("Erreur API:", e)
+            return {}
+
+    def get_many(self, quiz_ids):
+        """Retourne {quiz_id: metadata} pour les IDs connus (cache puis API)."""
+        now = time.monotonic()
+        found, waiting, to_fetch = {}, {}, []
+
+        with self._lock:
+            for quiz_id in {str(q) for q in quiz_ids if q}:
+                entry = self._cache.get(quiz_id)
+                if entry and entry[0] >= now:
+                    self._cache.move_to_end(quiz_id)
+                    found[quiz_id] = entry[1]
+                elif quiz_id in self._inflight:
+                    waiting[quiz_id] = self._inflight[quiz_id]
+                else:
+                    self._inflight[quiz_id] = waiting[quiz_id] = Future()
+                    to_fetch.append(quiz_id)
+
+        if to_fetch:
+            fetched = {}
+            try:
+                fetched = self._fetch(to_fetch)
+            finally:
+                expires_at = time.monotonic() + self.ttl
+                with self._lock:
+                    for quiz_id in to_fetch:
+                        metadata = fetched.get(quiz_id)
+                        if metadata is not None:
+                            self._cache[quiz_id] = (expires_at, metadata)
+                            self._cache.move_to_end(quiz_id)
+                        self._inflight.pop(quiz_id).set_result(metadata)
+                    while len(self._cache) > self.max_size:
+                        self._cache.popitem(last=False)
+
+        for quiz_id, future in waiting.items():
+            metadata = future.result()
+            if metadata is not None:
+                found[quiz_id] = metadata
+
+        return found
+
+    def invalidate(self, quiz_id=None):
+        with self._lock:
+            if quiz_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(str(quiz_id), None)
+
+
+quiz_metadata_client = QuizMetadataClient(
+    config.QUIZ_METADATA_URL,
+    ttl=config.QUIZ_METADATA_TTL,
+    connect_timeout=config.QUIZ_METADATA_CONNECT_TIMEOUT,
+    read_timeout=config.QUIZ_METADATA_READ_TIMEOUT,
+)
+
+
+def get_local_quizzes_metadata(quiz_ids):
+    """Métadonnées depuis quizesdata ; requête couverte par l'index METADATA_INDEX."""
+    object_ids = [ObjectId(q) for q in {str(q) for q in quiz_ids if q} if ObjectId.is_valid(q)]
+    if not object_ids:
+        return {}
+
+    cursor = Quiz._get_collection().find(
+        {"_id": {"$in": object_ids}},
+        {field: 1 for field in METADATA_FIELDS},
+    ).hint(METADATA_INDEX)
+
+    local = {}
+    for doc in cursor:
+        metadata = {field: doc[field] for field in METADATA_FIELDS if doc.get(field) is not None}
+        if metadata:
+            local[str(doc["_id"])] = metadata
+    return local
+
+
+def get_quizzes_metadata(quiz_ids):
+    """Résout localement puis interroge l'API distante pour les IDs restants."""
+    quiz_ids = {str(q) for q in quiz_ids if q}
+    metadata = get_local_quizzes_metadata(quiz_ids)
+    missing = quiz_ids - metadata.keys()
+    if missing:
+        metadata.update(quiz_metadata_client.get_many(missing))
+    return metadata
@@ -0,0 +1,106 @@
+# response_cache.py
+"""
+Cache des réponses du tableau de bord parent (metrics, messages-codes, scores)
+avec ETag / 304.
+
+Chaque enfant (userID, kidIndex) a un compteur de génération, incrémenté à
+chaque écriture qui modifie ses agrégats. L'ETag dépend de la génération, de
+la route et des paramètres (from, to, period) : une requête répétée avec
+If-None-Match reçoit 304 sans toucher MongoDB.
+
+Cache local au processus (l'application tourne en un seul processus) ; le
+TTL borne la durée de vie des entrées.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, make_response, request
+
+import config
+
+CACHED_ARGS = ("from", "to", "period", "sections", "granularity", "tz")
+
+
+class DashboardResponseCache:
+    def __init__(self, max_size=2048, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._boot_id = uuid.uuid4().hex  # invalide les ETags émis avant un redémarrage
+        self._generations = {}            # (userID, kidIndex) -> int
+        self._entries = OrderedDict()     # clé -> (expires_at, etag, body, status, mimetype)
+        self._lock = threading.Lock()
+
+    def bump(self, user_id, kid_index):
+        with self._lock:
+            kid = (str(user_id), str(kid_index))
+            self._generations[kid] = self._generations.get(kid, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._generations.clear()
+            self._entries.clear()
+            self._boot_id = uuid.uuid4().hex
+
+    def etag_for(self, user_id, kid_index, key):
+        with self._lock:
+            generation = self._generations.get((str(user_id), str(kid_index)), 0)
+        raw = f"{self._boot_id}:{generation}:{key}"
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def get(self, etag):
+        with self._lock:
+            entry = self._entries.get(etag)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[etag]
+                return None
+            self._entries.move_to_end(etag)
+            return entry[1:]
+
+    def store(self, etag, body, status, mimetype):
+        with self._lock:
+            self._entries[etag] = (time.monotonic() + self.ttl, body, status, mimetype)
+            self._entries.move_to_end(etag)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+dashboard_cache = DashboardResponseCache(
+    max_size=config.DASHBOARD_CACHE_SIZE, ttl=config.DASHBOARD_CACHE_TTL
+)
+
+
+def _with_etag(response, etag):
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def cached_kid_response(view):
+    """Décorateur des routes /user/<userId>/kid/<kidIndex>/... du tableau de bord."""
+    @wraps(view)
+    def wrapper(userId, kidIndex, *args, **kwargs):
+        key = request.path + "?" + "&".join(f"{a}={request.args.get(a, '')}" for a in CACHED_ARGS)
+        etag = dashboard_cache.etag_for(userId, kidIndex, key)
+
+        if etag in request.if_none_match:
+            return _with_etag(Response(status=304), etag)
+
+        cached = dashboard_cache.get(etag)
+        if cached:
+            body, status, mimetype = cached
+            return _with_etag(Response(body, status=status, mimetype=mimetype), etag)
+
+        response = make_response(view(userId, kidIndex, *args, **kwargs))
+        if response.status_code != 200:
+            return response
+
+        dashboard_cache.store(etag, response.get_data(), response.status_code, response.mimetype)
+        return _with_etag(response, etag)
+
+    return wrapper
@@ -0,0 +1,159 @@
+# score_recalculation.py
+"""
+Recalcul des scores par lots : lecture en flux (projection minimale, tri par
+_id), calcul vectorisé NumPy pour tout le lot, écriture bulk_write non ordonnée
+et point de reprise après chaque lot.
+"""
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from pymongo import UpdateOne
+
+from models.attempt import AttemptData
+from models.job import JobCheckpoint
+from services.kid_rollups import TERMINAL_QUERY, rebuild_kid_daily_stats
+from services.leaderboard import rebuild_leaderboard
+
+JOB_NAME = "recalculate_scores"
+
+_PROJECTION = {
+    "attempts_count": 1,
+    "__v": 1,
+    "answers.correct_answer": 1,
+    "answers.wrong_answer": 1,
+    "answers.hint_used": 1,
+    "answers.duration": 1,
+}
+
+
+def calculate_scores_batch(docs, min_time=0, max_time=90):
+    """
+    Version vectorisée de calculate_score pour une liste de documents bruts.
+    Retourne deux tableaux (score, success_rate) alignés sur docs.
+    """
+    n_docs = len(docs)
+    counts = np.fromiter((len(d.get("answers") or []) for d in docs), dtype=np.int64, count=n_docs)
+    owner = np.repeat(np.arange(n_docs), counts)
+
+    def column(field):
+        return np.fromiter(
+            ((ans.get(field) or 0) for d in docs for ans in (d.get("answers") or [])),
+            dtype=np.float64, count=int(counts.sum()),
+        )
+
+    correct = column("correct_answer")
+    wrong = column("wrong_answer")
+    hints = column("hint_used")
+    durations = column("duration")
+
+    speed = np.where(
+        durations < min_time, 1.0,
+        np.where(durations <= max_time, 1 - (durations - min_time) / (max_time - min_time), 0.0),
+    )
+    speed = np.clip(speed, 0, 1)
+    success = correct / (wrong + hints + 1)
+
+    sum_success = np.bincount(owner, weights=success, minlength=n_docs)
+    sum_speed = np.bincount(owner, weights=correct * speed, minlength=n_docs)
+
+    safe_counts = np.maximum(counts, 1)
+    avg_success = sum_success / safe_counts
+    avg_speed = sum_speed / safe_counts
+
+    attempts_count = np.fromiter(
+        ((d.get("attempts_count") or 1) for d in docs), dtype=np.float64, count=n_docs
+    )
+    attempts_count = np.maximum(attempts_count, 1)
+
+    score = 0.7 * avg_success + 0.2 * avg_speed + 0.1 * (1 / (1 + np.log(attempts_count)))
+    empty = counts == 0
+    score[empty] = 0.0
+    avg_success[empty] = 0.0
+    return score, avg_success
+
+
+def rebuild_score_rollups():
+    """
+    Resynchronise les agrégats construits à partir des scores : kid_daily_stats
+    (vide aussi le cache des tableaux de bord) et le classement. stats_snapshots
+    suit de lui-même (tentatives recalculées marquées par updatedAt).
+    """
+    rebuild_kid_daily_stats()
+    rebuild_leaderboard(TERMINAL_QUERY)
+
+
+def recalculate_scores(batch_size=500, resume=False, max_batches=None, rebuild=True):
+    """
+    Recalcule score/success_rate de toutes les tentatives.
+    resume=True repart du dernier _id enregistré ; max_batches borne le
+    travail d'un appel (le suivant reprend au checkpoint).
+    rebuild=True reconstruit les agrégats dépendant des scores une fois le
+    parcours terminé (sinon : `flask rebuild-kid-daily-stats` puis
+    `flask rebuild-leaderboard`).
+    """
+    collection = AttemptData._get_collection()
+    checkpoint = JobCheckpoint.objects(name=JOB_NAME).first()
+    if not checkpoint or not resume:
+        checkpoint = checkpoint or JobCheckpoint(name=JOB_NAME)
+        checkpoint.last_id = None
+        checkpoint.processed = 0
+
+    query = {"_id": {"$gt": checkpoint.last_id}} if checkpoint.last_id else {}
+    cursor = collection.find(query, _PROJECTION, sort=[("_id", 1)], batch_size=batch_size)
+
+    started = time.perf_counter()
+    processed = updated = batches = 0
+    done = True
+    batch = []
+
+    def flush(batch):
+        scores, rates = calculate_scores_batch(batch)
+        now = datetime.now(timezone.utc)
+        ops = [
+            UpdateOne(
+                {"_id": doc["_id"], "__v": doc.get("__v")},
+                # updatedAt : repris par le rafraîchissement incrémental de stats_snapshots
+                {"$set": {"score": float(score), "success_rate": float(rate), "updatedAt": now}},
+            )
+            for doc, score, rate in zip(batch, scores, rates)
+        ]
+        result = collection.bulk_write(ops, ordered=False)
+        checkpoint.last_id = batch[-1]["_id"]
+        checkpoint.processed += len(batch)
+        checkpoint.updatedAt = datetime.now(timezone.utc)
+        checkpoint.save()
+        return result.modified_count
+
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            updated += flush(batch)
+            processed += len(batch)
+            batches += 1
+            batch = []
+            if max_batches and batches >= max_batches:
+                # Terminé seulement s'il ne reste aucune tentative après ce lot
+                done = next(cursor, None) is None
+                break
+
+    if batch:
+        updated += flush(batch)
+        processed += len(batch)
+    cursor.close()
+
+    elapsed = time.perf_counter() - started
+    rebuilt = bool(done and rebuild and (updated or resume))
+    if rebuilt:
+        rebuild_score_rollups()
+
+    return {
+        "processed": processed,
+        "updated": updated,
+        "total_processed": checkpoint.processed,
+        "last_id": str(checkpoint.last_id) if checkpoint.last_id else None,
+        "done": done,
+        "elapsed_seconds": round(elapsed, 3),
+        "docs_per_second": round(processed / elapsed, 1) if elapsed > 0 else None,
+        "rollups_rebuilt": rebuilt,
+    }
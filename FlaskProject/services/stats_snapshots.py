@@ -0,0 +1,251 @@
+# stats_snapshots.py
+"""
+Statistiques admin matérialisées (stats_snapshots) : un document par
+(jour, niveau, matière, chapitre), recalculé par $merge pour les seuls jours
+dont des tentatives ont changé depuis le dernier passage.
+/api/stats/all lit ces documents au lieu de charger les tentatives.
+
+Les élèves distincts sont comptés exactement (union des listes `students`) ou,
+en mode "approx", en fusionnant les sketches HyperLogLog `students_hll` de
+chaque document : mémoire constante, erreur ≈ 1.6 % (cf. services/hll.py).
+"""
+import time
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+import config
+
+from models.attempt import AttemptData, QUIZ_FIELDS, STAMPED_QUERY
+from models.job import JobCheckpoint
+from models.stats import StatsSnapshot
+from services import job_lease
+from services.hll import HyperLogLog, STANDARD_ERROR
+
+CHECKPOINT = "stats_snapshots"
+SNAPSHOT_KEY = ("day", "grade", "subject", "chapter")
+DISTINCT_MODES = ("exact", "approx")
+
+
+def _day(value):
+    return datetime(value.year, value.month, value.day)
+
+
+def _snapshot_pipeline(day, refreshed_at, run_id):
+    """Agrège les tentatives du jour `day` et les fusionne dans stats_snapshots."""
+    return [
+        # Niveau / matière / chapitre recopiés sur la tentative (sans $lookup) ;
+        # tentatives sans quiz connu (non renseignées) : ignorées
+        {"$match": {"start_time": {"$gte": day, "$lt": day + timedelta(days=1)}, **STAMPED_QUERY}},
+        {"$project": {"userID": 1, "kidIndex": 1, "score": 1, "completed": 1, "duration": 1,
+                      **{field: 1 for field in QUIZ_FIELDS}}},
+        {"$group": {
+            "_id": {field: {"$ifNull": [f"${field}", "Inconnu"]} for field in QUIZ_FIELDS},
+            "attempts": {"$sum": 1},
+            "completed": {"$sum": {"$cond": [{"$eq": ["$completed", 1]}, 1, 0]}},
+            "score_sum": {"$sum": {"$ifNull": ["$score", 0]}},
+            "scored": {"$sum": {"$cond": [{"$ne": [{"$ifNull": ["$score", None]}, None]}, 1, 0]}},
+            "scored_sum": {"$sum": "$score"},
+            "duration_sum": {"$sum": "$duration"},
+            "students": {"$addToSet": {"userID": "$userID", "kidIndex": "$kidIndex"}},
+        }},
+        {"$project": {
+            "_id": 0,
+            "day": {"$literal": day},
+            "grade": "$_id.grade",
+            "subject": "$_id.subject",
+            "chapter": "$_id.chapter",
+            "attempts": 1,
+            "completed": 1,
+            "score_sum": 1,
+            "scored": 1,
+            "scored_sum": 1,
+            "duration_sum": 1,
+            "students": 1,
+            "refreshedAt": {"$literal": refreshed_at},
+            "runId": {"$literal": run_id},
+        }},
+        {"$merge": {
+            "into": StatsSnapshot._get_collection_name(),
+            "on": list(SNAPSHOT_KEY),
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }},
+    ]
+
+
+def _store_sketches(snapshots, day, run_id):
+    """Sketch HyperLogLog des élèves de chaque document du jour écrit par ce passage."""
+    ops = [
+        UpdateOne({"_id": doc["_id"]}, {"$set": {"students_hll": HyperLogLog.of_students(doc.get("students", [])).to_bytes()}})
+        for doc in snapshots.find({"day": day, "runId": run_id}, {"students": 1})
+    ]
+    if ops:
+        snapshots.bulk_write(ops, ordered=False)
+
+
+def _days(match):
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": {"$dateTrunc": {"date": "$start_time", "unit": "day"}}}},
+    ]
+    return sorted(g["_id"] for g in AttemptData._get_collection().aggregate(pipeline) if g["_id"])
+
+
+def refresh_stats_snapshots(full=False):
+    """
+    Recalcule les jours dont des tentatives ont été modifiées (updatedAt) depuis
+    le dernier passage ; `full` recalcule tous les jours (première exécution,
+    suppressions de tentatives, changement de niveau/matière d'un quiz,
+    après backfill-attempt-quiz-fields).
+
+    Un seul passage à la fois (bail dans jobcheckpoints) : si un autre processus
+    détient le bail, retourne {"skipped": True} sans rien écrire. Chaque passage
+    marque ses documents de son runId et ne supprime, pour un jour recalculé,
+    que les documents qui ne portent pas ce runId.
+    """
+    started = time.perf_counter()
+    run_id = str(ObjectId())
+    if not job_lease.acquire(CHECKPOINT, run_id, config.STATS_SNAPSHOT_LEASE):
+        return {"days": 0, "skipped": True, "elapsed_ms": round((time.perf_counter() - started) * 1000)}
+
+    try:
+        refreshed_at = datetime.now(timezone.utc)
+        snapshots = StatsSnapshot._get_collection()
+        checkpoint = JobCheckpoint.objects(name=CHECKPOINT).first()
+
+        if full or not checkpoint:
+            StatsSnapshot.ensure_indexes()
+            days = _days({})
+            snapshots.delete_many({"day": {"$nin": days}})
+        else:
+            days = _days({"updatedAt": {"$gte": checkpoint.updatedAt}})
+
+        attempts = AttemptData._get_collection()
+        done = 0
+        for day in days:
+            # Bail perdu (passage plus long que STATS_SNAPSHOT_LEASE) : un autre
+            # processus a repris le job, on s'arrête sans supprimer ses documents
+            if not job_lease.renew(CHECKPOINT, run_id, config.STATS_SNAPSHOT_LEASE):
+                break
+            attempts.aggregate(_snapshot_pipeline(day, refreshed_at, run_id))
+            # Groupes disparus depuis le passage précédent
+            snapshots.delete_many({"day": day, "runId": {"$ne": run_id}})
+            _store_sketches(snapshots, day, run_id)
+            done += 1
+
+        if done == len(days):
+            JobCheckpoint.objects(name=CHECKPOINT).update_one(
+                upsert=True, set__updatedAt=refreshed_at, inc__processed=done
+            )
+    finally:
+        job_lease.release(CHECKPOINT, run_id)
+    return {"days": done, "skipped": False, "elapsed_ms": round((time.perf_counter() - started) * 1000)}
+
+
+def _students(doc):
+    return {
+        (s["userID"], s["kidIndex"])
+        for s in doc.get("students", [])
+        if s.get("userID") is not None and s.get("kidIndex") is not None
+    }
+
+
+class _ExactStudents:
+    def __init__(self):
+        self.students = set()
+
+    def add(self, doc):
+        self.students |= _students(doc)
+
+    def count(self):
+        return len(self.students)
+
+
+class _ApproxStudents:
+    def __init__(self):
+        self.sketch = HyperLogLog()
+
+    def add(self, doc):
+        registers = doc.get("students_hll")
+        if registers is None:
+            # Snapshot antérieur aux sketches : reconstruit depuis sa liste d'élèves
+            stored = StatsSnapshot._get_collection().find_one({"_id": doc["_id"]}, {"students": 1}) or {}
+            registers = HyperLogLog.of_students(stored.get("students", [])).to_bytes()
+        self.sketch.merge(registers)
+
+    def count(self):
+        return self.sketch.count()
+
+
+def read_stats(grade=None, subject=None, period=7, distinct="exact"):
+    """
+    overview / grade_stats / summary_by_grade des `period` derniers jours,
+    à partir des snapshots (jours entiers). `distinct` : "exact" ou "approx"
+    (HyperLogLog) pour total_students.
+    """
+    if distinct not in DISTINCT_MODES:
+        raise ValueError(f"distinct must be one of {', '.join(DISTINCT_MODES)}")
+    counter = _ApproxStudents if distinct == "approx" else _ExactStudents
+    # Mode approx : les listes d'élèves ne sont pas lues
+    projection = {"students": 0} if distinct == "approx" else {"_id": 0, "students_hll": 0}
+
+    since = datetime.now() - timedelta(days=period)
+    query = {"day": {"$gte": _day(since)}}
+    if grade:
+        query["grade"] = grade
+    if subject:
+        query["subject"] = subject
+
+    students = counter()
+    total_attempts = scored = 0
+    scored_sum = duration_sum = 0
+    grade_stats, summary, students_by_grade = {}, {}, {}
+
+    for doc in StatsSnapshot._get_collection().find(query, projection):
+        students.add(doc)
+        total_attempts += doc["attempts"]
+        scored += doc["scored"]
+        scored_sum += doc["scored_sum"]
+        duration_sum += doc["duration_sum"]
+
+        subject_entry = grade_stats.setdefault(doc["grade"], {}).setdefault(doc["subject"], {
+            "count": 0, "completed": 0, "total_score": 0.0, "average_score": 0.0, "chapters": {}
+        })
+        chapter_entry = subject_entry["chapters"].setdefault(doc["chapter"], {
+            "count": 0, "completed": 0, "total_score": 0.0, "average_score": 0.0
+        })
+        for entry in (subject_entry, chapter_entry):
+            entry["count"] += doc["attempts"]
+            entry["completed"] += doc["completed"]
+            entry["total_score"] += doc["score_sum"]
+
+        grade_summary = summary.setdefault(doc["grade"], {"total_students": 0, "total_attempts": 0})
+        grade_summary["total_attempts"] += doc["attempts"]
+        students_by_grade.setdefault(doc["grade"], counter()).add(doc)
+
+    for subjects in grade_stats.values():
+        for subject_entry in subjects.values():
+            for entry in (subject_entry, *subject_entry["chapters"].values()):
+                if entry["count"] > 0:
+                    entry["average_score"] = round(entry["total_score"] / entry["count"], 4)
+                del entry["total_score"]
+
+    for grade_key, grade_students in students_by_grade.items():
+        summary[grade_key]["total_students"] = grade_students.count()
+
+    total_students = students.count()
+    checkpoint = JobCheckpoint.objects(name=CHECKPOINT).only("updatedAt").first()
+    return {
+        "overview": {
+            "total_students": total_students,
+            "total_attempts": total_attempts,
+            "average_score": scored_sum / scored if scored else 0,
+            "average_time": duration_sum / total_students if total_students else 0,
+        },
+        "grade_stats": grade_stats,
+        "summary_by_grade": summary,
+        "distinct": {"mode": distinct, "standard_error": round(STANDARD_ERROR, 4) if distinct == "approx" else 0},
+        "refreshedAt": checkpoint.updatedAt.isoformat() if checkpoint else None,
+    }
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+# Les modules de l'application s'importent depuis la racine de FlaskProject
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_addoption(parser):
+    parser.addoption("--runslow", action="store_true", default=False, help="exécute aussi les tests marqués slow")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--runslow") or os.getenv("RUN_SLOW_TESTS") == "1":
+        return
+    skip_slow = pytest.mark.skip(reason="test long : --runslow ou RUN_SLOW_TESTS=1 pour l'exécuter")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip_slow)
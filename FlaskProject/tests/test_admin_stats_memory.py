@@ -0,0 +1,53 @@
+# test_admin_stats_memory.py
+"""
+AdminStatsAccumulator en flux : le pic mémoire ne dépend pas du nombre de
+tentatives consommées (tentatives synthétiques, élèves tous distincts,
+comptage HyperLogLog). La variante à 1M tentatives (~70 s) est marquée slow.
+"""
+import tracemalloc
+
+import pytest
+from bson import ObjectId
+
+from controllers.statsAdminController import AdminStatsAccumulator
+
+# Sketches HyperLogLog (4 Ko par niveau + global), groupes niveau/matière/chapitre
+# et allocations des threads de fond (pymongo) pendant la mesure
+PEAK_LIMIT = 1024 * 1024
+
+QUIZZES = [
+    (ObjectId(), {"grade": str(grade), "subject": subject, "chapter": f"chapter-{chapter}"})
+    for grade in range(1, 7) for subject in ("math", "arabic", "french", "science") for chapter in range(5)
+]
+
+
+def synthetic_pairs(count):
+    """(tentative, métadonnées du quiz) générées une par une, jamais conservées."""
+    for i in range(count):
+        quiz_id, quiz = QUIZZES[i % len(QUIZZES)]
+        attempt = {
+            "userID": f"user-{i}",
+            "kidIndex": str(i % 3),
+            "quizID": quiz_id,
+            "score": (i % 101) / 100,
+            "duration": i % 600,
+            "completed": i % 2,
+        }
+        yield attempt, quiz
+
+
+@pytest.mark.parametrize("attempts", [50_000, pytest.param(1_000_000, marks=pytest.mark.slow)])
+def test_streaming_attempts_has_bounded_peak_memory(attempts):
+    tracemalloc.start()
+    try:
+        result = AdminStatsAccumulator("approx").consume(synthetic_pairs(attempts)).result()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert result["overview"]["total_attempts"] == attempts
+    # Élèves distincts estimés à l'erreur HyperLogLog près (≈ 1.6 %, marge 5 %)
+    assert abs(result["overview"]["total_students"] - attempts) < 0.05 * attempts
+    assert sum(summary["total_attempts"] for summary in result["summary_by_grade"].values()) == attempts
+    # Une liste de 1M tentatives occuperait plusieurs centaines de Mo
+    assert peak < PEAK_LIMIT, f"pic mémoire {peak / 1024:.0f} Ko pour {attempts} tentatives"
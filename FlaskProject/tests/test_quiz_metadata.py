@@ -0,0 +1,201 @@
+# test_quiz_metadata.py
+"""
+QuizMetadataClient contre un serveur HTTP local qui imite getquizesmetadata :
+cache par ID, coalescence des demandes concurrentes, session poolée,
+retries et timeouts.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from services.quiz_metadata import QuizMetadataClient
+
+
+class StubMetadataServer:
+    """Répond {quizId: {"subject": ...}} pour les IDs demandés, sauf ceux de `unknown`."""
+
+    def __init__(self):
+        self.requests = []          # quizIds de chaque appel
+        self.client_ports = []      # port source de chaque appel (réutilisation des connexions)
+        self.active = 0
+        self.max_active = 0
+        self.delay = 0
+        self.statuses = []          # statuts HTTP à renvoyer avant de répondre normalement
+        self.unknown = set()
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub._lock:
+                    stub.requests.append(body["quizIds"])
+                    stub.client_ports.append(self.client_address[1])
+                    stub.active += 1
+                    stub.max_active = max(stub.max_active, stub.active)
+                    status = stub.statuses.pop(0) if stub.statuses else 200
+                try:
+                    time.sleep(stub.delay)
+                    payload = {} if status != 200 else {
+                        quiz_id: {"subject": f"subject-{quiz_id}", "chapter": "c", "grade": "1"}
+                        for quiz_id in body["quizIds"] if quiz_id not in stub.unknown
+                    }
+                    data = json.dumps(payload).encode()
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with stub._lock:
+                        stub.active -= 1
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/getquizesmetadata"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = StubMetadataServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def client(stub):
+    metadata_client = QuizMetadataClient(stub.url, ttl=60, connect_timeout=1, read_timeout=2)
+    yield metadata_client
+    metadata_client.session.close()
+
+
+def test_only_missing_ids_are_requested(stub, client):
+    first = client.get_many(["a", "b"])
+    second = client.get_many(["a", "b", "c"])
+
+    assert set(first) == {"a", "b"}
+    assert set(second) == {"a", "b", "c"}
+    assert second["c"]["subject"] == "subject-c"
+    assert sorted(stub.requests[0]) == ["a", "b"]
+    assert stub.requests[1:] == [["c"]]
+
+
+def test_cached_ids_do_not_call_the_remote(stub, client):
+    client.get_many(["a"])
+    client.get_many(["a"])
+    client.get_many({"a"})
+
+    assert len(stub.requests) == 1
+
+
+def test_expired_entries_are_fetched_again(stub):
+    client = QuizMetadataClient(stub.url, ttl=0)
+    client.get_many(["a"])
+    time.sleep(0.01)
+    client.get_many(["a"])
+
+    assert stub.requests == [["a"], ["a"]]
+
+
+def test_unknown_ids_are_absent_and_not_cached(stub, client):
+    stub.unknown = {"ghost"}
+
+    assert client.get_many(["ghost", "a"]).keys() == {"a"}
+    assert client.get_many(["ghost"]) == {}
+    assert stub.requests[-1] == ["ghost"]
+
+
+def test_invalidate_forces_a_new_request(stub, client):
+    client.get_many(["a", "b"])
+    client.invalidate("a")
+    client.get_many(["a", "b"])
+
+    assert stub.requests[1:] == [["a"]]
+
+
+def test_concurrent_misses_are_coalesced(stub, client):
+    stub.delay = 0.3
+    threads_count = 8
+    barrier = threading.Barrier(threads_count)
+    results = [None] * threads_count
+
+    def worker(position):
+        barrier.wait()
+        results[position] = client.get_many(["shared"])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(threads_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert stub.requests == [["shared"]]
+    assert all(result == {"shared": results[0]["shared"]} for result in results)
+
+
+def test_partially_overlapping_requests_only_fetch_new_ids(stub, client):
+    stub.delay = 0.3
+    started = threading.Event()
+    first = {}
+
+    def slow_call():
+        started.set()
+        first.update(client.get_many(["a", "b"]))
+
+    thread = threading.Thread(target=slow_call)
+    thread.start()
+    started.wait()
+    time.sleep(0.05)
+    second = client.get_many(["b", "c"])
+    thread.join(timeout=5)
+
+    assert set(first) == {"a", "b"} and set(second) == {"b", "c"}
+    assert sorted(map(sorted, stub.requests)) == [["a", "b"], ["c"]]
+
+
+def test_pooled_session_reuses_one_connection(stub, client):
+    for quiz_id in ("a", "b", "c", "d"):
+        client.get_many([quiz_id])
+
+    assert len(stub.requests) == 4
+    assert len(set(stub.client_ports)) == 1
+
+
+def test_transient_errors_are_retried(stub, client):
+    stub.statuses = [503, 502]
+
+    assert client.get_many(["a"]).keys() == {"a"}
+    assert len(stub.requests) == 3
+
+
+def test_remote_failure_returns_empty_without_caching(stub, client):
+    stub.statuses = [500]
+
+    assert client.get_many(["a"]) == {}
+    assert client.get_many(["a"]).keys() == {"a"}
+
+
+def test_read_timeout_is_enforced(stub):
+    stub.delay = 1
+    client = QuizMetadataClient(stub.url, connect_timeout=1, read_timeout=0.2, retries=0)
+
+    started = time.monotonic()
+    assert client.get_many(["a"]) == {}
+    assert time.monotonic() - started < 0.9